@@ -3,6 +3,10 @@ import secrets
 import hashlib
 import hmac
 import base64
+import binascii
+import threading
+import weakref
+from collections import deque
 
 # Configuration loaded from environment (Mental Model: 12-Factor App)
 # Default provided for local dev/learning ONLY.
@@ -30,6 +34,103 @@ def generate_secure_token(n_bytes: int = 32) -> str:
     
     return token
 
+# ---------------------------------------------------------
+# TOKEN POOL (bulk pre-generation)
+# ---------------------------------------------------------
+# generate_secure_token() is one getrandom() syscall plus one encode per token.
+# At login peaks that is thousands of tiny syscalls a second. A TokenPool pulls
+# one large block from the same OS CSPRNG, encodes it in a single pass and hands
+# tokens out from a queue; a background thread refills it below a watermark.
+#
+# Every token is popped exactly once, so no random bytes are ever handed out
+# twice. After fork() the child starts with an EMPTY pool: otherwise parent and
+# child would both hold (and issue) the same pre-generated tokens.
+
+_URLSAFE = bytes.maketrans(b"+/", b"-_")
+_POOLS = weakref.WeakSet()
+
+
+class TokenPool:
+    def __init__(self, n_bytes: int = 32, batch: int = 1024, low_water: int = 256):
+        """
+        Args:
+            n_bytes:   random bytes per token, as in generate_secure_token().
+            batch:     tokens made per CSPRNG read (one read of n_bytes * batch).
+            low_water: wake the refill thread when fewer tokens than this are left.
+        """
+        self.n_bytes = n_bytes
+        self.batch = batch
+        self.low_water = low_water
+        self._reset()
+        _POOLS.add(self)
+
+    def _reset(self) -> None:
+        self._ready = deque()
+        self._lock = threading.Lock()  # one refill at a time
+        self._wake = threading.Event()
+        self._thread = None
+        self.refills = 0
+
+    def _refill(self) -> None:
+        with self._lock:
+            # 1. ONE READ from the OS CSPRNG for the whole batch
+            n = self.n_bytes
+            block = os.urandom(n * self.batch)
+            # 2. ENCODE in one pass: per-slice base64 joined by newlines, then a
+            #    single translate to the URL-safe alphabet that also drops padding
+            chunks = [binascii.b2a_base64(block[i:i + n]) for i in range(0, len(block), n)]
+            encoded = b"".join(chunks)
+            self._ready.extend(encoded.translate(_URLSAFE, b"=").decode("ascii").split())
+            self.refills += 1
+
+    def _refill_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while len(self._ready) < self.low_water + self.batch:
+                self._refill()
+
+    def get(self) -> str:
+        """A fresh URL-safe token; same format and entropy as generate_secure_token()."""
+        while True:
+            try:
+                token = self._ready.popleft()  # atomic: no two threads get the same token
+                break
+            except IndexError:
+                self._refill()  # empty (first use, or a burst beat the refill thread)
+        if len(self._ready) < self.low_water:
+            if self._thread is None:
+                with self._lock:
+                    if self._thread is None:
+                        self._thread = threading.Thread(
+                            target=self._refill_loop, name="token-pool", daemon=True
+                        )
+                        self._thread.start()
+            self._wake.set()
+        return token
+
+
+def _empty_pools_in_child() -> None:
+    for pool in list(_POOLS):
+        pool._reset()  # drop the parent's tokens (and its lock and thread state)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_empty_pools_in_child)
+
+_DEFAULT_POOLS = {}
+
+
+def pooled_token(n_bytes: int = 32) -> str:
+    """
+    Drop-in for generate_secure_token() on hot paths (session ids, CSRF tokens),
+    served from a shared TokenPool per token size.
+    """
+    pool = _DEFAULT_POOLS.get(n_bytes)
+    if pool is None:
+        pool = _DEFAULT_POOLS.setdefault(n_bytes, TokenPool(n_bytes))
+    return pool.get()
+
 def hash_data(data: str) -> str:
     """
     Creates a SHA-256 fingerprint of the data. 
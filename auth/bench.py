@@ -0,0 +1,556 @@
+# bench.py (benchmarks for the auth concepts)
+# Usage:
+#   python bench.py authflow --sizes 1000,100000,1000000,10000000
+#   python bench.py sessions --backends memory,sqlite,kv --workers 1,2,4
+#   python bench.py tokens --revoked 0,10000,100000
+#   python bench.py passwords --concurrency 1,4,16 --flood 64
+#   python bench.py throttle --attempts 200000 --attacker-ips 100000
+#   python bench.py cookies
+#   python bench.py token-pool --threads 1,4,16 --tokens 200000
+#   python bench.py serve --modes dev,threads,prefork --concurrency 1,8,32 --slow-clients 1
+import argparse, http.client, multiprocessing, os, random, socket, statistics, subprocess, sys
+import tempfile, threading, time
+from typing import Any, Dict, List
+
+
+def _print_rows(rows: List[Dict[str, Any]]) -> None:
+    cols = list(rows[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+
+def _pct(sorted_ms: List[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    return round(sorted_ms[min(len(sorted_ms) - 1, int(p * len(sorted_ms)))], 2)
+
+
+def _ns_per_op(fn, args: List[Any], repeats: int = 5) -> float:
+    """Median over `repeats` runs of fn(a) for every a in args, in ns per call."""
+    runs = []
+    for _ in range(repeats):
+        t0 = time.perf_counter_ns()
+        for a in args:
+            fn(a)
+        runs.append((time.perf_counter_ns() - t0) / len(args))
+    return statistics.median(runs)
+
+
+# -------- authflow: System.authenticate_request vs number of users --------
+def bench_authflow(args: argparse.Namespace) -> None:
+    from concept_01_auth_flow import System
+    from passwords import PasswordHasher
+    from throttle import LoginThrottle
+
+    # authenticate_request never hashes; a near-free KDF keeps registering millions quick
+    cheap = PasswordHasher(params={"ln": 1, "r": 1, "p": 1}, workers=0)
+    rows = []
+    for n in (int(x) for x in args.sizes.split(",")):
+        # All sample logins come from one IP: lift the limit
+        app = System(hasher=cheap, throttle=LoginThrottle(ip_limit=10**9))
+        names = [f"user{i}" for i in range(n)]
+        for name in names:
+            app.register(name, "pw")
+        sample = random.sample(names, min(args.sessions, n))
+        tokens = [app.login(name, "pw", "10.0.0.1") for name in sample]
+        rows.append({
+            "users": n,
+            "sessions": len(tokens),
+            "authenticate_ns": round(_ns_per_op(app.authenticate_request, tokens)),
+        })
+    _print_rows(rows)
+
+
+# -------- sessions: concept_02 request throughput per session backend x workers --------
+def _sessions_worker(start_at: float, duration: float, profiles_per_login: int, out) -> None:
+    import concept_02_raw_cookies as app  # imported after fork: SESSIONS is per worker
+
+    headers_out = []
+
+    def start_response(status, headers):
+        headers_out[:] = [status, headers]
+
+    time.sleep(max(0.0, start_at - time.time()))
+    n = errors = 0
+    cookie = ""
+    while time.time() < start_at + duration:
+        if n % (profiles_per_login + 1) == 0:
+            app.application({"PATH_INFO": "/login"}, start_response)
+            set_cookie = dict(headers_out[1])["Set-Cookie"]
+            cookie = set_cookie.split(";", 1)[0]
+        else:
+            app.application({"PATH_INFO": "/profile", "HTTP_COOKIE": cookie}, start_response)
+            errors += headers_out[0] != "200 OK"
+        n += 1
+    out.put((n, errors, app.SESSIONS.stats()))
+
+
+def bench_sessions(args: argparse.Namespace) -> None:
+    ctx = multiprocessing.get_context("fork")
+    tmp = tempfile.mkdtemp(prefix="sessions-bench-")
+    kv = None
+    rows = []
+    try:
+        for backend in args.backends.split(","):
+            os.environ["SESSION_BACKEND"] = backend
+            os.environ["SESSION_NEAR_CACHE_TTL"] = str(args.near_cache_ttl)
+            if backend == "kv" and kv is None:
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", 0))
+                    port = s.getsockname()[1]
+                here = os.path.dirname(os.path.abspath(__file__))
+                kv = subprocess.Popen(
+                    [sys.executable, os.path.join(here, "kv_server.py"), str(port)],
+                    stdout=subprocess.DEVNULL,
+                )
+                os.environ["SESSION_KV_ADDR"] = f"127.0.0.1:{port}"
+                for _ in range(50):  # wait for it to listen
+                    try:
+                        socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+            for workers in (int(w) for w in args.workers.split(",")):
+                os.environ["SESSION_DB"] = os.path.join(tmp, f"{workers}.db")
+                out = ctx.Queue()
+                start_at = time.time() + 0.5
+                procs = [
+                    ctx.Process(target=_sessions_worker,
+                                args=(start_at, args.duration, args.profiles_per_login, out))
+                    for _ in range(workers)
+                ]
+                for p in procs:
+                    p.start()
+                results = [out.get() for _ in procs]
+                for p in procs:
+                    p.join()
+                total = sum(n for n, _, _ in results)
+                near = results[0][2].get("near_cache", {})
+                rows.append({
+                    "backend": backend,
+                    "workers": workers,
+                    "req_per_s": round(total / args.duration),
+                    "per_worker": round(total / args.duration / workers),
+                    "errors": sum(e for _, e, _ in results),
+                    "near_hit_ratio": near.get("hit_ratio", "-"),
+                })
+    finally:
+        if kv is not None:
+            kv.terminate()
+    _print_rows(rows)
+
+
+# -------- tokens: signed-token verify vs a session store lookup, single core --------
+def bench_tokens(args: argparse.Namespace) -> None:
+    from session_store import SessionStore
+    from signed_tokens import TokenSigner
+
+    rows = []
+    store = SessionStore()
+    sids = [f"sid{i}" for i in range(args.tokens)]
+    for i, sid in enumerate(sids):
+        store.create(sid, f"user{i}", f"user{i}")
+    ns = _ns_per_op(store.get, sids)
+    rows.append({"mode": "session store get", "revoked": "-", "ns_per_op": round(ns),
+                 "ops_per_s_per_core": round(1e9 / ns)})
+
+    for revoked in (int(x) for x in args.revoked.split(",")):
+        signer = TokenSigner(ttl=3600)
+        for i in range(revoked):
+            signer.revoke(signer.issue(f"gone{i}"))
+        tokens = [signer.issue(f"user{i}") for i in range(args.tokens)]
+        ns = _ns_per_op(signer.verify, tokens)
+        assert all(signer.verify(t) for t in tokens[:100])
+        rows.append({"mode": "signed token verify", "revoked": revoked, "ns_per_op": round(ns),
+                     "ops_per_s_per_core": round(1e9 / ns)})
+    _print_rows(rows)
+
+
+# -------- passwords: KDF throughput inline vs process pool, and shedding under a flood --------
+def bench_passwords(args: argparse.Namespace) -> None:
+    from passwords import HasherOverloaded, PasswordHasher
+
+    def drive(hasher, stored, concurrency):
+        lat, shed = [], [0]
+        lock = threading.Lock()
+        stop_at = time.time() + args.duration
+
+        def user():
+            while time.time() < stop_at:
+                t0 = time.perf_counter()
+                try:
+                    hasher.verify("correct horse", stored)
+                except HasherOverloaded:
+                    with lock:
+                        shed[0] += 1
+                    time.sleep(0.001)
+                    continue
+                with lock:
+                    lat.append((time.perf_counter() - t0) * 1000)
+
+        threads = [threading.Thread(target=user) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        lat.sort()
+        return lat, shed[0]
+
+    def row(mode, concurrency, max_queue, lat, shed):
+        return {
+            "mode": mode,
+            "concurrency": concurrency,
+            "max_queue": max_queue,
+            "verifies_per_s": round(len(lat) / args.duration, 1),
+            "p50_ms": _pct(lat, 0.5),
+            "p99_ms": _pct(lat, 0.99),
+            "shed": shed,
+        }
+
+    params = {"ln": args.ln, "r": 8, "p": 1}
+    rows = []
+    for mode, workers in (("inline", 0), ("pool", os.cpu_count() or 1)):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            hasher = PasswordHasher(params=params, workers=workers, max_queue=1_000_000)
+            stored = hasher.hash("correct horse")  # also starts the pool
+            rows.append(row(mode, concurrency, "-", *drive(hasher, stored, concurrency)))
+    # Flood: far more concurrent logins than cores, against the default bounded queue
+    hasher = PasswordHasher(params=params)
+    stored = hasher.hash("correct horse")
+    rows.append(row("pool", args.flood, hasher.max_queue, *drive(hasher, stored, args.flood)))
+    _print_rows(rows)
+
+
+# -------- throttle: credential stuffing against System.login --------
+def bench_throttle(args: argparse.Namespace) -> None:
+    from concept_01_auth_flow import System
+    from passwords import PasswordHasher
+    from throttle import LoginThrottle, LoginThrottled, SketchWindowCounter, WindowCounter
+
+    rows = []
+    rng = random.Random(7)
+    usernames = [f"user{i}" for i in range(1000)]
+    # Attackers rotate through their IPs and a leaked list of usernames; legit users
+    # log in from their own address and browser (device cookie) now and then
+    attempts = []
+    for i in range(args.attempts):
+        if i % 50 == 0:
+            name = rng.choice(usernames)
+            attempts.append((name, "pw", f"legit-{name}", f"device-{name}"))
+        else:
+            ip = f"10.{rng.randrange(args.attacker_ips)}"
+            attempts.append((rng.choice(usernames), "guess", ip, None))
+
+    for label, ip_counter in (
+        ("exact ip counters", WindowCounter(60, max_keys=10**9)),
+        ("sketch ip counters", SketchWindowCounter(60)),
+    ):
+        hasher = PasswordHasher(params={"ln": 1, "r": 1, "p": 1}, workers=0)
+        throttle = LoginThrottle(ip_limit=args.ip_limit, ip_counter=ip_counter)
+        app = System(hasher=hasher, throttle=throttle)
+        for name in usernames:
+            app.register(name, "pw")
+            app.login(name, "pw", f"legit-{name}", f"device-{name}")  # logged in before
+        hashed_before = hasher.hashed
+        legit_ok = legit = 0
+        t0 = time.perf_counter()
+        for name, password, ip, device in attempts:
+            try:
+                ok = app.login(name, password, ip, device) is not None
+            except LoginThrottled:
+                ok = False
+            if ip.startswith("legit"):
+                legit += 1
+                legit_ok += ok
+        elapsed = time.perf_counter() - t0
+        st = throttle.stats()
+        rows.append({
+            "counters": label,
+            "attempts": len(attempts),
+            "hashes_run": hasher.hashed - hashed_before,
+            "hashes_saved": st["hashes_saved"],
+            "legit_success": f"{legit_ok}/{legit}",
+            "check_us": round(elapsed / len(attempts) * 1e6, 2),
+            "counter_mem_kb": st["memory_bytes"] // 1024,
+        })
+    _print_rows(rows)
+
+
+# -------- cookies: fast cookie path vs SimpleCookie, speed only --------
+# Equivalence with SimpleCookie is fuzzed in shared/tests/test_cookies.py (pytest)
+def bench_cookies(args: argparse.Namespace) -> None:
+    from http.cookies import SimpleCookie
+
+    from cookies import get_cookie, set_cookie_builder
+
+    def simple_get(header):
+        c = SimpleCookie(header)
+        return c["session_id"].value if "session_id" in c else None
+
+    def simple_set(value):
+        c = SimpleCookie()
+        c["session_id"] = value
+        m = c["session_id"]
+        m["path"], m["httponly"], m["samesite"], m["max-age"] = "/", True, "Lax", 360
+        return m.OutputString()
+
+    fast_set = set_cookie_builder("session_id", "/", 360, httponly=True, secure=False)
+    sid = "Ab3_x-Yz" * 3
+    typical = f"_ga=GA1.2.3.4; theme=dark; session_id={sid}; lang=en; _gid=GA1.2.9; tz=UTC"
+    headers = {
+        "session only": f"session_id={sid}",
+        "typical (6)": typical,
+        "many (30)": "; ".join([f"c{i}=v{i}xxxxxxxx" for i in range(29)] + [f"session_id={sid}"]),
+    }
+    rows = []
+    for label, header in headers.items():
+        slow = _ns_per_op(simple_get, [header] * 2000)
+        fast = _ns_per_op(lambda h: get_cookie(h, "session_id"), [header] * 2000)
+        rows.append({"op": f"parse: {label}", "simplecookie_ns": round(slow),
+                     "fast_ns": round(fast), "speedup": f"{slow / fast:.1f}x"})
+    slow = _ns_per_op(simple_set, [sid] * 2000)
+    fast = _ns_per_op(fast_set, [sid] * 2000)
+    rows.append({"op": "build Set-Cookie", "simplecookie_ns": round(slow),
+                 "fast_ns": round(fast), "speedup": f"{slow / fast:.1f}x"})
+    _print_rows(rows)
+
+
+# -------- token-pool: pooled token generation vs generate_secure_token, per thread count --------
+def _tokens_per_sec(make, threads: int, total: int) -> float:
+    per_thread = total // threads
+    start = threading.Barrier(threads + 1)
+
+    def work():
+        start.wait()
+        for _ in range(per_thread):
+            make()
+
+    ts = [threading.Thread(target=work) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in ts:
+        t.join()
+    return per_thread * threads / (time.perf_counter() - t0)
+
+
+def bench_token_pool(args: argparse.Namespace) -> None:
+    import auth_utils
+
+    rows = []
+    for n_bytes in (32, 16):
+        for threads in [int(x) for x in args.threads.split(",")]:
+            direct = _tokens_per_sec(
+                lambda: auth_utils.generate_secure_token(n_bytes), threads, args.tokens
+            )
+            pool = auth_utils.TokenPool(n_bytes)
+            pooled = _tokens_per_sec(pool.get, threads, args.tokens)
+            rows.append({
+                "n_bytes": n_bytes, "threads": threads,
+                "direct_tok_s": round(direct), "pooled_tok_s": round(pooled),
+                "speedup": f"{pooled / direct:.1f}x",
+                # one getrandom() per token vs one per batch
+                "csprng_reads": f"{args.tokens} -> {pool.refills}",
+            })
+    _print_rows(rows)
+
+    # Never reuse bytes: tokens from every thread, and from a forked child, are all distinct
+    pool = auth_utils.TokenPool(32)
+    seen: List[str] = []
+    ts = [threading.Thread(target=lambda: seen.extend(pool.get() for _ in range(20_000)))
+          for _ in range(4)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        with os.fdopen(w, "w") as f:
+            f.write("\n".join(pool.get() for _ in range(5_000)))
+        os._exit(0)
+    os.close(w)
+    with os.fdopen(r) as f:
+        child = f.read().split("\n")
+    os.waitpid(pid, 0)
+    seen += [pool.get() for _ in range(5_000)]
+    dupes = len(seen) + len(child) - len(set(seen) | set(child))
+    print(f"uniqueness: {len(seen)} parent + {len(child)} child tokens, {dupes} duplicates")
+    if dupes:
+        sys.exit(1)
+
+
+# -------- serve: HTTP load test of concept_02 per serve mode x concurrency --------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_listening(port: int, timeout: float = 10.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+def _request(port: int, path: str, cookie: str = "", timeout: float = 10.0):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path, headers={"Cookie": cookie} if cookie else {})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status, resp.getheader("Set-Cookie") or ""
+    finally:
+        conn.close()
+
+
+def _virtual_user(port, stop_at, profiles, lat, errors, lock) -> None:
+    """login -> N x profile -> logout, recording latency per endpoint."""
+    while time.time() < stop_at:
+        cookie = ""
+        for path in ["/login"] + ["/profile"] * profiles + ["/logout"]:
+            t0 = time.perf_counter()
+            try:
+                status, set_cookie = _request(port, path, cookie)
+                ok = status == 200
+            except OSError:
+                ok, set_cookie = False, ""
+            ms = (time.perf_counter() - t0) * 1000
+            with lock:
+                lat[path].append(ms)
+                errors[path] += not ok
+            if path == "/login":
+                cookie = set_cookie.split(";", 1)[0]
+
+
+def bench_serve(args: argparse.Namespace) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.mkdtemp(prefix="serve-bench-")
+    rows = []
+    for mode in args.modes.split(","):
+        port = _free_port()
+        env = {
+            **os.environ,
+            "SERVE_MODE": mode,
+            "SERVE_PORT": str(port),
+            "SERVE_THREADS": str(args.threads),
+            "SERVE_WORKERS": str(args.workers),
+            "SERVE_ACCESS_LOG": "0",
+            # Prefork workers are separate processes: sessions must live in a shared store
+            "SESSION_BACKEND": "sqlite" if mode == "prefork" else "memory",
+            "SESSION_DB": os.path.join(tmp, f"{mode}.db"),
+        }
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(here, "concept_02_raw_cookies.py")],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        stalled = []
+        try:
+            _wait_listening(port)
+            # Clients that connect, send half a request and go quiet
+            for _ in range(args.slow_clients):
+                s = socket.create_connection(("127.0.0.1", port))
+                s.sendall(b"GET /profile HTTP/1.0\r\n")
+                stalled.append(s)
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                lat = {p: [] for p in ("/login", "/profile", "/logout")}
+                errors = dict.fromkeys(lat, 0)
+                lock = threading.Lock()
+                stop_at = time.time() + args.duration
+                users = [
+                    threading.Thread(
+                        target=_virtual_user,
+                        args=(port, stop_at, args.profiles, lat, errors, lock),
+                        daemon=True,
+                    )
+                    for _ in range(concurrency)
+                ]
+                for u in users:
+                    u.start()
+                for u in users:
+                    u.join(args.duration + 15)
+                for path, ms in lat.items():
+                    ms.sort()
+                    rows.append({
+                        "mode": mode,
+                        "concurrency": concurrency,
+                        "endpoint": path,
+                        "rps": round(len(ms) / args.duration),
+                        "p50_ms": _pct(ms, 0.50),
+                        "p95_ms": _pct(ms, 0.95),
+                        "p99_ms": _pct(ms, 0.99),
+                        "errors": errors[path],
+                    })
+        finally:
+            for s in stalled:
+                s.close()
+            server.terminate()
+            server.wait(15)
+    _print_rows(rows)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmarks for the auth concepts")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("authflow", help="authenticate_request latency vs user count")
+    s.add_argument("--sizes", default="1000,100000,1000000")
+    s.add_argument("--sessions", type=int, default=10_000)
+    s.set_defaults(fn=bench_authflow)
+
+    s = sub.add_parser("sessions", help="concept_02 throughput per session backend x workers")
+    s.add_argument("--backends", default="memory,sqlite,kv")
+    s.add_argument("--workers", default="1,2,4")
+    s.add_argument("--duration", type=float, default=3.0)
+    s.add_argument("--profiles-per-login", type=int, default=20)
+    s.add_argument("--near-cache-ttl", type=float, default=1.0)
+    s.set_defaults(fn=bench_sessions)
+
+    s = sub.add_parser("tokens", help="signed-token verify ops/sec vs session store lookups")
+    s.add_argument("--tokens", type=int, default=10_000)
+    s.add_argument("--revoked", default="0,10000,100000")
+    s.set_defaults(fn=bench_tokens)
+
+    s = sub.add_parser("passwords", help="KDF verify throughput, pool vs inline, load shedding")
+    s.add_argument("--concurrency", default="1,4,16")
+    s.add_argument("--flood", type=int, default=64, help="concurrent logins for the shed test")
+    s.add_argument("--duration", type=float, default=3.0)
+    s.add_argument("--ln", type=int, default=14, help="scrypt cost: n = 2**ln")
+    s.set_defaults(fn=bench_passwords)
+
+    s = sub.add_parser("throttle", help="credential stuffing: hashes saved, legit logins kept")
+    s.add_argument("--attempts", type=int, default=200_000)
+    s.add_argument("--attacker-ips", type=int, default=100_000)
+    s.add_argument("--ip-limit", type=int, default=30)
+    s.set_defaults(fn=bench_throttle)
+
+    s = sub.add_parser("cookies", help="fast cookie parse/build vs SimpleCookie")
+    s.set_defaults(fn=bench_cookies)
+
+    s = sub.add_parser("token-pool", help="pooled vs per-call secure tokens, tokens/sec x threads")
+    s.add_argument("--threads", default="1,4,16")
+    s.add_argument("--tokens", type=int, default=200_000)
+    s.set_defaults(fn=bench_token_pool)
+
+    s = sub.add_parser("serve", help="HTTP load test of concept_02 (rps, latency percentiles)")
+    s.add_argument("--modes", default="threads,prefork")
+    s.add_argument("--concurrency", default="1,8,32")
+    s.add_argument("--duration", type=float, default=5.0)
+    s.add_argument("--profiles", type=int, default=5, help="/profile calls per login")
+    s.add_argument("--threads", type=int, default=16)
+    s.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    s.add_argument("--slow-clients", type=int, default=0,
+                   help="connections that send half a request and stall")
+    s.set_defaults(fn=bench_serve)
+
+    args = p.parse_args()
+    args.fn(args)
@@ -1,57 +1,98 @@
+import os
 import secrets
 from dataclasses import dataclass, field
 from typing import Dict, Optional
 
+from auth_utils import pooled_token
+from passwords import HasherOverloaded, PasswordHasher, hasher_from_env
+from session_store import SessionStore
+from signed_tokens import TokenSigner
+from throttle import LoginThrottle, throttle_from_env
+
 # ---------------------------------------------------------
 # 1. DATA MODELS (First Principles)
 # ---------------------------------------------------------
-@dataclass
+# slots=True: no per-instance __dict__, so millions of records stay compact
+@dataclass(slots=True)
 class User:
     id: str
     username: str
-    # In reality, we NEVER store plain passwords. 
-    # This is for flow demonstration only.
-    password_hash_simulation: str 
+    # KDF output with its parameters ("scrypt$ln=14,r=8,p=1$salt$hash"), never the password
+    password_hash: str
 
-@dataclass
+@dataclass(slots=True)
 class Session:
     user_id: str
     ip_address: str
-    is_active: bool = True
 
 # ---------------------------------------------------------
 # 2. MOCK DATABASE & SESSION STORE
 # ---------------------------------------------------------
 class System:
-    def __init__(self):
+    def __init__(
+        self,
+        stateless: Optional[bool] = None,
+        hasher: Optional[PasswordHasher] = None,
+        throttle: Optional[LoginThrottle] = None,
+    ):
+        # Hashing runs in a bounded process pool (PASSWORD_HASH_* env)
+        self.hasher = hasher or hasher_from_env()
+        # Per-IP / per-username attempt limits (LOGIN_* env)
+        self.throttle = throttle or throttle_from_env()
         self.users: Dict[str, User] = {}
+        # Secondary index: sessions reference users by id, so resolve them in O(1)
+        self.users_by_id: Dict[str, User] = {}
         # The "Stateful" part. Server memory holds active sessions.
-        self.sessions: Dict[str, Session] = {} 
+        # Bounded: idle/absolute TTL, LRU cap and a per-user cap keep login churn from leaking.
+        self.sessions = SessionStore()
+        # Stateless alternative (SESSION_MODE=stateless): the "session id" is a signed
+        # token, so authenticating needs no store lookup, only an HMAC check.
+        if stateless is None:
+            stateless = os.environ.get("SESSION_MODE", "stateful") == "stateless"
+        self.tokens = TokenSigner() if stateless else None
 
     def register(self, username, password):
         # ID generation using secure randomness
         user_id = secrets.token_hex(8)
-        self.users[username] = User(user_id, username, password)
+        user = User(user_id, username, self.hasher.hash(password))
+        self.users[username] = user
+        self.users_by_id[user_id] = user
         return user_id
 
-    def login(self, username, password, ip_address) -> Optional[str]:
+    def login(self, username, password, ip_address, device=None) -> Optional[str]:
         """
         Returns session_id if successful, None otherwise.
+        `device` is the browser's device cookie (a random value the app sets once and
+        keeps): after a success, that device skips the username limit.
+        Raises throttle.LoginThrottled when this IP or username is over its limit (429),
+        passwords.HasherOverloaded when the hashing queue is full (503).
         """
+        # Throttle first: a rejected attempt must never reach the KDF
+        reserved = self.throttle.check(username, ip_address, device)
         user = self.users.get(username)
         
         # AuthN Check
-        if not user:
-            return None
-        
-        # In real code: verify_hash(password, user.password_hash)
-        if user.password_hash_simulation != password: 
+        # Unknown usernames still pay for a hash, so timing does not reveal who exists
+        try:
+            ok, new_hash = self.hasher.verify(password, user.password_hash if user else None)
+        except HasherOverloaded:
+            self.throttle.refund(username, reserved)  # not a failed guess: nothing was checked
+            raise
+        if not ok:
+            self.throttle.record_failure(username, device)
             return None
+        self.throttle.record_success(username, device)
+        if new_hash:
+            # Stored with older KDF parameters: upgrade it now that we have the password
+            user.password_hash = new_hash
             
+        if self.tokens is not None:
+            return self.tokens.issue(user.id)
+
         # Create Session (Stateful)
         # We issue a random reference ID, not the user ID directly.
-        session_id = secrets.token_urlsafe(32)
-        self.sessions[session_id] = Session(user.id, ip_address)
+        session_id = pooled_token(32)
+        self.sessions.create(session_id, user.id, Session(user.id, ip_address))
         
         return session_id
 
@@ -59,24 +100,24 @@ class System:
         """
         Resolves a session ID back to a user.
         """
-        if session_id not in self.sessions:
-            return None
-            
-        session = self.sessions[session_id]
-        
-        if not session.is_active:
+        if self.tokens is not None:
+            claims = self.tokens.verify(session_id)
+            return self.users_by_id.get(claims.user_id) if claims else None
+
+        session = self.sessions.get(session_id)
+        if session is None:
             return None
-            
+
         # Find the user object from the session reference
-        # In a DB, this would be: SELECT * FROM users WHERE id = session.user_id
-        for user in self.users.values():
-            if user.id == session.user_id:
-                return user
-        return None
+        # In a DB, this would be: SELECT * FROM users WHERE id = session.user_id (PK lookup)
+        return self.users_by_id.get(session.user_id)
     
     def force_logout(self, sessionid) -> None:
-        if sessionid in self.sessions:
-            self.sessions[sessionid].is_active = False
+        if self.tokens is not None:
+            self.tokens.revoke(sessionid)
+            return
+        # Purge instead of flagging inactive: dead sessions would otherwise accumulate forever
+        self.sessions.delete(sessionid)
 # ---------------------------------------------------------
 # 3. EXECUTION
 # ---------------------------------------------------------
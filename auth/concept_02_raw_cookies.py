@@ -1,15 +1,52 @@
-from wsgiref.simple_server import make_server
-import http.cookies
-import secrets
+import os
 import time
 
+from auth_utils import pooled_token
+from cookies import get_cookie, set_cookie_builder
 from load_dotenv import load_dotenv
+from serve import serve_from_env
+from session_backends import store_from_env
+from signed_tokens import signer_from_env
 
 # ---------------------------------------------------------
 # 1. IN-MEMORY SESSION STORE (Global State)
 # ---------------------------------------------------------
 # Mapping: session_id -> username
-SESSIONS = {}
+# SESSION_BACKEND picks memory (this process only), sqlite or kv (shared by workers).
+# Server-side lifetime matches the cookie's max-age, so entries die with the cookie
+# instead of piling up until the process restarts.
+SESSION_MAX_AGE = 360
+# Every login here is the same mock user, so no per-user cap.
+SESSIONS = store_from_env(sliding_ttl=None, absolute_ttl=SESSION_MAX_AGE, max_per_user=None)
+
+# SESSION_MODE=stateless: the cookie is a signed token and SESSIONS is never touched.
+# Logout revokes the token in the revocation list: this process's own, or the one in
+# REVOCATION_DB shared by every worker. Prefork workers need the shared one.
+TOKENS = (
+    signer_from_env(ttl=SESSION_MAX_AGE)
+    if os.environ.get("SESSION_MODE", "stateful") == "stateless"
+    else None
+)
+if TOKENS is not None and not TOKENS.revocations.shared:
+    if os.environ.get("SERVE_MODE") == "prefork":
+        raise RuntimeError(
+            "SESSION_MODE=stateless with SERVE_MODE=prefork needs REVOCATION_DB:"
+            " otherwise a logout only revokes the token in one worker"
+        )
+
+# SECURITY FLAGS (The Core Lesson), rendered once instead of per response
+SESSION_COOKIE = set_cookie_builder(
+    'session_id',
+    path='/',
+    httponly=True,   # No JS access
+    secure=False,    # False only for localhost dev!
+    samesite='Lax',
+    max_age=SESSION_MAX_AGE,  # Expires in 360 seconds
+)
+# Tell browser to delete cookie (Max-Age=0)
+CLEAR_SESSION_COOKIE = set_cookie_builder(
+    'session_id', path='/', max_age=0, httponly=False, secure=False, samesite=None
+)('')
 
 def application(environ, start_response):
     """
@@ -24,13 +61,9 @@ def application(environ, start_response):
     # The browser sends: "Cookie: session_id=abc; theme=dark"
     cookie_header = environ.get('HTTP_COOKIE', '')
     
-    # Python's stdlib cookie parser
-    server_cookies = http.cookies.SimpleCookie(cookie_header)
-    
-    # Check if user sent a session_id
-    session_id = None
-    if 'session_id' in server_cookies:
-        session_id = server_cookies['session_id'].value
+    # Only session_id matters: pull it out directly instead of building a
+    # SimpleCookie (same result for well-formed headers, see cookies.py)
+    session_id = get_cookie(cookie_header, 'session_id')
 
     # -----------------------------------------------------
     # 3. AUTH LOGIC (Mock)
@@ -43,31 +76,28 @@ def application(environ, start_response):
     if path == '/login':
         # SIMULATE: User passed correct credentials.
         # Generate new session
-        new_sess_id = secrets.token_urlsafe(16)
-        SESSIONS[new_sess_id] = "user_alice"
-        
-        # CONSTRUCT SECURE COOKIE
-        # We use SimpleCookie to format the string correctly
-        c = http.cookies.SimpleCookie()
-        c['session_id'] = new_sess_id
-        
-        # SECURITY FLAGS (The Core Lesson)
-        c['session_id']['path'] = '/'
-        c['session_id']['httponly'] = True  # No JS access
-        c['session_id']['secure'] = False   # False only for localhost dev!
-        c['session_id']['samesite'] = 'Lax' 
-        c['session_id']['max-age'] = 360     # Expires in 360 seconds
+        if TOKENS is not None:
+            new_sess_id = TOKENS.issue("user_alice")
+        else:
+            new_sess_id = pooled_token(16)
+            SESSIONS.create(new_sess_id, "user_alice", "user_alice")
         
         # Add Set-Cookie header
-        # output string looks like: "Set-Cookie: session_id=...; HttpOnly; ..."
-        headers.append(('Set-Cookie', c['session_id'].OutputString()))
+        # output string looks like: "session_id=...; HttpOnly; Max-Age=360; ..."
+        headers.append(('Set-Cookie', SESSION_COOKIE(new_sess_id)))
         
         response_body = f"Logged in! Session created: {new_sess_id}"
 
     elif path in {"/profile", "/favicon.ico"}:
         # AUTHZ CHECK
-        if session_id and session_id in SESSIONS:
-            user = SESSIONS[session_id]
+        if not session_id:
+            user = None
+        elif TOKENS is not None:
+            claims = TOKENS.verify(session_id)
+            user = claims.user_id if claims else None
+        else:
+            user = SESSIONS.get(session_id)
+        if user:
             response_body = f"Welcome back, {user}. This is private data."
         else:
             status = '401 Unauthorized'
@@ -75,16 +105,13 @@ def application(environ, start_response):
             
     elif path == '/logout':
         # INVALIDATE SESSION
-        if session_id in SESSIONS:
-            del SESSIONS[session_id]
+        if session_id and TOKENS is not None:
+            TOKENS.revoke(session_id)
+        elif session_id:
+            SESSIONS.delete(session_id)
             
         # Tell browser to delete cookie (Max-Age=0)
-        c = http.cookies.SimpleCookie()
-        c['session_id'] = ''
-        c['session_id']['path'] = '/'
-        c['session_id']['max-age'] = 0
-        
-        headers.append(('Set-Cookie', c['session_id'].OutputString()))
+        headers.append(('Set-Cookie', CLEAR_SESSION_COOKIE))
         response_body = "Logged out."
 
     else:
@@ -95,7 +122,5 @@ def application(environ, start_response):
 
 if __name__ == '__main__':
     load_dotenv()
-    print("Serving on http://localhost:8000...")
-    # Single-threaded dev server
-    with make_server('', 8000, application) as httpd:
-        httpd.serve_forever()
\ No newline at end of file
+    # SERVE_MODE=threads (default) | prefork | dev (the single-threaded wsgiref server)
+    serve_from_env(application)
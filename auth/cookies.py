@@ -0,0 +1,132 @@
+import re
+from typing import Callable, Optional
+
+# ---------------------------------------------------------
+# FAST COOKIE PATH
+# ---------------------------------------------------------
+# http.cookies.SimpleCookie runs a verbose regex over the whole header and builds
+# a Morsel per cookie, just so we can read one value; emitting goes through the
+# same machinery. The auth app only ever needs one cookie in and one header out.
+#
+# get_cookie() follows the RFC 6265 cookie-string grammar
+#   cookie-string = cookie-pair *( ";" SP cookie-pair )
+# and for such headers returns exactly what SimpleCookie would (including: the
+# last duplicate wins, surrounding DQUOTEs are stripped, and a ";" inside a
+# quoted value does not end it, so `a="x;session_id=evil"` cannot smuggle in a
+# session id). Headers without a DQUOTE take a right-to-left rfind() fast path;
+# any DQUOTE sends the header through a left-to-right parse. It deliberately differs
+# on malformed headers, where SimpleCookie throws away EVERY cookie: a nameless
+# cookie ("session_id=x; foo"), a reserved name first ("path=/; session_id=x")
+# or a stray space ("a b; session_id=x"). There, we still find session_id.
+#
+# set_cookie_builder() renders the attributes once; each response only
+# concatenates the value.
+
+# RFC 6265 cookie-octet: %x21 / %x23-2B / %x2D-3A / %x3C-5B / %x5D-7E
+_COOKIE_VALUE = re.compile(r'[\x21\x23-\x2B\x2D-\x3A\x3C-\x5B\x5D-\x7E]*')
+# A quoted value and its escapes, as http.cookies reads them
+_QUOTED = re.compile(r'"(?:[^\\"]|\\.)*"')
+_ESCAPE = re.compile(r'\\(?:([0-3][0-7][0-7])|(.))')
+
+
+def _unescape(m: "re.Match[str]") -> str:
+    return chr(int(m[1], 8)) if m[1] else m[2]
+
+
+def get_cookie(header: str, name: str) -> Optional[str]:
+    """Value of cookie `name` in a Cookie header, or None."""
+    if '"' in header:
+        return _get_cookie_quoted(header, name)
+    needle = name + "="
+    end = len(header)
+    while True:
+        i = header.rfind(needle, 0, end)
+        if i < 0:
+            # Rare spelling with spaces around "=": fall back to a full split
+            return _get_cookie_slow(header, name) if " =" in header else None
+        # Must start a pair: beginning of header, or only whitespace back to a ";"
+        j = i - 1
+        while j >= 0 and header[j] in " \t":
+            j -= 1
+        if j < 0 or header[j] == ";":
+            start = i + len(needle)
+            stop = header.find(";", start)
+            return (header[start:] if stop < 0 else header[start:stop]).strip()
+        end = i + len(needle) - 1  # keep looking further left
+
+
+def _get_cookie_quoted(header: str, name: str) -> Optional[str]:
+    # Left to right, pair by pair: a quoted value runs to its closing DQUOTE,
+    # whatever ";" it holds. Last duplicate wins
+    value = None
+    i, n = 0, len(header)
+    while i < n:
+        eq = header.find("=", i)
+        stop = header.find(";", i)
+        if eq < 0:
+            break
+        if 0 <= stop < eq:  # nameless cookie: skip it
+            i = stop + 1
+            continue
+        key = header[i:eq].strip()
+        v = eq + 1
+        while v < n and header[v] in " \t":
+            v += 1
+        if v < n and header[v] == '"':
+            m = _QUOTED.match(header, v)
+            if m is None:
+                break  # unterminated quote: SimpleCookie stops reading here too
+            val = _ESCAPE.sub(_unescape, m.group()[1:-1])
+            stop = header.find(";", m.end())
+        else:
+            val = (header[v:] if stop < 0 else header[v:stop]).strip()
+        if key == name:
+            value = val
+        if stop < 0:
+            break
+        i = stop + 1
+    return value
+
+
+def _get_cookie_slow(header: str, name: str) -> Optional[str]:
+    value = None
+    for pair in header.split(";"):
+        key, sep, val = pair.partition("=")
+        if sep and key.strip() == name:
+            value = val.strip()  # last one wins
+    return value
+
+
+def set_cookie_builder(
+    name: str,
+    path: Optional[str] = "/",
+    max_age: Optional[int] = None,
+    httponly: bool = True,
+    secure: bool = True,
+    samesite: Optional[str] = "Lax",
+) -> Callable[[str], str]:
+    """
+    Returns build(value) -> Set-Cookie header value. Attributes are sorted by name,
+    as Morsel.OutputString() does, so for token-like values (session ids) the output
+    is byte-identical to SimpleCookie's. Other RFC 6265 cookie-octets ("/", "=", ...)
+    go out unquoted where SimpleCookie would quote them; anything else raises ValueError.
+    """
+    attrs = {
+        "httponly": "HttpOnly" if httponly else None,
+        "max-age": None if max_age is None else f"Max-Age={max_age}",
+        "path": None if path is None else f"Path={path}",
+        "samesite": None if samesite is None else f"SameSite={samesite}",
+        "secure": "Secure" if secure else None,
+    }
+    suffix = "".join("; " + text for _, text in sorted(attrs.items()) if text)
+    prefix = name + "="
+    legal = _COOKIE_VALUE.fullmatch
+
+    def build(value: str) -> str:
+        if not value:
+            return f'{prefix}""{suffix}'  # what SimpleCookie emits for an empty value
+        if legal(value) is None:
+            raise ValueError(f"cookie value {value!r} has characters outside RFC 6265")
+        return prefix + value + suffix
+
+    return build
@@ -0,0 +1,134 @@
+import socketserver
+import sys
+import threading
+import time
+
+# ---------------------------------------------------------
+# LOCAL STAND-IN FOR A NETWORK KV (Redis wire protocol subset)
+# ---------------------------------------------------------
+# Just enough of RESP for KVSessionStore, so the network backend can be run
+# and benchmarked without a real Redis. Point SESSION_KV_ADDR at a real Redis
+# in production; the client code does not change.
+#
+# Supported: PING, GET, SET key value [PX ms] [NX|XX], DEL key..., PEXPIRE key ms, INCR/DECR key,
+#            ZADD key score member, ZREM key member..., ZRANGE key start stop, ZCARD key
+#
+# Usage: python kv_server.py [port]   (default 6399)
+
+_data = {}       # key -> bytes | {member: score}
+_expires = {}    # key -> monotonic deadline
+_lock = threading.Lock()
+
+
+def _live(key):
+    deadline = _expires.get(key)
+    if deadline is not None and deadline <= time.monotonic():
+        _data.pop(key, None)
+        del _expires[key]
+    return _data.get(key)
+
+
+def _bulk(b):
+    return b"$-1\r\n" if b is None else b"$%d\r\n%s\r\n" % (len(b), b)
+
+
+def _array(items):
+    return b"*%d\r\n" % len(items) + b"".join(_bulk(i) for i in items)
+
+
+def execute(cmd, args):
+    now = time.monotonic()
+    if cmd == b"PING":
+        return b"+PONG\r\n"
+    if cmd == b"GET":
+        value = _live(args[0])
+        return _bulk(value if isinstance(value, bytes) else None)
+    if cmd == b"SET":
+        key, value = args[0], args[1]
+        opts = [a.upper() for a in args[2:]]
+        exists = _live(key) is not None
+        if (b"XX" in opts and not exists) or (b"NX" in opts and exists):
+            return _bulk(None)  # condition not met: nothing written, like Redis
+        _data[key] = value
+        _expires.pop(key, None)
+        if b"PX" in opts:
+            _expires[key] = now + int(args[2 + opts.index(b"PX") + 1]) / 1000
+        return b"+OK\r\n"
+    if cmd == b"DEL":
+        n = 0
+        for key in args:
+            n += _live(key) is not None
+            _data.pop(key, None)
+            _expires.pop(key, None)
+        return b":%d\r\n" % n
+    if cmd in (b"INCR", b"DECR"):
+        value = _live(args[0])
+        n = int(value or 0) + (1 if cmd == b"INCR" else -1)
+        _data[args[0]] = b"%d" % n
+        return b":%d\r\n" % n
+    if cmd == b"PEXPIRE":
+        if _live(args[0]) is None:
+            return b":0\r\n"
+        _expires[args[0]] = now + int(args[1]) / 1000
+        return b":1\r\n"
+    if cmd == b"ZADD":
+        zset = _live(args[0])
+        if zset is None:
+            zset = _data[args[0]] = {}
+        added = args[2] not in zset
+        zset[args[2]] = float(args[1])
+        return b":%d\r\n" % added
+    if cmd == b"ZREM":
+        zset = _live(args[0]) or {}
+        n = sum(zset.pop(m, None) is not None for m in args[1:])
+        if not zset:
+            _data.pop(args[0], None)
+        return b":%d\r\n" % n
+    if cmd == b"ZCARD":
+        return b":%d\r\n" % len(_live(args[0]) or ())
+    if cmd == b"ZRANGE":
+        members = sorted((_live(args[0]) or {}).items(), key=lambda kv: (kv[1], kv[0]))
+        start, stop = int(args[1]), int(args[2])
+        start = max(0, start + len(members)) if start < 0 else start
+        stop = stop + len(members) if stop < 0 else stop  # inclusive, like Redis
+        return _array([m for m, _ in members[start:stop + 1]])
+    return b"-ERR unknown command '%s'\r\n" % cmd
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        rfile, wfile = self.rfile, self.wfile
+        while True:
+            line = rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b"*"):
+                wfile.write(b"-ERR protocol error\r\n")
+                return
+            parts = []
+            for _ in range(int(line[1:])):
+                size = int(rfile.readline()[1:])
+                parts.append(rfile.read(size + 2)[:-2])
+            with _lock:
+                reply = execute(parts[0].upper(), parts[1:])
+            wfile.write(reply)
+            wfile.flush()
+
+
+class KVServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_in_thread(port=0):
+    """Start a server on a background thread; returns it (address in .server_address)."""
+    server = KVServer(("127.0.0.1", port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 6399
+    print(f"KV stand-in on 127.0.0.1:{port}")
+    with KVServer(("127.0.0.1", port), _Handler) as server:
+        server.serve_forever()
@@ -1,55 +1,34 @@
 import os
+import sys
 
-def find_first_env_file(directory="."):
+# The loader is shared with payment-systems/stripe: see shared/python/envfile.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+
+from envfile import find_env_file, load_env_file  # noqa: E402
+
+# How far below the starting directory to look for a .env* file
+MAX_DEPTH = int(os.environ.get("DOTENV_MAX_DEPTH", "3"))
+
+
+def find_first_env_file(directory=".", max_depth=MAX_DEPTH):
     """
-    Recursively search for the first .env* file starting from `directory`.
-    Returns the full path if found, otherwise None.
+    Search for the first .env* file in `directory` or up to max_depth levels below it,
+    nearest first. Returns the full path if found, otherwise None.
     """
-    # Check files in the current directory
-    try:
-        for entry in os.listdir(directory):
-            full_path = os.path.join(directory, entry)
-            if os.path.isfile(full_path) and entry.startswith(".env"):
-                return full_path
-    except FileNotFoundError:
-        return None
-
-    # Recurse into subdirectories
-    try:
-        for entry in os.listdir(directory):
-            full_path = os.path.join(directory, entry)
-            if os.path.isdir(full_path):
-                result = find_first_env_file(full_path)
-                if result:
-                    return result
-    except FileNotFoundError:
-        return None
-
-    return None
+    return find_env_file(directory, max_depth)
+
 
 def load_dotenv(path="."):
     env_file_path = find_first_env_file(path)
-    if not os.path.isfile(env_file_path):
+    if env_file_path is None:
         return
 
-    with open(env_file_path, "r") as f:
-        for line in f:
-            line = line.strip()
-
-            # Skip empty lines or comments
-            if not line or line.startswith("#"):
-                continue
-
-            # Split KEY=VALUE (first '=' only)
-            if "=" in line:
-                key, value = line.split("=", 1)
-                key = key.strip()
-                value = value.strip().strip('"').strip("'")  # remove quotes
-                os.environ[key] = value
+    # Parsed once per file version; values from the file win over the environment
+    load_env_file(env_file_path, override=True)
 
 
 # Load .env in current directory
 load_dotenv()
 
 # Example: print a loaded variable
-# print(os.getenv("MY_SECRET"))
\ No newline at end of file
+# print(os.getenv("MY_SECRET"))
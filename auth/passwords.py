@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from auth_utils import verify_token_safe
+
+# ---------------------------------------------------------
+# PASSWORD HASHING SERVICE
+# ---------------------------------------------------------
+# Passwords are stored as a memory-hard KDF output, never as themselves:
+#
+#   scrypt$ln=14,r=8,p=1$<salt>$<hash>          (default)
+#   pbkdf2_sha256$i=600000$<salt>$<hash>
+#
+# A KDF is deliberately slow (~50-100 ms), which would stall a request thread and,
+# under the GIL, every other thread with it. So hashing runs in a process pool
+# sized to the cores, and the queue in front of it is bounded: when an attacker
+# floods /login, the excess is rejected with HasherOverloaded (answer 503) instead
+# of piling up behind the KDF and taking every legitimate login down with it.
+#
+# Parameters live in each stored hash, so they can change at any time: verify()
+# still accepts old hashes and hands back a fresh one to store (rehash on login).
+
+
+class HasherOverloaded(Exception):
+    """The hashing queue is full; shed this login rather than wait."""
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _kdf(algorithm: str, password: str, salt: bytes, params: Dict[str, int]) -> bytes:
+    # Module-level so the process pool can pickle it
+    if algorithm == "scrypt":
+        n, r, p = 1 << params["ln"], params["r"], params["p"]
+        return hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32
+        )
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["i"])
+    raise ValueError(f"unknown password hash algorithm {algorithm!r}")
+
+
+def _encode(algorithm: str, params: Dict[str, int], salt: bytes, digest: bytes) -> str:
+    spec = ",".join(f"{k}={v}" for k, v in params.items())
+    return f"{algorithm}${spec}${_b64(salt)}${_b64(digest)}"
+
+
+def _decode(stored: str) -> Tuple[str, Dict[str, int], bytes, str]:
+    algorithm, spec, salt, digest = stored.split("$")
+    params = {k: int(v) for k, v in (item.split("=") for item in spec.split(","))}
+    return algorithm, params, base64.b64decode(salt + "=" * (-len(salt) % 4)), digest
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        algorithm: str = "scrypt",
+        params: Optional[Dict[str, int]] = None,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+    ):
+        """
+        workers=0 hashes inline on the calling thread (tests, scripts, benchmarks).
+        max_queue bounds hashes queued or running at once; default 8 per worker.
+        """
+        self.algorithm = algorithm
+        if params is None:
+            params = {"ln": 14, "r": 8, "p": 1} if algorithm == "scrypt" else {"i": 600_000}
+        self.params = params
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_queue = max_queue or 8 * max(1, self.workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.hashed = self.shed = self.rehashed = 0
+        self.hash_ms_total = 0.0
+        # Verified against when the username does not exist, so a miss costs the same
+        # time as a wrong password and does not reveal which usernames are registered
+        self._dummy = None
+
+    # -----------------------------------------------------
+    # KDF execution
+    # -----------------------------------------------------
+    def _run(self, algorithm: str, password: str, salt: bytes, params: Dict[str, int]) -> bytes:
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self.shed += 1
+                raise HasherOverloaded(f"{self._pending} password hashes already queued")
+            self._pending += 1
+            if self._pool is None and self.workers > 0:
+                # Not plain fork: the caller is a threaded server, and forking a process
+                # that has other threads running can copy a held lock into the child
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context(
+                    "forkserver" if "forkserver" in methods else "spawn"
+                )
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        t0 = time.perf_counter()
+        try:
+            if self._pool is None:
+                return _kdf(algorithm, password, salt, params)
+            return self._pool.submit(_kdf, algorithm, password, salt, params).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.hashed += 1
+                self.hash_ms_total += (time.perf_counter() - t0) * 1000
+
+    def hash(self, password: str) -> str:
+        salt = secrets.token_bytes(16)
+        digest = self._run(self.algorithm, password, salt, self.params)
+        return _encode(self.algorithm, self.params, salt, digest)
+
+    def needs_rehash(self, stored: str) -> bool:
+        algorithm, params, _, _ = _decode(stored)
+        return algorithm != self.algorithm or params != self.params
+
+    def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """
+        (matches, new_hash). new_hash is set when the password matched but was stored
+        with other parameters: the caller should save it in place of the old one.
+        stored=None (unknown user) burns a dummy verify and returns (False, None).
+        """
+        unknown_user = stored is None
+        if unknown_user:
+            if self._dummy is None:
+                self._dummy = self.hash(secrets.token_urlsafe(16))
+            stored = self._dummy
+        algorithm, params, salt, expected = _decode(stored)
+        ok = verify_token_safe(_b64(self._run(algorithm, password, salt, params)), expected)
+        if unknown_user:
+            return False, None
+        if ok and self.needs_rehash(stored):
+            with self._lock:
+                self.rehashed += 1
+            return True, self.hash(password)
+        return ok, None
+
+    # -----------------------------------------------------
+    # Tuning
+    # -----------------------------------------------------
+    def autotune(self, target_ms: float = 100.0, max_ln: int = 20) -> Dict[str, int]:
+        """Raise the cost parameter until one hash takes at least target_ms on this machine."""
+        salt = secrets.token_bytes(16)
+        if self.algorithm == "scrypt":
+            params = dict(self.params, ln=10)
+            while params["ln"] < max_ln:
+                t0 = time.perf_counter()
+                _kdf("scrypt", "autotune", salt, params)
+                if (time.perf_counter() - t0) * 1000 >= target_ms:
+                    break
+                params["ln"] += 1
+        else:
+            probe = {"i": 10_000}
+            t0 = time.perf_counter()
+            _kdf("pbkdf2_sha256", "autotune", salt, probe)
+            per_iter_ms = (time.perf_counter() - t0) * 1000 / probe["i"]
+            params = {"i": max(probe["i"], int(target_ms / per_iter_ms))}
+        self.params = params
+        self._dummy = None
+        return params
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "algorithm": self.algorithm,
+                "params": dict(self.params),
+                "workers": self.workers,
+                "queued": self._pending,
+                "max_queue": self.max_queue,
+                "hashed": self.hashed,
+                "shed": self.shed,
+                "rehashed": self.rehashed,
+                "hash_ms_avg": round(self.hash_ms_total / self.hashed, 2) if self.hashed else 0.0,
+            }
+
+
+def hasher_from_env() -> PasswordHasher:
+    """
+    PASSWORD_HASH=scrypt|pbkdf2_sha256  PASSWORD_HASH_WORKERS=<cores>
+    PASSWORD_HASH_QUEUE=<8 x workers>   PASSWORD_HASH_TARGET_MS (autotune when set)
+    """
+    workers = os.environ.get("PASSWORD_HASH_WORKERS")
+    queue = os.environ.get("PASSWORD_HASH_QUEUE")
+    hasher = PasswordHasher(
+        algorithm=os.environ.get("PASSWORD_HASH", "scrypt"),
+        workers=int(workers) if workers else None,
+        max_queue=int(queue) if queue else None,
+    )
+    target_ms = os.environ.get("PASSWORD_HASH_TARGET_MS")
+    if target_ms:
+        hasher.autotune(float(target_ms))
+    return hasher
@@ -0,0 +1,241 @@
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+# ---------------------------------------------------------
+# PRODUCTION SERVE MODE FOR A RAW WSGI APP
+# ---------------------------------------------------------
+# wsgiref's make_server handles one request at a time: a slow client blocks
+# everyone behind it. This module keeps wsgiref's HTTP handling but runs it:
+#
+#   threads  - one process, a fixed pool of request threads
+#   prefork  - a master process forking N workers, each with its own pool.
+#              With SO_REUSEPORT every worker binds the port itself and the
+#              kernel spreads connections; otherwise the master binds once and
+#              workers inherit the socket.
+#   dev      - the original single-threaded wsgiref server
+#
+# Master signals (prefork):
+#   SIGHUP          graceful restart: start a fresh set of workers, wait until they
+#                   listen, then ask the old ones to stop accepting and finish their
+#                   in-flight requests. Workers are forked from the master, so this
+#                   renews worker memory, not the code the master loaded.
+#   SIGTERM/SIGINT  graceful stop
+#
+# SO_REUSEPORT leaves a tiny window on restart: a connection the kernel queues on
+# a retiring worker between its last accept() and close() is reset. The inherited
+# single listener (SERVE_REUSEPORT=0) has no such window but no kernel balancing.
+#
+# Workers are separate processes: in-memory state (e.g. SESSION_BACKEND=memory)
+# is NOT shared between them; use the sqlite or kv session backend. Those stores
+# connect per process (session_backends.py), so building them in the master is fine.
+#
+# Env: SERVE_MODE=threads|prefork|dev  SERVE_HOST=""  SERVE_PORT=8000
+#      SERVE_THREADS=16  SERVE_WORKERS=<cpu count>  SERVE_REUSEPORT=1  SERVE_ACCESS_LOG=1
+
+log = logging.getLogger("serve")
+
+
+def timed(app, access_log: bool = True):
+    """WSGI middleware: one log line per request with status and handler time."""
+
+    def wrapper(environ, start_response):
+        t0 = time.perf_counter()
+        status = ["-"]
+
+        def capture(s, headers, exc_info=None):
+            status[0] = s.split(" ", 1)[0]
+            return start_response(s, headers, exc_info)
+
+        try:
+            return app(environ, capture)
+        finally:
+            if access_log:
+                log.info(
+                    "%s %s %s %.2fms",
+                    environ.get("REQUEST_METHOD"), environ.get("PATH_INFO"), status[0],
+                    (time.perf_counter() - t0) * 1000,
+                )
+
+    return wrapper
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass  # timed() writes the access log
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server that hands each connection to a bounded thread pool."""
+
+    def __init__(self, addr, threads: int = 16, reuse_port: bool = False, sock=None):
+        self.reuse_port = reuse_port
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+        # Accepting more than the pool can hold just moves the queue from the kernel
+        # backlog into memory; block the accept loop instead
+        self._slots = threading.BoundedSemaphore(threads * 4)
+        super().__init__(addr, _QuietHandler, bind_and_activate=sock is None)
+        if sock is not None:
+            # Inherited listener (prefork without SO_REUSEPORT): adopt it instead of binding
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+            self.server_name, self.server_port = "localhost", self.server_address[1]
+            self.setup_environ()
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        """Wait for in-flight requests; call after serve_forever() returns."""
+        if self.reuse_port:
+            # The kernel already queued connections on this worker's own listener;
+            # closing it would reset them, so take what is waiting first
+            self.socket.setblocking(False)
+            while True:
+                try:
+                    request, client_address = self.socket.accept()
+                except OSError:
+                    break
+                self.process_request(request, client_address)
+        self.pool.shutdown(wait=True)
+        self.server_close()
+
+
+def _serve_until_signalled(server: PooledWSGIServer) -> None:
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever(), which runs on this thread: hand it off
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever(poll_interval=0.2)
+    server.drain()
+
+
+def serve_threads(app, host: str, port: int, threads: int) -> None:
+    server = PooledWSGIServer((host, port), threads=threads)
+    server.set_app(app)
+    log.info("serving on %s:%d with %d threads (pid %d)", host, port, threads, os.getpid())
+    _serve_until_signalled(server)
+
+
+def serve_prefork(app, host: str, port: int, workers: int, threads: int, reuse_port: bool):
+    shared = None
+    if not reuse_port:
+        shared = socket.create_server((host, port), backlog=1024)
+
+    def spawn() -> int:
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid:
+            # Wait until the worker is listening, so retiring old workers never leaves
+            # the port without an accept queue
+            os.close(ready_w)
+            select.select([ready_r], [], [], 10)
+            os.close(ready_r)
+            return pid
+        # Child: restarts are the master's business; SIGTERM/SIGINT are rebound below
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        os.close(ready_r)
+        try:
+            server = PooledWSGIServer((host, port), threads, reuse_port, sock=shared)
+            server.set_app(app)
+            os.write(ready_w, b"1")
+            os.close(ready_w)
+            _serve_until_signalled(server)
+        except BaseException:
+            log.exception("worker %d crashed", os.getpid())
+            os._exit(1)
+        os._exit(0)
+
+    current = {spawn() for _ in range(workers)}
+    retiring: set = set()
+    events = []
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: events.append(signum))
+    log.info(
+        "master %d: %d workers on %s:%d (reuse_port=%s)",
+        os.getpid(), workers, host, port, reuse_port,
+    )
+
+    stopping = False
+    while current or retiring:
+        while events:
+            sig = events.pop(0)
+            if sig == signal.SIGHUP and not stopping:
+                log.info("graceful restart: replacing %d workers", len(current))
+                # New workers first, so the port never goes unserved
+                retiring |= current
+                current = {spawn() for _ in range(workers)}
+                for pid in retiring:
+                    os.kill(pid, signal.SIGTERM)
+            elif sig in (signal.SIGTERM, signal.SIGINT) and not stopping:
+                log.info("graceful stop")
+                stopping = True
+                for pid in current | retiring:
+                    os.kill(pid, signal.SIGTERM)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.1)
+            continue
+        if pid in retiring:
+            retiring.discard(pid)
+        elif pid in current:
+            current.discard(pid)
+            if not stopping:
+                log.warning("worker %d exited (status %d), respawning", pid, status)
+                current.add(spawn())
+    if shared is not None:
+        shared.close()
+
+
+def serve_from_env(app) -> None:
+    logging.basicConfig(
+        level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(process)d %(message)s"
+    )
+    mode = os.environ.get("SERVE_MODE", "threads")
+    host = os.environ.get("SERVE_HOST", "")
+    port = int(os.environ.get("SERVE_PORT", "8000"))
+    threads = int(os.environ.get("SERVE_THREADS", "16"))
+    app = timed(app, access_log=os.environ.get("SERVE_ACCESS_LOG", "1") == "1")
+
+    if mode == "dev":
+        print(f"Serving on http://localhost:{port}... (single-threaded dev server)")
+        with make_server(host, port, app, handler_class=_QuietHandler) as httpd:
+            httpd.serve_forever()
+    elif mode == "threads":
+        serve_threads(app, host, port, threads)
+    elif mode == "prefork":
+        workers = int(os.environ.get("SERVE_WORKERS", str(os.cpu_count() or 1)))
+        reuse_port = (
+            os.environ.get("SERVE_REUSEPORT", "1") == "1" and hasattr(socket, "SO_REUSEPORT")
+        )
+        serve_prefork(app, host, port, workers, threads, reuse_port)
+    else:
+        raise ValueError(f"unknown SERVE_MODE {mode!r}")
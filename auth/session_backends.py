@@ -0,0 +1,418 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from session_store import SessionStore
+
+# ---------------------------------------------------------
+# SHARED SESSION BACKENDS
+# ---------------------------------------------------------
+# Every backend exposes the same interface as session_store.SessionStore:
+#
+#   create(session_id, user_id, value)   get(session_id) -> value | None
+#   delete(session_id) -> bool           delete_user(user_id) -> int
+#   stats() -> dict
+#
+# Which one to use depends on how the server is deployed:
+#   SessionStore        one process (sessions die with it)
+#   SQLiteSessionStore  several worker processes on one box (put the file on
+#                       /dev/shm to keep it in shared memory)
+#   KVSessionStore      several hosts, via a Redis-compatible KV
+#                       (kv_server.py is a local stand-in)
+#   NearCache           wraps either shared store so repeat /profile hits skip the round-trip
+#
+# Values cross process boundaries, so the shared stores serialize them with
+# encode/decode (JSON by default). Wall-clock time is used for expiry because
+# every worker must agree on it.
+#
+# Connections are per process: the stores are usually built at import, in a
+# prefork master, and a SQLite handle or socket must not be shared with a forked
+# worker. SQLite connects on first use, and after fork() every store in the child
+# drops what it inherited and connects again itself.
+
+_STORES = weakref.WeakSet()
+
+
+class SQLiteSessionStore:
+    def __init__(
+        self,
+        path: str = "sessions.db",
+        sliding_ttl: Optional[float] = 1800,
+        absolute_ttl: Optional[float] = 12 * 3600,
+        max_per_user: Optional[int] = 10,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+    ):
+        if sliding_ttl is None and absolute_ttl is None:
+            raise ValueError("need at least one of sliding_ttl / absolute_ttl")
+        self.sliding_ttl = sliding_ttl
+        self.absolute_ttl = absolute_ttl
+        self.max_per_user = max_per_user
+        self.encode = encode
+        self.decode = decode
+        # Sliding expiry is only written back once it has moved this far, so a burst
+        # of reads costs one UPDATE instead of one per request
+        self.touch_after = (sliding_ttl or 0) / 10
+
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._inherited = None
+        self._lock = threading.Lock()
+        self._creates = 0
+        self.expired = self.evicted_user_cap = 0
+        _STORES.add(self)
+
+    def _reset(self) -> None:
+        # Keep the parent's handle referenced but unused: closing it here could
+        # checkpoint or unlink the WAL under the parent
+        self._inherited, self._db = self._db, None
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._db is None:
+            db = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=5
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, user_id TEXT NOT NULL,"
+                " value TEXT, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id, created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_exp ON sessions (expires_at)")
+            self._db = db
+        return self._db
+
+    def _deadline(self, created_at: float, now: float) -> float:
+        if self.absolute_ttl is None:
+            return now + self.sliding_ttl
+        if self.sliding_ttl is None:
+            return created_at + self.absolute_ttl
+        return min(now + self.sliding_ttl, created_at + self.absolute_ttl)
+
+    def create(self, session_id: str, user_id: str, value: Any = None) -> None:
+        now = time.time()
+        encoded = self.encode(value)
+        with self._lock:
+            db = self._conn()
+            db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (session_id, user_id, encoded, now, self._deadline(now, now)),
+            )
+            if self.max_per_user is not None:
+                cur = db.execute(
+                    "DELETE FROM sessions WHERE sid IN (SELECT sid FROM sessions WHERE user_id = ?"
+                    " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (user_id, self.max_per_user),
+                )
+                self.evicted_user_cap += cur.rowcount
+            self._creates += 1
+            if self._creates % 1000 == 0:
+                cur = db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                self.expired += cur.rowcount
+
+    def get(self, session_id: str) -> Any:
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            row = db.execute(
+                "SELECT value, created_at, expires_at FROM sessions WHERE sid = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at, expires_at = row
+            if expires_at <= now:
+                db.execute("DELETE FROM sessions WHERE sid = ?", (session_id,))
+                self.expired += 1
+                return None
+            deadline = self._deadline(created_at, now)
+            if deadline - expires_at > self.touch_after:
+                db.execute(
+                    "UPDATE sessions SET expires_at = ? WHERE sid = ?", (deadline, session_id)
+                )
+        return self.decode(value)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            db = self._conn()
+            cur = db.execute("DELETE FROM sessions WHERE sid = ?", (session_id,))
+            return cur.rowcount > 0
+
+    def delete_user(self, user_id: str) -> int:
+        with self._lock:
+            db = self._conn()
+            return db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            db = self._conn()
+            live = db.execute(
+                "SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+            return {
+                "backend": "sqlite",
+                "live_sessions": live,
+                "expired": self.expired,
+                "evicted_user_cap": self.evicted_user_cap,
+            }
+
+
+class KVError(Exception):
+    pass
+
+
+class _RespConnection:
+    """One blocking connection speaking RESP (the Redis wire protocol)."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile("rb")
+
+    def call(self, *args) -> Any:
+        parts = [a if isinstance(a, bytes) else str(a).encode() for a in args]
+        out = [b"*%d\r\n" % len(parts)]
+        for p in parts:
+            out.append(b"$%d\r\n%s\r\n" % (len(p), p))
+        self.sock.sendall(b"".join(out))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self.rfile.readline()
+        if not line:
+            raise KVError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise KVError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else self.rfile.read(n + 2)[:-2]
+        if kind == b"*":
+            return [self._read() for _ in range(int(rest))]
+        raise KVError(f"bad reply {line!r}")
+
+
+class KVClient:
+    """Redis-protocol client shared by threads: one connection each, reconnecting after errors."""
+
+    def __init__(self, addr: str = "127.0.0.1:6399", timeout: float = 2.0):
+        host, _, port = addr.rpartition(":")
+        self.host, self.port, self.timeout = host, int(port), timeout
+        self._reset()
+        self.round_trips = 0
+        _STORES.add(self)
+
+    def _reset(self) -> None:
+        self._local = threading.local()  # the forking thread's socket would carry over
+        self._lock = threading.Lock()
+
+    def call(self, *args) -> Any:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _RespConnection(self.host, self.port, self.timeout)
+        with self._lock:
+            self.round_trips += 1
+        try:
+            return conn.call(*args)
+        except (OSError, KVError):
+            self._local.conn = None  # the stream may be out of sync: reconnect on next call
+            raise
+
+
+class KVSessionStore:
+    """
+    Sessions in a Redis-compatible KV: the session key carries its own expiry (PX), and
+    a per-user sorted set (score = created_at) backs per-user caps and delete_user.
+    """
+
+    def __init__(
+        self,
+        addr: str = "127.0.0.1:6399",
+        sliding_ttl: Optional[float] = 1800,
+        absolute_ttl: Optional[float] = 12 * 3600,
+        max_per_user: Optional[int] = 10,
+        prefix: str = "sess:",
+        timeout: float = 2.0,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+    ):
+        if sliding_ttl is None and absolute_ttl is None:
+            raise ValueError("need at least one of sliding_ttl / absolute_ttl")
+        self.kv = KVClient(addr, timeout)
+        self.sliding_ttl = sliding_ttl
+        self.absolute_ttl = absolute_ttl
+        self.max_per_user = max_per_user
+        self.prefix = prefix
+        self.encode = encode
+        self.decode = decode
+        self.touch_after = (sliding_ttl or 0) / 10
+        self.evicted_user_cap = 0
+
+    def _ttl_ms(self, created_at: float, now: float) -> int:
+        if self.absolute_ttl is None:
+            ttl = self.sliding_ttl
+        elif self.sliding_ttl is None:
+            ttl = created_at + self.absolute_ttl - now
+        else:
+            ttl = min(self.sliding_ttl, created_at + self.absolute_ttl - now)
+        return max(1, int(ttl * 1000))
+
+    def create(self, session_id: str, user_id: str, value: Any = None) -> None:
+        now = time.time()
+        # The envelope carries what get() needs to compute the sliding deadline
+        record = json.dumps({"u": user_id, "c": now, "t": now, "v": self.encode(value)})
+        self.kv.call("SET", self.prefix + session_id, record, "PX", self._ttl_ms(now, now))
+        user_key = f"{self.prefix}user:{user_id}"
+        self.kv.call("ZADD", user_key, now, session_id)
+        if self.max_per_user is not None and self.kv.call("ZCARD", user_key) > self.max_per_user:
+            oldest = self.kv.call("ZRANGE", user_key, 0, -self.max_per_user - 1)
+            if oldest:
+                self.kv.call("DEL", *[self.prefix + sid.decode() for sid in oldest])
+                self.kv.call("ZREM", user_key, *oldest)
+                self.evicted_user_cap += len(oldest)
+        if self.absolute_ttl is not None:
+            self.kv.call("PEXPIRE", user_key, int(self.absolute_ttl * 1000))
+
+    def get(self, session_id: str) -> Any:
+        raw = self.kv.call("GET", self.prefix + session_id)
+        if raw is None:
+            return None  # expired or deleted: the KV dropped it
+        record = json.loads(raw)
+        if self.sliding_ttl is not None:
+            now = time.time()
+            if now - record["t"] > self.touch_after:
+                # XX: only while the key still exists, so a delete() (logout) that lands
+                # between the GET and here is not undone by writing the record back
+                record["t"] = now
+                self.kv.call(
+                    "SET", self.prefix + session_id, json.dumps(record),
+                    "PX", self._ttl_ms(record["c"], now), "XX",
+                )
+        return self.decode(record["v"])
+
+    def delete(self, session_id: str) -> bool:
+        raw = self.kv.call("GET", self.prefix + session_id)
+        if raw is None:
+            return False
+        self.kv.call("DEL", self.prefix + session_id)
+        self.kv.call("ZREM", f"{self.prefix}user:{json.loads(raw)['u']}", session_id)
+        return True
+
+    def delete_user(self, user_id: str) -> int:
+        user_key = f"{self.prefix}user:{user_id}"
+        sids = self.kv.call("ZRANGE", user_key, 0, -1)
+        if not sids:
+            return 0
+        n = self.kv.call("DEL", *[self.prefix + sid.decode() for sid in sids])
+        self.kv.call("DEL", user_key)
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "kv",
+            "addr": f"{self.kv.host}:{self.kv.port}",
+            "round_trips": self.kv.round_trips,
+            "evicted_user_cap": self.evicted_user_cap,
+        }
+
+
+def _reset_stores_in_child() -> None:
+    for store in list(_STORES):
+        store._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_stores_in_child)
+
+
+class NearCache:
+    """
+    Short-TTL, size-bounded local cache in front of a shared store.
+    Only hits are cached, so a session created by another worker is visible at once.
+    A logout in another worker is seen here after at most `ttl` seconds; local
+    deletes invalidate immediately.
+    """
+
+    def __init__(self, backend: Any, ttl: float = 1.0, max_size: int = 10_000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def create(self, session_id: str, user_id: str, value: Any = None) -> None:
+        self.backend.create(session_id, user_id, value)
+
+    def get(self, session_id: str) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(session_id)
+            if hit is not None and now - hit[1] < self.ttl:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return hit[0]
+            self.misses += 1
+        value = self.backend.get(session_id)
+        with self._lock:
+            if value is None:
+                self._entries.pop(session_id, None)
+            else:
+                self._entries[session_id] = (value, now)
+                self._entries.move_to_end(session_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._entries.pop(session_id, None)
+        return self.backend.delete(session_id)
+
+    def delete_user(self, user_id: str) -> int:
+        # Entries are keyed by session id only, so drop them all rather than serve a revoked one
+        with self._lock:
+            self._entries.clear()
+        return self.backend.delete_user(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            near = {
+                "size": len(self._entries),
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+        return {**self.backend.stats(), "near_cache": near}
+
+
+def store_from_env(**ttls) -> Any:
+    """
+    SESSION_BACKEND=memory|sqlite|kv  (default memory)
+    SESSION_DB=sessions.db            (sqlite)
+    SESSION_KV_ADDR=127.0.0.1:6399    (kv)
+    SESSION_NEAR_CACHE_TTL=1.0        (shared backends; 0 disables)
+    ttls: sliding_ttl / absolute_ttl / max_per_user, passed to the store.
+    """
+    kind = os.environ.get("SESSION_BACKEND", "memory")
+    if kind == "memory":
+        return SessionStore(**ttls)
+    if kind == "sqlite":
+        store = SQLiteSessionStore(os.environ.get("SESSION_DB", "sessions.db"), **ttls)
+    elif kind == "kv":
+        store = KVSessionStore(os.environ.get("SESSION_KV_ADDR", "127.0.0.1:6399"), **ttls)
+    else:
+        raise ValueError(f"unknown SESSION_BACKEND {kind!r}")
+    near_ttl = float(os.environ.get("SESSION_NEAR_CACHE_TTL", "1.0"))
+    return NearCache(store, ttl=near_ttl) if near_ttl > 0 else store
@@ -0,0 +1,189 @@
+import heapq
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# ---------------------------------------------------------
+# EXPIRING SESSION STORE
+# ---------------------------------------------------------
+# A plain dict of sessions only ever grows: the cookie expires in the
+# browser, but the server-side entry lives until the process dies.
+# This store bounds memory three ways:
+#   1. TTL      - sliding (idle timeout) and/or absolute (max lifetime)
+#   2. max_size - least-recently-used session is evicted when full
+#   3. per-user - a user with too many sessions loses their oldest one
+#
+# Expiry uses a min-heap of (expires_at, session_id) with lazy deletion:
+# touching a session does NOT push a new heap entry. When an entry reaches
+# the top we re-check the session's real deadline and re-push if it was
+# extended. Each operation pops at most a few due entries, so expiry is
+# O(log n) amortized and never needs a full scan.
+
+
+class _Entry:
+    __slots__ = ("user_id", "value", "created_at", "expires_at")
+
+    def __init__(self, user_id: str, value: Any, created_at: float, expires_at: float):
+        self.user_id = user_id
+        self.value = value
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+
+class SessionStore:
+    def __init__(
+        self,
+        sliding_ttl: Optional[float] = 1800,
+        absolute_ttl: Optional[float] = 12 * 3600,
+        max_size: int = 1_000_000,
+        max_per_user: Optional[int] = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if sliding_ttl is None and absolute_ttl is None:
+            raise ValueError("need at least one of sliding_ttl / absolute_ttl")
+        self.sliding_ttl = sliding_ttl
+        self.absolute_ttl = absolute_ttl
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self.clock = clock
+
+        # session_id -> entry, in least-recently-used-first order
+        self._sessions: "OrderedDict[str, _Entry]" = OrderedDict()
+        # user_id -> {session_id: None}, oldest first (dict keeps insertion order)
+        self._by_user: Dict[str, Dict[str, None]] = {}
+        self._heap: list = []
+        self._lock = threading.Lock()
+
+        self.expired = 0
+        self.evicted_lru = 0
+        self.evicted_user_cap = 0
+
+    # -----------------------------------------------------
+    # Public API
+    # -----------------------------------------------------
+    def create(self, session_id: str, user_id: str, value: Any = None) -> None:
+        with self._lock:
+            self._create(session_id, user_id, value)
+
+    def get(self, session_id: str) -> Any:
+        """Value for a live session (extending its sliding TTL), else None."""
+        with self._lock:
+            return self._get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def delete_user(self, user_id: str) -> int:
+        """Log a user out everywhere."""
+        with self._lock:
+            sids = list(self._by_user.get(user_id, ()))
+            for sid in sids:
+                self._remove(sid)
+            return len(sids)
+
+    def __contains__(self, session_id: str) -> bool:
+        # Not get() is not None: a live session may hold a None value
+        with self._lock:
+            self._get(session_id)
+            return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "live_sessions": len(self._sessions),
+                "users": len(self._by_user),
+                "expired": self.expired,
+                "evicted_lru": self.evicted_lru,
+                "evicted_user_cap": self.evicted_user_cap,
+                "memory_bytes": self._memory_bytes(),
+            }
+
+    # -----------------------------------------------------
+    # Internals (caller holds self._lock)
+    # -----------------------------------------------------
+    def _create(self, session_id: str, user_id: str, value: Any) -> None:
+        now = self.clock()
+        self._expire_due(now)
+        if session_id in self._sessions:
+            self._remove(session_id)
+
+        entry = _Entry(user_id, value, now, self._deadline(now, now))
+        self._sessions[session_id] = entry
+        self._by_user.setdefault(user_id, {})[session_id] = None
+        heapq.heappush(self._heap, (entry.expires_at, session_id))
+
+        user_sessions = self._by_user[user_id]
+        if self.max_per_user is not None and len(user_sessions) > self.max_per_user:
+            self._remove(next(iter(user_sessions)))
+            self.evicted_user_cap += 1
+        while len(self._sessions) > self.max_size:
+            self._remove(next(iter(self._sessions)))
+            self.evicted_lru += 1
+
+    def _get(self, session_id: str) -> Any:
+        now = self.clock()
+        if self._heap and self._heap[0][0] <= now:
+            self._expire_due(now)
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(session_id)
+            self.expired += 1
+            return None
+        entry.expires_at = self._deadline(entry.created_at, now)
+        self._sessions.move_to_end(session_id)
+        return entry.value
+
+    def _memory_bytes(self) -> int:
+        """Approximate: container overhead + one representative entry x count."""
+        n = len(self._sessions)
+        total = sum(map(sys.getsizeof, (self._sessions, self._by_user, self._heap)))
+        if n:
+            sid, entry = next(iter(self._sessions.items()))
+            per_entry = sys.getsizeof(sid) + sys.getsizeof(entry) + sys.getsizeof(entry.value)
+            total += n * per_entry + len(self._heap) * sys.getsizeof((0.0, sid))
+        return total
+
+    def _deadline(self, created_at: float, now: float) -> float:
+        if self.absolute_ttl is None:
+            return now + self.sliding_ttl
+        if self.sliding_ttl is None:
+            return created_at + self.absolute_ttl
+        return min(now + self.sliding_ttl, created_at + self.absolute_ttl)
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._sessions.pop(session_id)
+        user_sessions = self._by_user[entry.user_id]
+        del user_sessions[session_id]
+        if not user_sessions:
+            del self._by_user[entry.user_id]
+        # The heap entry is left behind and skipped when it surfaces
+
+    def _expire_due(self, now: float, budget: int = 8) -> None:
+        heap = self._heap
+        while heap and budget and heap[0][0] <= now:
+            budget -= 1
+            _, sid = heapq.heappop(heap)
+            entry = self._sessions.get(sid)
+            if entry is None:
+                continue  # already deleted/evicted (or re-created with its own heap entry)
+            if entry.expires_at > now:
+                heapq.heappush(heap, (entry.expires_at, sid))  # sliding TTL moved it
+            else:
+                self._remove(sid)
+                self.expired += 1
+        # Stale heap entries (deleted sessions) must not outgrow the live set
+        if len(heap) > 2 * len(self._sessions) + 64:
+            self._heap = [(e.expires_at, sid) for sid, e in self._sessions.items()]
+            heapq.heapify(self._heap)
@@ -0,0 +1,291 @@
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Dict, NamedTuple, Optional
+
+from auth_utils import SECRET_KEY, pooled_token, verify_token_safe
+
+# ---------------------------------------------------------
+# STATELESS SIGNED SESSION TOKENS
+# ---------------------------------------------------------
+# The session lives in the token instead of a server-side store:
+#
+#   <kid>.<payload>.<signature>
+#   payload   = base64url("user_id \n issued_at_ms \n expires_at \n token_id")
+#   signature = base64url(HMAC-SHA256(keys[kid], "<kid>.<payload>"))
+#
+# Verifying is one HMAC and a constant-time compare, with no store lookup.
+# The price is revocation: a signed token stays valid until it expires, so
+# logout / force_logout add it to a denylist checked on every verify. Entries
+# are dropped once the token would have expired anyway, so the list stays as
+# small as the logout rate x TTL. (A bloom filter in front was measured slower
+# than the dict lookup it would guard, so there is none.)
+#
+# Revocations keeps that list in this process only: with several worker
+# processes (SERVE_MODE=prefork) a logout would only count in the worker that
+# served it. SQLiteRevocations (REVOCATION_DB=path) shares it between the
+# workers on a box, at the cost of one indexed SELECT per verify.
+#
+# Key rotation: APP_SECRET_KEYS="k2:new-secret,k1:old-secret" signs with the
+# first key and still accepts the others until their tokens age out.
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class Claims(NamedTuple):
+    user_id: str
+    issued_at_ms: int  # ms so a re-login right after force_logout is not caught by the cutoff
+    expires_at: int
+    token_id: str
+
+
+class Revocations:
+    """Revoked token ids (until they expire) plus per-user "revoked before" cutoffs."""
+
+    shared = False  # seen by other processes?
+
+    def __init__(self):
+        self._denied: Dict[str, int] = {}         # token_id -> expires_at
+        self._user_cutoff: Dict[str, int] = {}    # user_id -> ms; tokens issued by then are dead
+        self._lock = threading.Lock()
+
+    def revoke(self, claims: Claims) -> None:
+        with self._lock:
+            self._denied[claims.token_id] = claims.expires_at
+
+    def revoke_user(self, user_id: str, at: Optional[int] = None) -> None:
+        """Invalidate every token the user was issued up to `at` (epoch ms, default now)."""
+        with self._lock:
+            self._user_cutoff[user_id] = time.time_ns() // 1_000_000 if at is None else at
+
+    def is_revoked(self, claims: Claims) -> bool:
+        cutoff = self._user_cutoff.get(claims.user_id)
+        if cutoff is not None and claims.issued_at_ms <= cutoff:
+            return True
+        return claims.token_id in self._denied
+
+    def prune(self, max_token_ttl: int, now: Optional[int] = None) -> None:
+        """Forget revocations for tokens that have expired anyway."""
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            self._denied = {t: exp for t, exp in self._denied.items() if exp > now}
+            self._user_cutoff = {
+                u: c for u, c in self._user_cutoff.items() if c // 1000 + max_token_ttl > now
+            }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"revoked_tokens": len(self._denied), "revoked_users": len(self._user_cutoff)}
+
+
+_SHARED = weakref.WeakSet()
+
+
+class SQLiteRevocations(Revocations):
+    """The same two lists in a SQLite file, shared by every worker process on the box."""
+
+    shared = True
+
+    def __init__(self, path: str = "revocations.db"):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._inherited = None
+        self._lock = threading.Lock()
+        _SHARED.add(self)
+
+    def _reset(self) -> None:
+        # After fork: connect again, and never touch (or close) the parent's handle
+        self._inherited, self._db = self._db, None
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._db is None:
+            db = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=5
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS denied"
+                " (token_id TEXT PRIMARY KEY, expires_at INTEGER NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS user_cutoff"
+                " (user_id TEXT PRIMARY KEY, cutoff_ms INTEGER NOT NULL)"
+            )
+            self._db = db
+        return self._db
+
+    def revoke(self, claims: Claims) -> None:
+        with self._lock:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO denied VALUES (?, ?)", (claims.token_id, claims.expires_at)
+            )
+
+    def revoke_user(self, user_id: str, at: Optional[int] = None) -> None:
+        at = time.time_ns() // 1_000_000 if at is None else at
+        with self._lock:
+            self._conn().execute("INSERT OR REPLACE INTO user_cutoff VALUES (?, ?)", (user_id, at))
+
+    def is_revoked(self, claims: Claims) -> bool:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT 1 FROM user_cutoff WHERE user_id = ? AND cutoff_ms >= ?"
+                " UNION ALL SELECT 1 FROM denied WHERE token_id = ? LIMIT 1",
+                (claims.user_id, claims.issued_at_ms, claims.token_id),
+            ).fetchone()
+        return row is not None
+
+    def prune(self, max_token_ttl: int, now: Optional[int] = None) -> None:
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            db = self._conn()
+            db.execute("DELETE FROM denied WHERE expires_at <= ?", (now,))
+            db.execute(
+                "DELETE FROM user_cutoff WHERE cutoff_ms / 1000 + ? <= ?", (max_token_ttl, now)
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            db = self._conn()
+            (tokens,) = db.execute("SELECT COUNT(*) FROM denied").fetchone()
+            (users,) = db.execute("SELECT COUNT(*) FROM user_cutoff").fetchone()
+        return {"revoked_tokens": tokens, "revoked_users": users}
+
+
+def _reset_shared_in_child() -> None:
+    for revocations in list(_SHARED):
+        revocations._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_shared_in_child)
+
+
+class TokenSigner:
+    def __init__(
+        self,
+        keys: Optional[Dict[str, str]] = None,
+        active_kid: Optional[str] = None,
+        ttl: int = 3600,
+        revocations: Optional[Revocations] = None,
+        max_ttl: Optional[int] = None,
+    ):
+        """
+        ttl is the default lifetime; issue(ttl=...) may ask for up to max_ttl (default
+        ttl). User cutoffs are kept for max_ttl, so it must not depend on what a
+        particular process happened to issue.
+        """
+        keys = keys or {"k1": SECRET_KEY}
+        self.active_kid = active_kid or next(iter(keys))
+        if self.active_kid not in keys:
+            raise ValueError(f"active key id {self.active_kid!r} not in keyring")
+        # Keyed HMAC objects built once; copy() per token skips re-deriving the key pads
+        self._macs = {
+            kid: hmac.new(secret.encode(), digestmod=hashlib.sha256) for kid, secret in keys.items()
+        }
+        self.ttl = ttl
+        self.max_ttl = max(ttl, max_ttl or 0)
+        self.revocations = revocations or Revocations()
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._rejected: Dict[str, int] = {}
+        self._next_prune = time.time() + ttl
+
+    def _sign(self, kid: str, signed_part: str) -> str:
+        mac = self._macs[kid].copy()
+        mac.update(signed_part.encode("ascii"))
+        return _b64(mac.digest())
+
+    def issue(self, user_id: str, ttl: Optional[int] = None) -> str:
+        ttl = ttl or self.ttl
+        if ttl > self.max_ttl:
+            raise ValueError(f"ttl {ttl} is above max_ttl {self.max_ttl}")
+        now_ms = time.time_ns() // 1_000_000
+        expires_at = now_ms // 1000 + ttl
+        token_id = pooled_token(9)
+        payload = _b64(f"{user_id}\n{now_ms}\n{expires_at}\n{token_id}".encode())
+        signed_part = f"{self.active_kid}.{payload}"
+        with self._lock:
+            self._issued += 1
+        return f"{signed_part}.{self._sign(self.active_kid, signed_part)}"
+
+    def _reject(self, reason: str) -> None:
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+
+    def verify(self, token: str) -> Optional[Claims]:
+        """Claims for a valid, unexpired, unrevoked token, else None."""
+        if not isinstance(token, str):
+            self._reject("malformed")
+            return None
+        kid, _, rest = token.partition(".")
+        payload, _, signature = rest.partition(".")
+        if kid not in self._macs or not signature or not token.isascii():
+            self._reject("malformed")
+            return None
+        if not verify_token_safe(signature, self._sign(kid, f"{kid}.{payload}")):
+            self._reject("bad_signature")
+            return None
+        # Signature checked first, but a validly signed payload may still not parse
+        # (a key shared with another token format): reject it rather than raise
+        try:
+            user_id, issued_at_ms, expires_at, token_id = _unb64(payload).decode().rsplit("\n", 3)
+            claims = Claims(user_id, int(issued_at_ms), int(expires_at), token_id)
+        except ValueError:  # bad base64 / UTF-8, wrong field count, non-integer times
+            self._reject("malformed")
+            return None
+        now = time.time()
+        if claims.expires_at <= now:
+            self._reject("expired")
+            return None
+        if self.revocations.is_revoked(claims):
+            self._reject("revoked")
+            return None
+        if now >= self._next_prune:
+            self._next_prune = now + self.ttl
+            self.revocations.prune(self.max_ttl)  # a cutoff must outlive the longest token
+        return claims
+
+    def revoke(self, token: str) -> bool:
+        """Logout: the token stops verifying everywhere this revocation list is consulted."""
+        claims = self.verify(token)
+        if claims is None:
+            return False
+        self.revocations.revoke(claims)
+        return True
+
+    def revoke_user(self, user_id: str) -> None:
+        """Force-logout a user from every token issued so far."""
+        self.revocations.revoke_user(user_id)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            out = {"issued": self._issued, "rejected": dict(self._rejected)}
+        return {**out, **self.revocations.stats()}
+
+
+def signer_from_env(ttl: int = 3600) -> TokenSigner:
+    """
+    APP_SECRET_KEYS="kid:secret,kid:secret" (first one signs), else APP_SECRET_KEY as "k1".
+    REVOCATION_DB=path shares revocations between processes (SQLiteRevocations).
+    """
+    db = os.environ.get("REVOCATION_DB")
+    revocations = SQLiteRevocations(db) if db else None
+    spec = os.environ.get("APP_SECRET_KEYS")
+    if not spec:
+        return TokenSigner(ttl=ttl, revocations=revocations)
+    keys = dict(item.split(":", 1) for item in spec.split(","))
+    return TokenSigner(keys, ttl=ttl, revocations=revocations)
@@ -0,0 +1,305 @@
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# ---------------------------------------------------------
+# LOGIN THROTTLING
+# ---------------------------------------------------------
+# Password verification is the most expensive thing the auth service does, so
+# credential stuffing has to be turned away BEFORE it reaches the KDF:
+#
+#   per IP        every attempt counts; 30 / minute by default
+#   per username  failed attempts count; 10 / 15 minutes by default
+#
+# The username count is reserved in check(), before the password is verified, and
+# given back when it turns out not to be a failure (success, or the hasher was
+# overloaded). Counting only after a failed verify let every guess that arrived
+# while the first ones were still hashing through the check.
+#
+# A username lockout is itself a denial of service (spray guesses, lock everyone
+# out), so a device that has logged in to that account before skips the username
+# limit; it is still subject to its IP limit. A device is the value of a random,
+# long-lived cookie the app sets once per browser: unlike an IP, an attacker
+# cannot share it or guess it. A failed login from a device revokes its trust.
+#
+# Both use a sliding-window estimate: the previous fixed window's count is
+# weighted by how much of it still overlaps the sliding window, plus the current
+# count. Two integers per key, no timestamp lists.
+#
+# Counter backends (same interface: incr(key) -> estimate, decr(key, now) undoes an
+# incr made at `now` while its window is current, estimate(key), reset(key)):
+#   WindowCounter        exact per key, LRU-bounded dict (usernames)
+#   SketchWindowCounter  count-min sketch, fixed memory whatever the number of keys
+#                        (IPs: a botnet brings millions). Never under-counts.
+#   KVWindowCounter      a Redis-compatible KV, shared by every worker and host
+
+
+class LoginThrottled(Exception):
+    """Too many login attempts; retry_after is in seconds (answer 429)."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"too many login attempts for this {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def _weight(window: float, now: float) -> float:
+    """Share of the previous fixed window still inside the sliding window ending now."""
+    return 1.0 - (now % window) / window
+
+
+class WindowCounter:
+    def __init__(self, window: float, max_keys: int = 100_000):
+        self.window = window
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [index, prev, cur]
+        self._lock = threading.Lock()
+
+    def _slot(self, key: Hashable, now: float) -> list:
+        index = int(now // self.window)
+        slot = self._keys.get(key)
+        if slot is None:
+            slot = self._keys[key] = [index, 0, 0]
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        elif slot[0] != index:
+            slot[1] = slot[2] if slot[0] == index - 1 else 0
+            slot[0], slot[2] = index, 0
+        self._keys.move_to_end(key)
+        return slot
+
+    def incr(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            slot = self._slot(key, now)
+            slot[2] += 1
+            return slot[1] * _weight(self.window, now) + slot[2]
+
+    def decr(self, key: Hashable, now: float) -> None:
+        with self._lock:
+            slot = self._keys.get(key)
+            if slot is not None and slot[0] == int(now // self.window) and slot[2] > 0:
+                slot[2] -= 1
+
+    def estimate(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            if key not in self._keys:
+                return 0.0
+            slot = self._slot(key, now)
+            return slot[1] * _weight(self.window, now) + slot[2]
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def memory_bytes(self) -> int:
+        per_key = sys.getsizeof([0, 0, 0]) + 3 * 28 + 64  # slot + ints + key, roughly
+        return sys.getsizeof(self._keys) + len(self._keys) * per_key
+
+
+class SketchWindowCounter:
+    def __init__(self, window: float, width: int = 1 << 15, depth: int = 4):
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self._index = int(time.time() // window)
+        self._cur = array("I", bytes(4 * width * depth))
+        self._prev = array("I", bytes(4 * width * depth))
+        self._lock = threading.Lock()
+
+    def _cells(self, key: Hashable):
+        h = hash(key)  # per-process hash seed: fine, the sketch never leaves the process
+        h1, h2 = h & 0xFFFFFFFF, ((h >> 32) & 0xFFFFFFFF) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _roll(self, now: float) -> None:
+        index = int(now // self.window)
+        if index == self._index:
+            return
+        zeros = bytes(self._cur.itemsize * len(self._cur))  # len() counts cells, not bytes
+        self._prev = self._cur if index == self._index + 1 else array("I", zeros)
+        self._cur = array("I", zeros)
+        self._index = index
+
+    def incr(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        cells = self._cells(key)
+        with self._lock:
+            self._roll(now)
+            cur, prev, w = self._cur, self._prev, _weight(self.window, now)
+            for c in cells:
+                cur[c] += 1
+            return min(prev[c] * w + cur[c] for c in cells)
+
+    def decr(self, key: Hashable, now: float) -> None:
+        # Only within the incr's window: its cells are then all >= 1 and hold that
+        # increment, so taking it back never under-counts another key
+        cells = self._cells(key)
+        with self._lock:
+            if self._index == int(now // self.window):
+                cur = self._cur
+                for c in cells:
+                    cur[c] -= 1
+
+    def estimate(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        cells = self._cells(key)
+        with self._lock:
+            self._roll(now)
+            cur, prev, w = self._cur, self._prev, _weight(self.window, now)
+            return min(prev[c] * w + cur[c] for c in cells)
+
+    def reset(self, key: Hashable) -> None:
+        pass  # cells are shared with other keys; a sketch can only forget by rolling over
+
+    def memory_bytes(self) -> int:
+        return 2 * self._cur.itemsize * len(self._cur)
+
+
+class KVWindowCounter:
+    """Fixed-window counts in a Redis-compatible KV (INCR + PEXPIRE), shared by all workers."""
+
+    def __init__(self, client: Any, window: float, prefix: str = "throttle:"):
+        self.kv = client  # session_backends.KVClient or anything with .call(*args)
+        self.window = window
+        self.prefix = prefix
+
+    def _keys(self, key: Hashable, now: float):
+        index = int(now // self.window)
+        return f"{self.prefix}{key}:{index}", f"{self.prefix}{key}:{index - 1}"
+
+    def incr(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        cur_key, prev_key = self._keys(key, now)
+        cur = self.kv.call("INCR", cur_key)
+        if cur == 1:
+            self.kv.call("PEXPIRE", cur_key, int(self.window * 2000))
+        prev = int(self.kv.call("GET", prev_key) or 0)
+        return prev * _weight(self.window, now) + cur
+
+    def decr(self, key: Hashable, now: float) -> None:
+        cur_key = self._keys(key, now)[0]
+        if int(self.kv.call("GET", cur_key) or 0) > 0:  # DECR would create a key with no TTL
+            self.kv.call("DECR", cur_key)
+
+    def estimate(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        cur_key, prev_key = self._keys(key, now)
+        cur = int(self.kv.call("GET", cur_key) or 0)
+        prev = int(self.kv.call("GET", prev_key) or 0)
+        return prev * _weight(self.window, now) + cur
+
+    def reset(self, key: Hashable) -> None:
+        self.kv.call("DEL", *self._keys(key, time.time()))
+
+    def memory_bytes(self) -> int:
+        return 0  # lives in the KV
+
+
+class LoginThrottle:
+    def __init__(
+        self,
+        ip_limit: int = 30,
+        ip_window: float = 60,
+        user_limit: int = 10,
+        user_window: float = 15 * 60,
+        ip_counter: Any = None,
+        user_counter: Any = None,
+        max_trusted: int = 100_000,
+    ):
+        self.ip_limit = ip_limit
+        self.user_limit = user_limit
+        self.ips = ip_counter or SketchWindowCounter(ip_window)
+        self.users = user_counter or WindowCounter(user_window)
+        self.max_trusted = max_trusted
+        self._trusted: "OrderedDict[tuple, None]" = OrderedDict()  # (username, device), LRU
+        self._lock = threading.Lock()
+        self.allowed = self.rejected_ip = self.rejected_user = 0
+
+    def check(
+        self, username: str, ip_address: str, device: Optional[str] = None
+    ) -> Optional[float]:
+        """
+        Call before verifying the password. Raises LoginThrottled. Counts the attempt
+        against the IP and reserves a failure against the username; returns the
+        reservation for refund() (None for a trusted device, which takes none).
+        """
+        now = time.time()
+        if self.ips.incr(ip_address, now) > self.ip_limit:
+            with self._lock:
+                self.rejected_ip += 1
+            raise LoginThrottled("ip", self.ips.window)
+        if device is not None and (username, device) in self._trusted:
+            with self._lock:
+                self.allowed += 1
+            return None
+        if self.users.incr(username, now) > self.user_limit:
+            self.users.decr(username, now)  # a rejected attempt is not a failure
+            with self._lock:
+                self.rejected_user += 1
+            raise LoginThrottled("username", self.users.window)
+        with self._lock:
+            self.allowed += 1
+        return now
+
+    def refund(self, username: str, reserved: Optional[float]) -> None:
+        """Give back check()'s reservation: the password was never verified."""
+        if reserved is not None:
+            self.users.decr(username, reserved)
+
+    def record_failure(self, username: str, device: Optional[str] = None) -> None:
+        # Already counted by check(); a device that guesses wrong loses its bypass
+        if device is not None:
+            with self._lock:
+                self._trusted.pop((username, device), None)
+
+    def record_success(self, username: str, device: Optional[str] = None) -> None:
+        self.users.reset(username)  # drops this attempt's reservation with the rest
+        if device is None:
+            return
+        with self._lock:
+            self._trusted[(username, device)] = None
+            self._trusted.move_to_end((username, device))
+            if len(self._trusted) > self.max_trusted:
+                self._trusted.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rejected = self.rejected_ip + self.rejected_user
+            return {
+                "allowed": self.allowed,
+                "rejected_ip": self.rejected_ip,
+                "rejected_user": self.rejected_user,
+                # every rejection is a password hash that never ran
+                "hashes_saved": rejected,
+                "trusted_devices": len(self._trusted),
+                "memory_bytes": self.ips.memory_bytes() + self.users.memory_bytes(),
+            }
+
+
+def throttle_from_env() -> LoginThrottle:
+    """
+    LOGIN_IP_LIMIT=30/60s  LOGIN_USER_LIMIT=10/900s  (count/window seconds)
+    LOGIN_THROTTLE_KV=host:port shares the counters through a Redis-compatible KV.
+    """
+
+    def parse(name: str, default: str):
+        limit, window = os.environ.get(name, default).split("/")
+        return int(limit), float(window.rstrip("s"))
+
+    ip_limit, ip_window = parse("LOGIN_IP_LIMIT", "30/60s")
+    user_limit, user_window = parse("LOGIN_USER_LIMIT", "10/900s")
+    ip_counter = user_counter = None
+    kv_addr = os.environ.get("LOGIN_THROTTLE_KV")
+    if kv_addr:
+        from session_backends import KVClient
+
+        client = KVClient(kv_addr)
+        ip_counter = KVWindowCounter(client, ip_window, prefix="throttle:ip:")
+        user_counter = KVWindowCounter(client, user_window, prefix="throttle:user:")
+    return LoginThrottle(ip_limit, ip_window, user_limit, user_window, ip_counter, user_counter)
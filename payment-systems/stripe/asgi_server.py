@@ -0,0 +1,188 @@
+# asgi_server.py (same payment routes as server.py, served by one async process)
+# Run: uvicorn asgi_server:app --port 5052
+import os, json
+import stripe
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from currency import is_valid_min
+import money
+import backend_async as backend
+import batch
+import webhooks
+import webhook_handlers  # noqa: F401  (registers the handlers)
+from dedupe import ObjectSequencer, cache_from_env
+
+app = FastAPI()
+
+def parse_amount(data) -> money.Money:
+    # Bodies are decoded by money.loads (JSON numbers -> Decimal): amounts never touch a float
+    return money.Money.parse(data["amount_major"], data.get("currency", backend.cfg.default_currency))
+
+@app.get("/health")
+async def health():
+    return {"ok": True, "app_id": backend.cfg.app_id}
+
+@app.get("/metrics")
+def metrics():
+    # A sync route (run on the threadpool): the webhook queue's counts are SQLite queries.
+    # backend_async keeps no audit log, read cache, idempotency store or requests pool,
+    # so server.py's sections for those have nothing to report here.
+    return {
+        "stripe_governor": backend.governor.stats(),
+        "stripe_retries": backend.retry_policy.stats(),
+        "webhooks": wh_queue.stats(),
+        "webhook_dedupe": wh_dedupe.stats(),
+        "webhook_sequencer": wh_queue.sequencer.stats(),
+    }
+
+@app.post("/api/pi/new")
+async def api_pi_new(request: Request):
+    # Expect JSON: {"amount_major": 12.99, "currency": "usd", "order_id": "ord_123"}
+    try:
+        data = money.loads(await request.body())
+        amount = parse_amount(data)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "invalid_amount"}, status_code=400)
+    if not is_valid_min(amount.minor, backend.cfg.min_amount_minor):
+        return JSONResponse({"error": "amount_below_min"}, status_code=400)
+    pi = await backend.create_payment_intent(amount.minor, amount.currency, data["order_id"])
+    return {"payment_intent": {"id": pi.id, "status": pi.status}}
+
+@app.post("/api/pi/confirm")
+async def api_pi_confirm(request: Request):
+    data = await request.json()
+    pi = await backend.confirm_payment_intent(data["pi_id"], payment_method="pm_card_visa") # test-only method id
+    return {"payment_intent": {"id": pi.id, "status": pi.status, "charges": await backend.get_charge_list(pi)}}
+
+@app.post("/api/pi/new_manual")
+async def api_pi_new_manual(request: Request):
+    try:
+        data = money.loads(await request.body())
+        amount = parse_amount(data)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "invalid_amount"}, status_code=400)
+    if not is_valid_min(amount.minor, backend.cfg.min_amount_minor):
+        return JSONResponse({"error": "amount_below_min"}, status_code=400)
+    pi = await backend.create_pi_manual_capture(amount.minor, amount.currency, data["order_id"])
+    return {"payment_intent": {"id": pi.id, "status": pi.status}}
+
+@app.post("/api/pi/capture")
+async def api_pi_capture(request: Request):
+    data = await request.json()
+    pi = await backend.capture_payment_intent(data["pi_id"], data.get("amount_to_capture"))
+    return {"payment_intent": {"id": pi.id, "status": pi.status}}
+
+@app.post("/api/pi/cancel")
+async def api_pi_cancel(request: Request):
+    data = await request.json()
+    return {"payment_intent": await backend.cancel_payment_intent(data["pi_id"])}
+
+@app.get("/api/pi/get")
+async def api_pi_get(pi_id: str | None = None):
+    return {"payment_intent": await backend.get_payment_intent(pi_id)}
+
+@app.post("/api/refund") # refund can only happen once the charge is captured
+async def api_pi_refund(request: Request):
+    # Expect {"charge_id":"ch_xxx", "amount_minor":null_or_int}
+    data = await request.json()
+    ref = await backend.refund_payment(charge_id=data["charge_id"], amount_minor=data["amount_minor"])
+    return {"refund": {"id": ref.id, "status": ref.status, "amount": ref.amount}}
+
+@app.post("/api/cust/new")
+async def api_cust_new(request: Request):
+    data = await request.json() # {"email":"x@y.com"}
+    c = await backend.create_customer(email=data.get("email"), desc=f"APP: {backend.cfg.app_id}")
+    return {"customer": {"id": c.id, "email": c.email}}
+
+@app.post("/api/cust/attach_pm")
+async def api_attach_pm(request: Request):
+    # {"customer_id":"cus_xxx","pm_id":"pm_card_visa"}  (test-only PM)
+    data = await request.json()
+    pm = await backend.attach_pm_to_customer(data["pm_id"], data["customer_id"])
+    await backend.set_default_pm(customer_id=data["customer_id"], pm_id=pm.id)
+    return {"payment_method": {"id": pm.id}}
+
+@app.post("/api/offsession/charge")
+async def api_offsession_charge(request: Request):
+    # {"customer_id":"cus_xxx","amount_major":9.99,"currency":"usd","order_id":"ord_off_1"}
+    try:
+        data = money.loads(await request.body())
+        amount = parse_amount(data)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "invalid_amount"}, status_code=400)
+    if not is_valid_min(amount.minor, backend.cfg.min_amount_minor):
+        return JSONResponse({"error": "amount_below_min"}, status_code=400)
+    customer_id = data.get("customer_id")
+    customer = await backend.fetch_customer(customer_id=customer_id)
+    payment_method = customer.invoice_settings.get("default_payment_method")
+    pi = await backend.offsession_charge(customer_id=customer_id, amount_minor=amount.minor, currency=amount.currency, order_id=data.get("order_id"), payment_method=payment_method)
+    return {"payment_intent": {"id": pi.id, "status": pi.status}}
+
+@app.post("/api/offsession/batch")
+async def api_offsession_batch(request: Request):
+    # Body: JSONL, one /api/offsession/charge payload per line (optionally "payment_method")
+    # Response: JSONL, one result per item in completion order, then a {"summary": ...} line
+    try:
+        concurrency, max_rps = batch.run_params(
+            request.query_params.get("concurrency", "16"), request.query_params.get("max_rps")
+        )
+    except ValueError:
+        return JSONResponse({"error": "invalid_param"}, status_code=400)
+    # The body is read before the response starts: while it streams, the server's
+    # disconnect listener owns receive(), so the request stream cannot be read then.
+    body = await request.body()
+
+    async def generate():
+        report = batch.BatchReport()
+        items = batch.parse_jsonl(body.splitlines())
+        async for res in batch.run_batch_async(items, concurrency, max_rps, report):
+            yield json.dumps(res) + "\n"
+        yield json.dumps({"summary": report.summary()}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# -------- Webhooks: verify on the loop, dedupe + enqueue on the threadpool, then workers --------
+wh_dedupe = cache_from_env()
+wh_queue = webhooks.queue_from_env(sequencer=ObjectSequencer()).start()
+
+def _accept(payload: bytes, event: dict) -> dict:
+    # Blocking (SQLite insert, and the dedupe table when WEBHOOK_DEDUPE_DB is set)
+    event_id = event.get("id")
+    if event_id and wh_dedupe.check_and_mark(event_id):
+        return {"received": True, "duplicate": True}
+    try:
+        wh_queue.enqueue(payload, event_id=event_id, etype=event["type"])
+    except Exception:
+        if event_id:
+            wh_dedupe.forget(event_id)  # let Stripe's retry through
+        raise
+    return {"received": True}
+
+@app.post("/webhooks/stripe")
+async def webhooks_stripe(request: Request):
+    payload = await request.body()
+    sig_header = request.headers.get("Stripe-Signature")
+
+    if backend.cfg.webhook_secrets:
+        # Signed with the current or (while rotating) the previous secret, as server.py
+        for secret in backend.cfg.webhook_secrets:
+            try:
+                stripe.WebhookSignature.verify_header(payload.decode(), sig_header, secret)
+                break
+            except (stripe.error.SignatureVerificationError, UnicodeDecodeError):
+                continue
+        else:
+            return JSONResponse({"error": "invalid_signature"}, status_code=400)
+    # Dev-insecure without secrets: the JSON is taken unverified (local learning only)
+    event = json.loads(payload)
+    return await run_in_threadpool(_accept, payload, event)
+
+@app.get("/webhooks/dead_letters")
+def webhooks_dead_letters(limit: int = 100):
+    return {"dead_letters": wh_queue.dead_letters(limit)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, port=int(os.environ.get("PORT", "5052")))
@@ -0,0 +1,497 @@
+# audit.py (buffered, batched, segmented + indexed audit log)
+import argparse, atexit, contextlib, json, logging, mmap, os, queue, sys, threading, time
+from typing import Any, Dict, Iterator, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so one writer process per base
+    fcntl = None
+
+FSYNC_NONE = "none"          # leave durability to the OS page cache
+FSYNC_BATCH = "batch"        # fsync after every batch
+FSYNC_INTERVAL = "interval"  # fsync at most once per fsync_interval seconds
+FSYNC_POLICIES = {FSYNC_NONE, FSYNC_BATCH, FSYNC_INTERVAL}
+
+# Fields that get a sidecar index entry: "<field>:<value>" -> byte offset in the segment
+INDEX_FIELDS = ("order_id", "pi_id", "charge_id")
+
+_STOP = object()
+
+log = logging.getLogger("audit")
+
+
+# -----------------------------------------------------------------
+# Segments: <base>.<seq:08d> holds JSONL records, <base>.<seq:08d>.idx is
+# the sidecar index written when the segment is sealed: lines of
+# "<field>:<value>\t<offset>\n" sorted bytewise, so lookups binary-search it.
+#
+# Several processes (one per server worker) may share a base. Each segment has
+# exactly one writer: seqs are allocated under flock(<base>.lock), a new segment is
+# created with O_EXCL, and its writer holds flock on it until it is sealed. So
+# sizes, offsets and the in-memory index are only ever one process's view of its
+# own file. An unsealed segment nobody holds is an orphan of a dead worker: the
+# next writer to start rebuilds its index and seals it (or resumes the newest).
+# -----------------------------------------------------------------
+def _segment_path(base: str, seq: int) -> str:
+    return f"{base}.{seq:08d}"
+
+
+@contextlib.contextmanager
+def _segments_lock(base: str) -> Iterator[None]:
+    # Serialises seq allocation and orphan checks across the processes sharing `base`
+    if fcntl is None:
+        yield
+        return
+    with open(base + ".lock", "ab") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield  # released when f closes
+
+
+def _try_own(path: str):
+    """
+    A handle holding an exclusive flock on segment `path`, or None while another
+    live writer holds it. Kept apart from the append handle, which is reopened
+    after a failed write: the flock must not lapse meanwhile.
+    """
+    f = open(path, "rb")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+
+def list_segments(base: str) -> List[tuple[int, str]]:
+    """[(seq, path)] for every segment of `base`, oldest first."""
+    directory, prefix = os.path.split(os.path.abspath(base))
+    prefix += "."
+    out = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            suffix = entry.name[len(prefix):]
+            if entry.name.startswith(prefix) and len(suffix) == 8 and suffix.isdigit():
+                out.append((int(suffix), entry.path))
+    return sorted(out)
+
+
+def _index_keys(rec: Dict[str, Any]) -> Iterator[bytes]:
+    for field in INDEX_FIELDS:
+        value = rec.get(field)
+        if isinstance(value, str) and value and "\t" not in value and "\n" not in value:
+            yield f"{field}:{value}".encode()
+
+
+class SegmentedLog:
+    """
+    Append-only JSONL log that rolls to a new segment after segment_bytes or
+    segment_seconds (0 disables the time bound). The active segment's index lives
+    in memory and is persisted as a sorted sidecar when the segment is sealed.
+    Safe to share one base between processes: each writes only segments it owns.
+    """
+
+    def __init__(
+        self, base: str, segment_bytes: int = 64 * 1024 * 1024, segment_seconds: float = 0
+    ):
+        self.base = base
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._lock = threading.Lock()
+        self._f = self._owner = None
+        self._index: Dict[bytes, List[int]] = {}
+
+        with _segments_lock(base):
+            orphans = []
+            for seq, path in list_segments(base):
+                if os.path.exists(path + ".idx"):
+                    continue
+                owner = _try_own(path)  # None: a live writer's active segment
+                if owner is not None:
+                    orphans.append((seq, path, owner))
+            # Unsealed after a crash: seal the older orphans, resume the newest
+            for seq, path, owner in orphans:
+                self._seq, self.path, self._owner = seq, path, owner
+                self._rebuild_index(path)
+                self._f = open(path, "ab")
+                if seq != orphans[-1][0]:
+                    self._seal()
+            if orphans:
+                self._start()
+            else:
+                self._open()
+
+    def _open(self) -> None:
+        # Caller holds _segments_lock: no other process allocates a seq meanwhile
+        segments = list_segments(self.base)
+        self._seq = segments[-1][0] + 1 if segments else 1
+        while True:
+            self.path = _segment_path(self.base, self._seq)
+            try:
+                self._f = open(self.path, "xb")
+                break
+            except FileExistsError:  # only without flock
+                self._seq += 1
+        self._owner = _try_own(self.path)
+        self._start()
+
+    def _start(self) -> None:
+        self._size = self._f.seek(0, os.SEEK_END)
+        self._opened_at = time.monotonic()
+
+    def _rebuild_index(self, path: str) -> None:
+        offset = 0
+        with open(path, "r+b") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("partial line")
+                    rec = json.loads(line)
+                except ValueError:
+                    f.truncate(offset)  # drop a torn tail write so appends start on a clean line
+                    break
+                for key in _index_keys(rec):
+                    self._index.setdefault(key, []).append(offset)
+                offset += len(line)
+
+    def _seal(self) -> None:
+        entries = sorted((k, off) for k, offs in self._index.items() for off in offs)
+        tmp = self.path + ".idx.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(b"%s\t%d\n" % (k, off) for k, off in entries))
+        os.replace(tmp, self.path + ".idx")
+        self._f.close()
+        self._owner.close()  # sealed: drop the flock only now, so nobody takes it for an orphan
+        self._index = {}
+
+    def _should_roll(self) -> bool:
+        if self._size >= self.segment_bytes:
+            return True
+        age = time.monotonic() - self._opened_at
+        return bool(self.segment_seconds) and age >= self.segment_seconds
+
+    def _recover(self) -> None:
+        # After a failed write (ENOSPC, EIO): drop whatever part of the batch reached
+        # the file, so the next append starts on a clean line at the indexed size
+        try:
+            self._f.close()
+        except OSError:
+            pass
+        try:
+            os.truncate(self.path, self._size)
+        except OSError:
+            pass
+        self._f = open(self.path, "ab")
+
+    def append_batch(self, batch: List[Dict[str, Any]]) -> None:
+        lines = [(json.dumps(rec, default=str) + "\n").encode() for rec in batch]
+        with self._lock:
+            if self._f.closed:
+                self._recover()  # an earlier recovery could not reopen the file
+            if self._size and self._should_roll():
+                self._seal()
+                with _segments_lock(self.base):
+                    self._open()
+            try:
+                self._f.write(b"".join(lines))
+                self._f.flush()
+            except OSError:
+                self._recover()
+                raise
+            # Index only after flush so readers never see offsets past the data
+            offset = self._size
+            for rec, line in zip(batch, lines):
+                for key in _index_keys(rec):
+                    self._index.setdefault(key, []).append(offset)
+                offset += len(line)
+            self._size = offset
+
+    def fsync(self) -> None:
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f and not self._f.closed:
+                self._seal()
+
+    def lookup(self, field: str, value: str) -> Iterator[Dict[str, Any]]:
+        """Records matching field == value across sealed segments and the active one."""
+        key = f"{field}:{value}".encode()
+        with self._lock:
+            active_path, active = self.path, list(self._index.get(key, ()))
+        for seq, path in list_segments(self.base):
+            if path != active_path:
+                yield from _read_sealed(path, key)
+        if active:
+            yield from _read_offsets(active_path, active)
+
+
+# -----------------------------------------------------------------
+# Query side: mmap the sidecar index, binary-search for the key, then
+# read just the matching lines from the mmap'd segment.
+# -----------------------------------------------------------------
+def _lower_bound(mm: mmap.mmap, key: bytes) -> int:
+    """Byte offset of the first index line whose key is >= `key`."""
+    lo, hi = 0, len(mm)  # both always sit on line starts
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = mm.rfind(b"\n", lo, mid) + 1 or lo
+        if mm[start:mm.find(b"\t", start)] < key:
+            lo = mm.find(b"\n", start) + 1
+        else:
+            hi = start
+    return lo
+
+
+def _index_offsets(idx_path: str, key: bytes) -> List[int]:
+    if os.path.getsize(idx_path) == 0:
+        return []
+    with open(idx_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos, out, prefix = _lower_bound(mm, key), [], key + b"\t"
+        while mm[pos:pos + len(prefix)] == prefix:
+            end = mm.find(b"\n", pos)
+            out.append(int(mm[pos + len(prefix):end]))
+            pos = end + 1
+        return out
+
+
+def _read_offsets(path: str, offsets: List[int]) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for off in offsets:
+            end = mm.find(b"\n", off)
+            yield json.loads(mm[off:end if end != -1 else len(mm)])
+
+
+def _scan(path: str, key: bytes) -> Iterator[Dict[str, Any]]:
+    # Unsealed segment of another process: no sidecar yet, so scan it (bounded by segment size)
+    field, _, value = key.decode().partition(":")
+    needle = json.dumps(value).encode()
+    with open(path, "rb") as f:
+        for line in f:
+            # the writer may be mid-append: skip a line that has not been completed yet
+            if needle in line and line.endswith(b"\n"):
+                rec = json.loads(line)
+                if rec.get(field) == value:
+                    yield rec
+
+
+def _read_sealed(path: str, key: bytes) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path + ".idx"):
+        yield from _scan(path, key)
+        return
+    offsets = _index_offsets(path + ".idx", key)
+    if offsets and os.path.getsize(path):
+        yield from _read_offsets(path, offsets)
+
+
+def lookup(base: str, field: str, value: str) -> Iterator[Dict[str, Any]]:
+    """Stream every record with rec[field] == value, oldest segment first."""
+    if field not in INDEX_FIELDS:
+        raise ValueError(f"field must be one of {INDEX_FIELDS}, got {field!r}")
+    key = f"{field}:{value}".encode()
+    for _, path in list_segments(base):
+        yield from _read_sealed(path, key)
+
+
+class AuditWriter:
+    """
+    Request threads only enqueue; a single background thread drains the queue,
+    groups records into size/time-bounded batches and appends each batch with one write.
+
+    Back-pressure: when the queue is full, write() blocks for up to put_timeout seconds
+    (None => block forever, 0 => drop immediately) and then drops the record.
+
+    A batch that cannot be written (disk full, I/O error) is dropped and counted in
+    errors/last_error; the thread keeps running, backing off up to 1s between failures.
+    """
+
+    def __init__(
+        self,
+        log: SegmentedLog,
+        max_queue: int = 10_000,
+        batch_size: int = 256,
+        batch_interval: float = 0.05,
+        fsync: str = FSYNC_BATCH,
+        fsync_interval: float = 1.0,
+        put_timeout: float | None = 0.1,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {sorted(FSYNC_POLICIES)}, got {fsync!r}")
+        self.log = log
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.put_timeout = put_timeout
+
+        self._q: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()  # guards counters only
+        self._queued = self._written = self._dropped = self._batches = 0
+        self._errors = 0
+        self._last_error: str | None = None
+        self._last_error_log = 0.0
+        self._batch_ms_total = self._batch_ms_last = self._batch_ms_max = 0.0
+        self._last_fsync = time.monotonic()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    # -------- producer side --------
+    def write(self, rec: Dict[str, Any]) -> bool:
+        """Enqueue one record. Returns False if it was dropped."""
+        if self._closed or not self._thread.is_alive():
+            self._count(dropped=1)
+            return False
+        try:
+            if self.put_timeout == 0:
+                self._q.put_nowait(rec)
+            else:
+                self._q.put(rec, timeout=self.put_timeout)
+        except queue.Full:
+            self._count(dropped=1)
+            return False
+        self._count(queued=1)
+        return True
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        """
+        Flush everything still queued and stop the writer thread, waiting at most
+        `timeout` seconds overall (None => as long as it takes) so that a stuck disk
+        cannot hang interpreter shutdown. Records still queued after that are lost.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._q.put(_STOP, timeout=timeout)
+        except queue.Full:
+            log.error("audit: queue still full after %ss at close, %d records lost",
+                      timeout, self._q.qsize())
+            return
+        self._thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = self._batches
+            return {
+                "queued": self._queued,
+                "written": self._written,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "last_error": self._last_error,
+                "writer_alive": self._thread.is_alive(),
+                "pending": self._q.qsize(),
+                "batches": batches,
+                "batch_ms_last": round(self._batch_ms_last, 3),
+                "batch_ms_max": round(self._batch_ms_max, 3),
+                "batch_ms_avg": round(self._batch_ms_total / batches, 3) if batches else 0.0,
+            }
+
+    # -------- consumer side --------
+    def _count(self, queued: int = 0, written: int = 0, dropped: int = 0) -> None:
+        with self._lock:
+            self._queued += queued
+            self._written += written
+            self._dropped += dropped
+
+    def _next_batch(self) -> tuple[list, bool]:
+        """Block for the first record, then gather until batch_size or batch_interval."""
+        first = self._q.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                rec = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if rec is _STOP:
+                return batch, True
+            batch.append(rec)
+        return batch, False
+
+    def _run(self) -> None:
+        stop, failures = False, 0
+        while not stop:
+            batch, stop = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                self._error(e, dropped=len(batch))
+                if not stop:
+                    time.sleep(min(0.05 * 2 ** failures, 1.0))
+        try:
+            self.log.close()
+        except Exception as e:
+            self._error(e)
+
+    def _error(self, e: Exception, dropped: int = 0) -> None:
+        with self._lock:
+            self._errors += 1
+            self._dropped += dropped
+            self._last_error = f"{type(e).__name__}: {e}"
+            now = time.monotonic()
+            report = now - self._last_error_log >= 5.0  # a dead disk fails every batch
+            if report:
+                self._last_error_log = now
+        if report:
+            log.error("audit: write failed (%d errors so far), %d records dropped: %s",
+                      self._errors, dropped, self._last_error)
+
+    def _flush(self, batch: list) -> None:
+        t0 = time.perf_counter()
+        self.log.append_batch(batch)
+        now = time.monotonic()
+        if self.fsync == FSYNC_BATCH or (
+            self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval
+        ):
+            self.log.fsync()
+            self._last_fsync = now
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+            self._batch_ms_total += ms
+            self._batch_ms_last = ms
+            self._batch_ms_max = max(self._batch_ms_max, ms)
+
+
+def writer_from_env(base: str) -> AuditWriter:
+    log = SegmentedLog(
+        base,
+        segment_bytes=int(os.environ.get("AUDIT_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+        segment_seconds=float(os.environ.get("AUDIT_SEGMENT_SECONDS", "0")),
+    )
+    w = AuditWriter(
+        log,
+        max_queue=int(os.environ.get("AUDIT_MAX_QUEUE", "10000")),
+        batch_size=int(os.environ.get("AUDIT_BATCH_SIZE", "256")),
+        batch_interval=float(os.environ.get("AUDIT_BATCH_INTERVAL", "0.05")),
+        fsync=os.environ.get("AUDIT_FSYNC", FSYNC_BATCH),
+        fsync_interval=float(os.environ.get("AUDIT_FSYNC_INTERVAL", "1.0")),
+    )
+    atexit.register(w.close)
+    return w
+
+
+if __name__ == "__main__":
+    # Usage:
+    # python audit.py audit.log --order-id ord_123
+    # python audit.py audit.log --pi-id pi_abc
+    p = argparse.ArgumentParser(description="Stream audit records for an order / PI / charge.")
+    p.add_argument("base", nargs="?", default=os.environ.get("AUDIT_FILE", "audit.log"))
+    g = p.add_mutually_exclusive_group(required=True)
+    for field in INDEX_FIELDS:
+        g.add_argument("--" + field.replace("_", "-"), dest=field)
+    args = p.parse_args()
+    field = next(f for f in INDEX_FIELDS if getattr(args, f))
+    for rec in lookup(args.base, field, getattr(args, field)):
+        sys.stdout.write(json.dumps(rec) + "\n")
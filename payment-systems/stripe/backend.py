@@ -1,55 +1,183 @@
 import stripe
 from typing import Any, Dict
-from config import load_config, load_env
-from idem import idem_key, jittered_key
-import json, datetime, os
+from config import Config, ConfigWatcher, get_config, on_reload
+from idem import idem_key, unique_key
+from audit import writer_from_env
+from cache import TTLCache
+from ratelimit import Governor
+from retry import RetryPolicy
+from idem_store import IdempotencyStore, account_scope
+import transport
+import webhooks
+import datetime, json, logging, os, threading, time
 
 
-AUDIT = os.environ.get("AUDIT_FILE", "audit.log")
+log = logging.getLogger("backend")
 
-load_env("/Users/Suhas.KS/sde/payment-systems/stripe/.env")
-cfg = load_config()
+cfg = get_config()  # .env next to this module (or STRIPE_ENV_FILE), loaded once per process
 stripe.api_key = cfg.secret_key # set once for SDK
+if cfg.api_base:
+    stripe.api_base = cfg.api_base
+
+# Hot reload: edit the .env and each worker's watcher swaps in a new Config within
+# CONFIG_RELOAD_INTERVAL seconds (0 = off). Each operation below reads `cfg` once and
+# passes that snapshot's key (api_key=) and metadata explicitly, so an operation never
+# mixes two Configs: its retries keep the key it started with. Stripe keeps a rolled
+# key valid for the overlap you choose, so both work meanwhile. stripe.api_key is
+# still updated for anything that does not pass a key.
+@on_reload
+def _apply_config(old, new):
+    global cfg
+    cfg = new
+    stripe.api_key = new.secret_key
+    if new.api_base:
+        stripe.api_base = new.api_base
+
+config_watcher = ConfigWatcher(interval=float(os.environ.get("CONFIG_RELOAD_INTERVAL", "2")))
+
+AUDIT = os.environ.get("AUDIT_FILE", "audit.log")
+audit_writer = writer_from_env(AUDIT)  # background batched writer, flushed at exit
+
+def _audit(event: str, payload: dict):
+    # One record per completed write; order_id / pi_id / charge_id are indexed (audit.py)
+    rec = {"ts": datetime.datetime.utcnow().isoformat() + "Z", "event": event, **payload}
+    audit_writer.write(rec)  # non-blocking unless the queue is full (back-pressure)
+
+# One pooled keep-alive transport for every backend call instead of the SDK default.
+# Pooled sockets (and their TLS state) must not be shared with a forked child: the
+# child drops the inherited pool and builds, and warms, its own from the same Config.
+_transport_cfg = cfg
+
+def _install_transport() -> None:
+    global http_client, http_session
+    http_client, http_session = transport.build_client(_transport_cfg)
+    stripe.default_http_client = http_client
+    if http_session is not None and _transport_cfg.http_warmup:
+        threading.Thread(
+            target=transport.warm_up,
+            args=(http_session, stripe.api_base,
+                  min(_transport_cfg.http_warmup, _transport_cfg.http_pool_size)),
+            name="http-warmup",
+            daemon=True,
+        ).start()
+
+_install_transport()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_install_transport)
+
+def _is_missing(exc: Exception) -> bool:
+    if not isinstance(exc, stripe.error.InvalidRequestError):
+        return False
+    return getattr(exc, "code", None) == "resource_missing"
+
+# Read-through cache for retrieve/list calls; keys are ("pi"|"cus"|"charges", id)
+# Built from the startup Config; config.RESTART_FIELDS lists these settings, so a
+# changed value shows up in the watcher's restart_required instead of being ignored.
+read_cache = TTLCache(
+    max_size=cfg.read_cache_size,
+    ttl=cfg.read_cache_ttl,
+    negative_ttl=cfg.read_cache_negative_ttl,
+    is_missing=_is_missing,
+)
+
+# Client-side pacing shared by every thread: token bucket + AIMD concurrency per
+# (API key, read/write). Stripe allows 25 ops/s per class in test mode, 100 in live mode.
+_default_rps = 25.0 if cfg.secret_key.startswith(("sk_test", "rk_test")) else 100.0
+governor = Governor(
+    rates={
+        "read": cfg.read_rps or _default_rps,
+        "write": cfg.write_rps or _default_rps,
+    },
+    queue_timeout=cfg.queue_timeout,
+    max_concurrency=cfg.max_concurrency,
+)
+
+# Transient failures are retried in-process with the same arguments, so the same
+# idempotency key, instead of surfacing to a caller that would mint a new one.
+retry_policy = RetryPolicy(max_attempts=cfg.max_attempts, budget=cfg.retry_budget)
+
+def _op_name(fn) -> str:
+    owner = getattr(fn, "__self__", None)
+    return f"{owner.__name__}.{fn.__name__}" if isinstance(owner, type) else fn.__name__
+
+def _call(op_class: str, fn, *args, **kwargs):
+    # Every outbound Stripe request goes through here: paced by the governor, retried on
+    # transient errors. Writes without a natural key get one now, before the first attempt,
+    # and the API key is fixed now too: a reload between attempts does not switch accounts.
+    op = _op_name(fn)
+    api_key = kwargs.setdefault("api_key", cfg.secret_key)
+    if op_class == "write":
+        kwargs.setdefault("idempotency_key", unique_key(op))
 
-def _meta(base: Dict[str, Any]) -> Dict[str, Any]:
-    # Attach useful metadata consistently
+    def attempt(deadline: float):
+        wait = min(governor.queue_timeout, max(0.0, deadline - time.monotonic()))
+        with governor.slot(api_key or "", op_class, timeout=wait):
+            return fn(*args, **kwargs)
+
+    return retry_policy.run(op, attempt)
+
+# Completed responses by idempotency key: client retries / double-submits of the same
+# logical create are answered from here without another Stripe round-trip.
+idem_store = IdempotencyStore(
+    path=os.environ.get("IDEMPOTENCY_DB", "idempotency.db"),
+    encode=json.dumps,
+    decode=lambda s: stripe.PaymentIntent.construct_from(json.loads(s), cfg.secret_key),
+)
+
+def _meta(c: Config, base: Dict[str, Any]) -> Dict[str, Any]:
+    # Attach useful metadata consistently, from the operation's Config snapshot
     out = dict(base)
-    if cfg.app_id: out["app_id"] = cfg.app_id
-    if cfg.product_id: out["product_id"] = cfg.product_id
+    if c.app_id: out["app_id"] = c.app_id
+    if c.product_id: out["product_id"] = c.product_id
     return out
 
 def create_payment_intent(amount_minor: int, currency: str, order_id: str) -> stripe.PaymentIntent:
     # Idempotent by logical order_id
     key = idem_key("pi.create", order_id, str(amount_minor), currency)
-    return stripe.PaymentIntent.create(
+    c = cfg  # one snapshot for the key, metadata and scope
+    pi = idem_store.execute(key, scope=account_scope(c.secret_key), fn=lambda: _call(
+        "write", stripe.PaymentIntent.create,
         amount=amount_minor,
         currency=currency,
         payment_method_types=["card"],
         # for manual capture module later, setup capture_method="manual"
-        metadata=_meta({"order_id":order_id}),
+        metadata=_meta(c, {"order_id":order_id}),
         idempotency_key=key,
-    )
+        api_key=c.secret_key,
+    ))
+    _audit("pi.create", {"order_id": order_id, "pi_id": pi.id, "amount_minor": amount_minor, "currency": currency})
+    return pi
 
 def create_pi_manual_capture(amount_minor: int, currency: str, order_id: str) -> stripe.PaymentIntent:
     key = idem_key("pi.create.manual", order_id, str(amount_minor), currency)
-    return stripe.PaymentIntent.create(
+    c = cfg
+    pi = idem_store.execute(key, scope=account_scope(c.secret_key), fn=lambda: _call(
+        "write", stripe.PaymentIntent.create,
         amount=amount_minor,
         currency=currency,
         payment_method_types=["card"],
         capture_method="manual",
-        metadata=_meta({"order_id": order_id}),
-        idempotency_key=key
-    )
+        metadata=_meta(c, {"order_id": order_id}),
+        idempotency_key=key,
+        api_key=c.secret_key,
+    ))
+    _audit("pi.create.manual", {"order_id": order_id, "pi_id": pi.id, "amount_minor": amount_minor, "currency": currency})
+    return pi
 
 
 def confirm_payment_intent(pi_id: str, payment_method: str = "pm_card_viss") -> stripe.PaymentIntent:
-    # Unique per confirm attempt (avoid accidental re-confirm)
-    key = jittered_key(f"pi.confirm.{pi_id}")
-    return stripe.PaymentIntent.confirm(
+    # Unique per confirm call (avoid accidental re-confirm); _call reuses it across retries
+    key = unique_key(f"pi.confirm.{pi_id}")
+    pi = _call(
+        "write", stripe.PaymentIntent.confirm,
         pi_id,
         payment_method=payment_method,
         idempotency_key=key
     )
+    read_cache.put(("pi", pi.id), pi)
+    read_cache.invalidate(("charges", pi.id))
+    _audit("pi.confirm", {"pi_id": pi.id, "status": pi.status})
+    return pi
 def get_mock_payment_intent(pi_id: str) -> stripe.PaymentIntent:
     return stripe.PaymentIntent.construct_from(
             {
@@ -57,84 +185,136 @@ def get_mock_payment_intent(pi_id: str) -> stripe.PaymentIntent:
                 "status": "unknown",
                 "object": "payment_intent"
             },
-            stripe.api_key
+            cfg.secret_key
         )
 def capture_payment_intent(pi_id: str, amount_to_capture: int | None = None) -> stripe.PaymentIntent:
-    key = jittered_key(f"pi.capture.{pi_id}.{amount_to_capture or 'full'}")
-    return stripe.PaymentIntent.capture(
+    key = unique_key(f"pi.capture.{pi_id}.{amount_to_capture or 'full'}")
+    pi = _call(
+        "write", stripe.PaymentIntent.capture,
         pi_id,
         amount_to_capture=amount_to_capture, # None => full
         idempotency_key=key
     )
+    read_cache.put(("pi", pi.id), pi)
+    read_cache.invalidate(("charges", pi.id))
+    _audit("pi.capture", {"pi_id": pi.id, "amount_to_capture": amount_to_capture, "status": pi.status})
+    return pi
 
 def refund_payment(charge_id: str, amount_minor: int | None = None, reason: str | None = None) -> stripe.Refund:
-    key = jittered_key(f"refund.{charge_id}.{amount_minor or 'full'}")
-    return stripe.Refund.create(
+    key = unique_key(f"refund.{charge_id}.{amount_minor or 'full'}")
+    c = cfg
+    ref = _call(
+        "write", stripe.Refund.create,
         charge=charge_id,
         amount=amount_minor,
         reason=reason,
         idempotency_key=key,
-        metadata=_meta({"charge_id": charge_id})
+        metadata=_meta(c, {"charge_id": charge_id}),
+        api_key=c.secret_key,
     )
+    _audit("refund", {"charge_id": charge_id, "refund_id": ref.id, "amount_minor": amount_minor, "status": ref.status})
+    return ref
 
-def get_payment_intent(pi_id: str) -> stripe.PaymentIntent:
+def get_payment_intent(pi_id: str, consistent: bool = False) -> stripe.PaymentIntent:
+    # consistent=True skips the cache (e.g. right before acting on the status)
     if not pi_id:
         return get_mock_payment_intent(pi_id)
-    return stripe.PaymentIntent.retrieve(id=pi_id, api_key=stripe.api_key)
+    return read_cache.get(
+        ("pi", pi_id),
+        lambda: _call("read", stripe.PaymentIntent.retrieve, id=pi_id),
+        bypass=consistent,
+    )
 
 def cancel_payment_intent(pi_id: str) -> stripe.PaymentIntent:
+    read_cache.invalidate(("pi", pi_id))
     try:
         # Try to cancel
-        return stripe.PaymentIntent.cancel(pi_id)
+        pi = _call("write", stripe.PaymentIntent.cancel, pi_id)
+        _audit("pi.cancel", {"pi_id": pi.id, "status": pi.status})
+        return pi
 
     except stripe.error.InvalidRequestError as e:
         # If cancel fails (e.g., already canceled or succeeded), 
         # fetch and return the current PaymentIntent object
-        print("Invalid request:", e.user_message)
-        return stripe.PaymentIntent.retrieve(pi_id)
+        log.info("cancel %s refused, returning its current state: %s", pi_id, e.user_message)
+        return _call("read", stripe.PaymentIntent.retrieve, pi_id)
 
     except stripe.error.StripeError as e:
         # For other Stripe-related errors, still try retrieving
-        print("Stripe error:", str(e))
-        return stripe.PaymentIntent.retrieve(pi_id)
+        log.warning("cancel %s failed, returning its current state: %s", pi_id, e)
+        return _call("read", stripe.PaymentIntent.retrieve, pi_id)
 
-    except Exception as e:
+    except Exception:
         # For unexpected errors, we can raise or return a dummy PaymentIntent
-        print("Unexpected error:", str(e))
+        log.exception("cancel %s failed unexpectedly, returning a mock", pi_id)
         # Return a minimal "mocked" PaymentIntent-like object
         return get_mock_payment_intent(pi_id=pi_id)
 
-def get_charge_list(pi: stripe.PaymentIntent) -> list:
-    return list(stripe.Charge.list(payment_intent=pi.id).auto_paging_iter())
+def _list_charges(pi_id: str, api_key: str | None = None) -> list:
+    return list(stripe.Charge.list(payment_intent=pi_id, api_key=api_key).auto_paging_iter())
+
+def get_charge_list(pi: stripe.PaymentIntent, consistent: bool = False) -> list:
+    return read_cache.get(
+        ("charges", pi.id),
+        lambda: _call("read", _list_charges, pi.id),
+        bypass=consistent,
+    )
 
 # customer specific handlers
 def create_customer(email: str | None = None, desc: str | None = None) -> stripe.Customer:
-    return stripe.Customer.create(email=email, description=desc)
+    return _call("write", stripe.Customer.create, email=email, description=desc)
 
-def fetch_customer(customer_id: str) -> stripe.Customer:
-    return stripe.Customer.retrieve(id=customer_id)
+def fetch_customer(customer_id: str, consistent: bool = False) -> stripe.Customer:
+    return read_cache.get(
+        ("cus", customer_id),
+        lambda: _call("read", stripe.Customer.retrieve, id=customer_id),
+        bypass=consistent,
+    )
 
 def attach_pm_to_customer(pm_id: str, customer_id: str) -> stripe.PaymentMethod:
     # Attach test PM to customer (server-only with test pm ids like pm_card_visa)
-    return stripe.PaymentMethod.attach(pm_id, customer=customer_id)
+    read_cache.invalidate(("cus", customer_id))
+    return _call("write", stripe.PaymentMethod.attach, pm_id, customer=customer_id)
 
 def set_default_pm(customer_id: str, pm_id: str) -> stripe.Customer:
-    return stripe.Customer.modify(customer_id, invoice_settings={"default_payment_method": pm_id})
+    customer = _call("write", stripe.Customer.modify, customer_id, invoice_settings={"default_payment_method": pm_id})
+    read_cache.put(("cus", customer.id), customer)
+    return customer
 
 def offsession_charge(customer_id: str, amount_minor: int, currency: str, order_id: str, payment_method: str) -> stripe.PaymentIntent: # subscription charges
     key = idem_key("pi.offsession", customer_id, str(amount_minor), currency, order_id)
-    return stripe.PaymentIntent.create(
+    c = cfg
+    pi = idem_store.execute(key, scope=account_scope(c.secret_key), fn=lambda: _call(
+        "write", stripe.PaymentIntent.create,
         amount=amount_minor, currency=currency, customer=customer_id,
         payment_method_types=["card"],
         payment_method=payment_method,
         off_session=True, confirm=True,            # immediate off-session attempt
-        metadata=_meta({"order_id": order_id}),
+        metadata=_meta(c, {"order_id": order_id}),
         idempotency_key=key,
-    )
+        api_key=c.secret_key,
+    ))
+    _audit("pi.offsession", {"order_id": order_id, "pi_id": pi.id, "customer_id": customer_id,
+                             "amount_minor": amount_minor, "currency": currency, "status": pi.status})
+    return pi
 
 
 
-def _audit(event: str, payload: dict):
-    rec = {"ts": datetime.datetime.utcnow().isoformat() + "Z", "event": event, **payload}
-    with open(AUDIT, "a") as f:
-        f.write(json.dumps(rec) + "\n")
\ No newline at end of file
+# Webhook-driven refresh: events carry the full object, so store it instead of refetching
+@webhooks.on("payment_intent.*", ordered=True)
+def _refresh_pi(event):
+    obj = event["data"]["object"]
+    read_cache.put(("pi", obj["id"]), stripe.PaymentIntent.construct_from(obj, cfg.secret_key))
+    read_cache.invalidate(("charges", obj["id"]))
+
+@webhooks.on("customer.updated", ordered=True)
+def _refresh_customer(event):
+    obj = event["data"]["object"]
+    read_cache.put(("cus", obj["id"]), stripe.Customer.construct_from(obj, cfg.secret_key))
+
+@webhooks.on("charge.*")
+def _invalidate_charges(event):
+    obj = event["data"]["object"]
+    if obj.get("payment_intent"):
+        read_cache.invalidate(("charges", obj["payment_intent"]))
+        read_cache.invalidate(("pi", obj["payment_intent"]))  # amount_received etc. changed
@@ -0,0 +1,170 @@
+# backend_async.py (asyncio mirror of backend.py on a pooled httpx client)
+#
+# Every call goes through _call: the same per-(API key, read/write) pacing and
+# transient-error retries as backend._call, built from the same Config fields, but
+# waiting with asyncio.sleep. Two parts of backend.py are deliberately not mirrored:
+#   read cache        retrieves always go to Stripe (the cache's loaders are sync)
+#   IdempotencyStore  a blocking SQLite store; creates still carry the same idem_key,
+#                     so Stripe itself dedupes a retried or double-submitted create
+import logging, time
+from typing import Any, Dict
+
+import stripe
+
+import transport
+from config import get_config
+from idem import idem_key, unique_key
+from ratelimit import Governor
+from retry import RetryPolicy
+
+log = logging.getLogger("backend_async")
+
+cfg = get_config()
+
+# One pooled client for this module, built by transport from the same Config http_*
+# fields as backend.py's. It is passed to this StripeClient only: stripe.api_key,
+# stripe.api_base and stripe.default_http_client stay backend.py's, so importing both
+# modules leaves the sync backend on its own transport. Retries are retry_policy's.
+client = stripe.StripeClient(
+    cfg.secret_key,
+    base_addresses={"api": cfg.api_base} if cfg.api_base else None,  # e.g. stripe-mock
+    http_client=transport.build_async_client(cfg),
+    max_network_retries=0,
+)
+v1 = client.v1
+
+
+_default_rps = 25.0 if cfg.secret_key.startswith(("sk_test", "rk_test")) else 100.0
+governor = Governor(
+    rates={"read": cfg.read_rps or _default_rps, "write": cfg.write_rps or _default_rps},
+    queue_timeout=cfg.queue_timeout,
+    max_concurrency=cfg.max_concurrency,
+)
+retry_policy = RetryPolicy(max_attempts=cfg.max_attempts, budget=cfg.retry_budget)
+
+def _op_name(fn) -> str:
+    # client.v1.payment_intents.create_async -> "PaymentIntent.create_async"
+    owner = getattr(fn, "__self__", None)
+    if owner is None:
+        return fn.__name__
+    return f"{type(owner).__name__.removesuffix('Service')}.{fn.__name__}"
+
+async def _call(op_class: str, fn, *args, api_key: str | None = None,
+                idempotency_key: str | None = None, **params):
+    # backend._call for coroutines: key and idempotency key fixed before the first attempt
+    op = _op_name(fn)
+    options: Dict[str, Any] = {"api_key": api_key or cfg.secret_key}
+    if op_class == "write":
+        options["idempotency_key"] = idempotency_key or unique_key(op)
+
+    async def attempt(deadline: float):
+        wait = min(governor.queue_timeout, max(0.0, deadline - time.monotonic()))
+        async with governor.slot_async(options["api_key"], op_class, timeout=wait):
+            return await fn(*args, params=params, options=options)
+
+    return await retry_policy.run_async(op, attempt)
+
+def _meta(base: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(base)
+    if cfg.app_id: out["app_id"] = cfg.app_id
+    if cfg.product_id: out["product_id"] = cfg.product_id
+    return out
+
+async def create_payment_intent(amount_minor: int, currency: str, order_id: str) -> stripe.PaymentIntent:
+    key = idem_key("pi.create", order_id, str(amount_minor), currency)
+    return await _call(
+        "write", v1.payment_intents.create_async,
+        amount=amount_minor,
+        currency=currency,
+        payment_method_types=["card"],
+        metadata=_meta({"order_id": order_id}),
+        idempotency_key=key,
+    )
+
+async def create_pi_manual_capture(amount_minor: int, currency: str, order_id: str) -> stripe.PaymentIntent:
+    key = idem_key("pi.create.manual", order_id, str(amount_minor), currency)
+    return await _call(
+        "write", v1.payment_intents.create_async,
+        amount=amount_minor,
+        currency=currency,
+        payment_method_types=["card"],
+        capture_method="manual",
+        metadata=_meta({"order_id": order_id}),
+        idempotency_key=key,
+    )
+
+async def confirm_payment_intent(pi_id: str, payment_method: str = "pm_card_visa") -> stripe.PaymentIntent:
+    key = unique_key(f"pi.confirm.{pi_id}")
+    return await _call(
+        "write", v1.payment_intents.confirm_async,
+        pi_id, payment_method=payment_method, idempotency_key=key,
+    )
+
+async def capture_payment_intent(pi_id: str, amount_to_capture: int | None = None) -> stripe.PaymentIntent:
+    key = unique_key(f"pi.capture.{pi_id}.{amount_to_capture or 'full'}")
+    return await _call(
+        "write", v1.payment_intents.capture_async,
+        pi_id, amount_to_capture=amount_to_capture, idempotency_key=key,
+    )
+
+async def refund_payment(charge_id: str, amount_minor: int | None = None, reason: str | None = None) -> stripe.Refund:
+    key = unique_key(f"refund.{charge_id}.{amount_minor or 'full'}")
+    return await _call(
+        "write", v1.refunds.create_async,
+        charge=charge_id,
+        amount=amount_minor,
+        reason=reason,
+        idempotency_key=key,
+        metadata=_meta({"charge_id": charge_id}),
+    )
+
+async def get_payment_intent(pi_id: str) -> stripe.PaymentIntent:
+    if not pi_id:
+        return stripe.PaymentIntent.construct_from(
+            {"id": pi_id, "status": "unknown", "object": "payment_intent"}, cfg.secret_key
+        )
+    return await _call("read", v1.payment_intents.retrieve_async, pi_id)
+
+async def cancel_payment_intent(pi_id: str) -> stripe.PaymentIntent:
+    try:
+        return await _call("write", v1.payment_intents.cancel_async, pi_id)
+    except stripe.error.StripeError as e:
+        # Already canceled / succeeded etc.: return the current state instead
+        log.warning("cancel %s failed, returning its current state: %s",
+                    pi_id, getattr(e, "user_message", None) or e)
+        return await _call("read", v1.payment_intents.retrieve_async, pi_id)
+
+async def _list_charges(pi_id: str, params: Dict[str, Any], options: Dict[str, Any]) -> list:
+    charges = await v1.charges.list_async(params={**params, "payment_intent": pi_id},
+                                          options=options)
+    return [c async for c in charges.auto_paging_iter()]
+
+async def get_charge_list(pi: stripe.PaymentIntent) -> list:
+    return await _call("read", _list_charges, pi.id)
+
+async def create_customer(email: str | None = None, desc: str | None = None) -> stripe.Customer:
+    return await _call("write", v1.customers.create_async, email=email, description=desc)
+
+async def fetch_customer(customer_id: str) -> stripe.Customer:
+    return await _call("read", v1.customers.retrieve_async, customer_id)
+
+async def attach_pm_to_customer(pm_id: str, customer_id: str) -> stripe.PaymentMethod:
+    return await _call("write", v1.payment_methods.attach_async, pm_id, customer=customer_id)
+
+async def set_default_pm(customer_id: str, pm_id: str) -> stripe.Customer:
+    return await _call(
+        "write", v1.customers.update_async,
+        customer_id, invoice_settings={"default_payment_method": pm_id},
+    )
+
+async def offsession_charge(customer_id: str, amount_minor: int, currency: str, order_id: str, payment_method: str) -> stripe.PaymentIntent:
+    key = idem_key("pi.offsession", customer_id, str(amount_minor), currency, order_id)
+    return await _call(
+        "write", v1.payment_intents.create_async,
+        amount=amount_minor, currency=currency, customer=customer_id,
+        payment_method_types=["card"],
+        payment_method=payment_method,
+        off_session=True, confirm=True,
+        metadata=_meta({"order_id": order_id}),
+        idempotency_key=key,
+    )
@@ -0,0 +1,286 @@
+# batch.py (bulk off-session charges: JSONL in -> JSONL out, bounded concurrency)
+#
+# Two runners over the same item handling: run_batch (threads, backend.py) for the
+# Flask server and the CLI, run_batch_async (tasks, backend_async.py) for the ASGI
+# server. Each imports its backend on first use, so a process only ever starts the
+# one it serves with.
+import asyncio, json, random, sys, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator
+
+import money
+from currency import is_valid_min
+
+
+class Pacer:
+    """Spaces call starts at least 1/max_rps apart across all worker threads."""
+
+    def __init__(self, max_rps: float | None):
+        self.interval = 1.0 / max_rps if max_rps else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        # Seconds until this call's slot
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        return slot - now
+
+    def wait(self) -> None:
+        if self.interval and (delay := self._reserve()) > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        if self.interval and (delay := self._reserve()) > 0:
+            await asyncio.sleep(delay)
+
+
+class BatchReport:
+    """Running totals plus a fixed-size reservoir of latencies for percentiles."""
+
+    RESERVOIR = 10_000
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = self.ok = self.failed = 0
+        self._lat_ms: list[float] = []
+
+    def add(self, ok: bool, ms: float) -> None:
+        self.total += 1
+        if ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        if len(self._lat_ms) < self.RESERVOIR:
+            self._lat_ms.append(ms)
+        else:
+            j = random.randrange(self.total)
+            if j < self.RESERVOIR:
+                self._lat_ms[j] = ms
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        lat = sorted(self._lat_ms)
+
+        def pct(p: float) -> float:
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 2) if lat else 0.0
+
+        return {
+            "total": self.total,
+            "ok": self.ok,
+            "failed": self.failed,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(self.total / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+        }
+
+
+class ItemRejected(Exception):
+    """An item refused before any Stripe call; str() is the error code the endpoint returns."""
+
+
+def run_params(concurrency: str = "16", max_rps: str | None = None) -> tuple[int, float | None]:
+    """
+    (concurrency, max_rps) from their text forms (query string, argv). ValueError
+    unless concurrency is an integer >= 1 and max_rps, when given, a number > 0.
+    """
+    n = int(concurrency)
+    rps = float(max_rps) if max_rps is not None else None
+    if n < 1 or (rps is not None and not rps > 0):  # `not >` also refuses NaN
+        raise ValueError(f"concurrency={concurrency!r} max_rps={max_rps!r}")
+    return n, rps
+
+
+def parse_item_amount(item: Dict[str, Any], cfg: Any) -> money.Money:
+    """
+    The item's amount, checked as /api/offsession/charge checks it: "amount_major"
+    (parsed like the endpoint's), or "amount_minor" as an int (Money.to_json's shape).
+    ItemRejected("invalid_amount") / ItemRejected("amount_below_min") otherwise.
+    """
+    currency = item.get("currency", cfg.default_currency)
+    try:
+        if "amount_minor" in item:
+            amount = money.Money(item["amount_minor"], currency)
+        else:
+            amount = money.Money.parse(item["amount_major"], currency)
+    except (KeyError, TypeError, ValueError):
+        raise ItemRejected("invalid_amount") from None
+    if not is_valid_min(amount.minor, cfg.min_amount_minor):
+        raise ItemRejected("amount_below_min")
+    return amount
+
+
+def charge_one(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One off-session charge. Item shape (as /api/offsession/charge, plus optional fields):
+    {"customer_id": "cus_x", "amount_major": 9.99, "currency": "usd", "order_id": "ord_1",
+     "payment_method": "pm_x"}   # payment_method defaults to the customer's default PM
+    "amount_minor": 999 may replace amount_major; either is validated the same way.
+    """
+    import backend
+
+    amount = parse_item_amount(item, backend.cfg)
+    payment_method = item.get("payment_method")
+    if not payment_method:
+        customer = backend.fetch_customer(customer_id=item["customer_id"])
+        payment_method = customer.invoice_settings.get("default_payment_method")
+    # offsession_charge derives its idempotency key from (customer, amount, currency, order),
+    # so re-running a batch (or a retried item) cannot double-charge
+    pi = backend.offsession_charge(
+        customer_id=item["customer_id"], amount_minor=amount.minor, currency=amount.currency,
+        order_id=item["order_id"], payment_method=payment_method,
+    )
+    return {"id": pi.id, "status": pi.status}
+
+
+async def charge_one_async(item: Dict[str, Any]) -> Dict[str, Any]:
+    """charge_one on backend_async: same item shape, same checks, same idempotency keys."""
+    import backend_async
+
+    amount = parse_item_amount(item, backend_async.cfg)
+    payment_method = item.get("payment_method")
+    if not payment_method:
+        customer = await backend_async.fetch_customer(customer_id=item["customer_id"])
+        payment_method = customer.invoice_settings["default_payment_method"]
+    pi = await backend_async.offsession_charge(
+        customer_id=item["customer_id"], amount_minor=amount.minor, currency=amount.currency,
+        order_id=item["order_id"], payment_method=payment_method,
+    )
+    return {"id": pi.id, "status": pi.status}
+
+
+def _failed(out: Dict[str, Any], e: Exception) -> None:
+    out["ok"] = False
+    if isinstance(e, ItemRejected):
+        out["error"] = str(e)  # same code as the single-charge endpoint's {"error": ...}
+    else:
+        out["error"] = getattr(e, "user_message", None) or f"{type(e).__name__}: {e}"
+
+
+def _run_item(i: int, item: Any, pacer: Pacer) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"i": i}
+    t0 = time.perf_counter()
+    try:
+        if isinstance(item, Exception):
+            raise item  # line failed to parse
+        out["order_id"] = item.get("order_id")
+        pacer.wait()
+        t0 = time.perf_counter()  # report API time, not time spent waiting for a rate slot
+        out["payment_intent"] = charge_one(item)
+        out["ok"] = True
+    except Exception as e:
+        _failed(out, e)
+    out["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return out
+
+
+async def _run_item_async(i: int, item: Any, pacer: Pacer) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"i": i}
+    t0 = time.perf_counter()
+    try:
+        if isinstance(item, Exception):
+            raise item
+        out["order_id"] = item.get("order_id")
+        await pacer.wait_async()
+        t0 = time.perf_counter()
+        out["payment_intent"] = await charge_one_async(item)
+        out["ok"] = True
+    except Exception as e:
+        _failed(out, e)
+    out["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return out
+
+
+def parse_jsonl(lines: Iterable[bytes | str]) -> Iterator[Any]:
+    """Decode JSONL lazily; a bad line becomes an exception item instead of aborting the run."""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield money.loads(line)  # amounts stay exact: JSON numbers -> Decimal
+        except ValueError as e:
+            yield e
+
+
+def run_batch(
+    items: Iterable[Any],
+    concurrency: int = 16,
+    max_rps: float | None = None,
+    report: BatchReport | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one result per item in completion order. At most 2 * concurrency items are
+    read ahead of the results, so memory stays flat regardless of batch size.
+    """
+    report = report or BatchReport()
+    pacer = Pacer(max_rps)
+    window = 2 * concurrency
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        pending = set()
+        for i, item in enumerate(items):
+            pending.add(pool.submit(_run_item, i, item, pacer))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    res = fut.result()
+                    report.add(res["ok"], res["ms"])
+                    yield res
+        for fut in as_completed(pending):
+            res = fut.result()
+            report.add(res["ok"], res["ms"])
+            yield res
+
+
+async def run_batch_async(
+    items: Iterable[Any],
+    concurrency: int = 16,
+    max_rps: float | None = None,
+    report: BatchReport | None = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    run_batch on one event loop: at most `concurrency` charges in flight and the
+    same 2 * concurrency read-ahead. Closing the generator early (the client went
+    away) cancels the items still in flight; their idempotency keys make a re-run safe.
+    """
+    report = report or BatchReport()
+    pacer = Pacer(max_rps)
+    window = 2 * concurrency
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(i: int, item: Any) -> Dict[str, Any]:
+        async with slots:
+            return await _run_item_async(i, item, pacer)
+
+    pending: set[asyncio.Task] = set()
+    try:
+        for i, item in enumerate(items):
+            pending.add(asyncio.create_task(run(i, item)))
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    res = task.result()
+                    report.add(res["ok"], res["ms"])
+                    yield res
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                res = task.result()
+                report.add(res["ok"], res["ms"])
+                yield res
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+if __name__ == "__main__":
+    # Usage:
+    # python batch.py charges.jsonl [concurrency] [max_rps] > results.jsonl
+    src = open(sys.argv[1], "rb") if len(sys.argv) > 1 and sys.argv[1] != "-" else sys.stdin.buffer
+    concurrency, max_rps = run_params(*sys.argv[2:4])
+    report = BatchReport()
+    for res in run_batch(parse_jsonl(src), concurrency, max_rps, report):
+        sys.stdout.write(json.dumps(res) + "\n")
+    print(json.dumps(report.summary()), file=sys.stderr)
@@ -0,0 +1,463 @@
+# bench.py (benchmarks for the stripe module)
+# Usage:
+#   # both servers pointed at the same Stripe host, e.g. stripe-mock: STRIPE_API_BASE=http://localhost:12111
+#   python server.py &                                   # Flask on :5051
+#   uvicorn asgi_server:app --port 5052 &                # ASGI on :5052
+#   python bench.py servers -c 200 -n 5000
+#   python bench.py config --dirs 20000          # .env discovery + Config build, cold vs warm
+#   python bench.py reload --seconds 5           # hot Config swap under concurrent readers
+#   python bench.py currency --rows 1000000      # bulk conversion vs the scalar loop
+#   python bench.py money                        # Money parse/arithmetic vs the float path
+#   python bench.py idem                         # idem/unique key throughput
+import argparse, asyncio, os, random, statistics, subprocess, sys, tempfile, threading, time
+from typing import Any, Dict, List
+
+
+def _pct(sorted_ms: List[float], p: float) -> float:
+    return round(sorted_ms[min(len(sorted_ms) - 1, int(p * len(sorted_ms)))], 2) if sorted_ms else 0.0
+
+
+def _row(name: str, n: int, elapsed: float, lat_ms: List[float], errors: int) -> Dict[str, Any]:
+    lat_ms.sort()
+    return {
+        "target": name,
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": _pct(lat_ms, 0.50),
+        "p99_ms": _pct(lat_ms, 0.99),
+    }
+
+
+def _print_rows(rows: List[Dict[str, Any]]) -> None:
+    cols = list(rows[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+
+# -------- servers: Flask (threads) vs ASGI (asyncio) under the same load --------
+async def _load(base: str, path: str, concurrency: int, total: int) -> Dict[str, Any]:
+    import httpx
+
+    lat_ms: List[float] = []
+    errors = 0
+    remaining = total
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+
+        async def worker() -> None:
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                t0 = time.perf_counter()
+                try:
+                    r = await client.get(path)
+                    if r.status_code >= 400:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                lat_ms.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    return _row(base, total, elapsed, lat_ms, errors)
+
+
+def bench_servers(args: argparse.Namespace) -> None:
+    rows = []
+    for base in (args.flask, args.asgi):
+        asyncio.run(_load(base, args.path, args.concurrency, min(args.concurrency, args.requests)))  # warm-up
+        rows.append(asyncio.run(_load(base, args.path, args.concurrency, args.requests)))
+    _print_rows(rows)
+
+
+# -------- config: startup cost of finding/parsing .env and building Config --------
+_SHARED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared", "python")
+
+# The loader auth/ used before shared/python/envfile.py, kept as the baseline
+_LEGACY = '''
+import os
+def find(d):
+    for e in os.listdir(d):
+        p = os.path.join(d, e)
+        if os.path.isfile(p) and e.startswith(".env"):
+            return p
+    for e in os.listdir(d):
+        p = os.path.join(d, e)
+        if os.path.isdir(p):
+            r = find(p)
+            if r:
+                return r
+def load(d):
+    path = find(d)
+    if path:
+        for line in open(path):
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                os.environ[k.strip()] = v.strip().strip('"').strip("'")
+'''
+_CACHED = f'''
+import os, sys
+sys.path.append({_SHARED!r})
+from envfile import find_env_file, load_env_file
+def load(d):
+    path = find_env_file(d)
+    if path:
+        load_env_file(path)
+'''
+
+
+def _make_tree(root: str, dirs: int, env_depth: int) -> None:
+    # A deploy-like tree: a few top-level apps, each a wide and deep package tree
+    made = 0
+    frontier = [root]
+    while made < dirs:
+        parent = frontier.pop(0)
+        for i in range(8):
+            path = os.path.join(parent, f"pkg{i}")
+            os.mkdir(path)
+            open(os.path.join(path, "mod.py"), "w").close()
+            frontier.append(path)
+            made += 1
+    if env_depth >= 0:
+        where = os.path.join(root, *["zz_deploy"] * env_depth)
+        os.makedirs(where, exist_ok=True)
+        with open(os.path.join(where, ".env"), "w") as f:
+            f.write("\n".join(f"KEY_{i}=value_{i}" for i in range(50)))
+
+
+def _cold_ms(loader: str, root: str, runs: int) -> float:
+    code = loader + f"import time\nt0 = time.perf_counter()\nload({root!r})\n"
+    code += "print((time.perf_counter() - t0) * 1000)"
+    out = [float(subprocess.check_output([sys.executable, "-c", code])) for _ in range(runs)]
+    return round(statistics.median(out), 2)
+
+
+def bench_config(args: argparse.Namespace) -> None:
+    sys.path.append(_SHARED)
+    import envfile
+
+    rows = []
+    for label, env_depth in (("env at depth 2", 2), ("no env file", -1)):
+        with tempfile.TemporaryDirectory() as root:
+            _make_tree(root, args.dirs, env_depth)
+            row = {"tree": f"{args.dirs} dirs, {label}",
+                   "legacy_cold_ms": _cold_ms(_LEGACY, root, args.runs),
+                   "cached_cold_ms": _cold_ms(_CACHED, root, args.runs)}
+            # Warm: the same process loads again (another module importing config)
+            path = envfile.find_env_file(root)
+            t0 = time.perf_counter()
+            for _ in range(1000):
+                path = envfile.find_env_file(root)
+                if path:
+                    envfile.read_env_file(path)
+            row["warm_us"] = round((time.perf_counter() - t0) * 1000, 2)
+            # Preloaded parent, forked worker: nothing left to do but read os.environ
+            r, w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                t0 = time.perf_counter()
+                envfile.find_env_file(root)
+                os.write(w, str((time.perf_counter() - t0) * 1e6).encode())
+                os._exit(0)
+            os.close(w)
+            row["forked_worker_us"] = round(float(os.read(r, 64)), 1)
+            os.close(r)
+            os.waitpid(pid, 0)
+            rows.append(row)
+    _print_rows(rows)
+
+
+# -------- reload: request-path cost of hot reload, and snapshot consistency --------
+def _write_env(path: str, version: int) -> None:
+    # Atomic replace, as a deploy tool (or `mv`) would: readers never see half a file
+    with open(path + ".tmp", "w") as f:
+        f.write(f"STRIPE_SECRET_KEY=sk_test_v{version}\nSTRIPE_WEBHOOK_SECRET=whsec_v{version}\n")
+        f.write(f"STRIPE_WEBHOOK_SECRET_PREVIOUS=whsec_v{version - 1}\n")
+        f.write(f"MIN_AMOUNT_MINOR={version}\n")
+    os.replace(path + ".tmp", path)
+
+
+def bench_reload(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        env_path = os.path.join(tmp, ".env")
+        _write_env(env_path, 1)
+        os.environ["STRIPE_ENV_FILE"] = env_path
+        import config
+
+        config.get_config()
+        watcher = config.ConfigWatcher(interval=args.interval).ensure_started()
+        rows = []
+        for label, churn in (("no reloads", False), (f"reload every {args.every}s", True)):
+            stop = time.perf_counter() + args.seconds
+            reads, torn = [0] * args.threads, [0] * args.threads
+            lag_ms: List[float] = []
+
+            def reader(i: int) -> None:
+                while time.perf_counter() < stop:
+                    cfg = config.get_config()  # what before_request pins
+                    v = cfg.min_amount_minor
+                    # every field of one snapshot comes from the same file version
+                    previous = cfg.webhook_secrets[1]
+                    if cfg.secret_key != f"sk_test_v{v}" or previous != f"whsec_v{v - 1}":
+                        torn[i] += 1
+                    reads[i] += 1
+
+            ts = [threading.Thread(target=reader, args=(i,)) for i in range(args.threads)]
+            for t in ts:
+                t.start()
+            version = config.get_config().min_amount_minor
+            while churn and time.perf_counter() < stop - args.every:
+                time.sleep(args.every)
+                version += 1
+                t0 = time.perf_counter()
+                _write_env(env_path, version)
+                while config.get_config().min_amount_minor != version:
+                    time.sleep(0.001)
+                lag_ms.append((time.perf_counter() - t0) * 1000)
+            for t in ts:
+                t.join()
+            lag_ms.sort()
+            rows.append({
+                "mode": label, "threads": args.threads,
+                "reads_per_s": round(sum(reads) / args.seconds), "torn_reads": sum(torn),
+                "reloads": len(lag_ms), "swap_p50_ms": _pct(lag_ms, 0.5),
+                "swap_max_ms": round(lag_ms[-1], 1) if lag_ms else 0.0,
+            })
+        _print_rows(rows)
+        print("watcher:", watcher.stats())
+
+
+# -------- currency: bulk conversion + validation vs the per-row scalar loop --------
+_OLD_ZERO_DECIMAL = {
+    "bif","clp","djf","gnf","jpy","kmf","krw","mga","pyg","rwf","ugx","vnd","vuv","xaf","xof","xpf"
+}
+
+
+def _old_to_minor_units(amount_major: float, currency: str) -> int:
+    # currency.to_minor_units before bulk conversion, kept as the baseline
+    c = currency.lower()
+    return int(round(amount_major if c in _OLD_ZERO_DECIMAL else amount_major * 100))
+
+
+def bench_currency(args: argparse.Namespace) -> None:
+    from decimal import ROUND_HALF_UP, Decimal
+
+    import currency
+
+    rng = random.Random(args.seed)
+    codes = ["usd"] * 6 + ["eur", "gbp", "jpy", "kwd", "bhd", "cad", "chf", "inr"]
+    # Prices as people write them: whole units or 1-3 decimals, cents-heavy
+    amounts = [round(rng.uniform(0, 5000), rng.choice((0, 2, 2, 2, 3))) for _ in range(args.rows)]
+    currencies = [rng.choice(codes) for _ in range(args.rows)]
+    minimum = 50
+
+    rows = []
+
+    def run(label, fn):
+        t0 = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t0
+        rows.append({"path": label, "rows": args.rows, "ms": round(elapsed * 1000, 1),
+                     "rows_per_s": round(args.rows / elapsed)})
+        return out
+
+    run("scalar loop, old float round", lambda: [
+        (m, currency.is_valid_min(m, minimum))
+        for m in (_old_to_minor_units(a, c) for a, c in zip(amounts, currencies))
+    ])
+    run("scalar loop, to_minor_units", lambda: [
+        (m, currency.is_valid_min(m, minimum))
+        for m in (currency.to_minor_units(a, c) for a, c in zip(amounts, currencies))
+    ])
+    minor, valid = run("convert_many, lists", lambda: currency.convert_many(amounts, currencies))
+    if currency.np is not None:
+        arr, cur = currency.np.array(amounts), currency.np.array(currencies)
+        a_minor, a_valid = run("convert_many, numpy", lambda: currency.convert_many(arr, cur))
+        assert a_minor.tolist() == minor and a_valid.tolist() == valid
+    else:
+        print("numpy not installed: array path skipped")
+    _print_rows(rows)
+
+    # Exactness on a sample: Decimal on the written amount is the reference
+    sample = range(0, args.rows, max(1, args.rows // 100_000))
+    wrong_old = wrong_new = 0
+    for i in sample:
+        a, c = amounts[i], currencies[i]
+        exp = currency.EXPONENTS[c]
+        want = int((Decimal(repr(a)) * 10 ** exp).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        if c in ("kwd", "bhd"):
+            continue  # the old code had no three-decimal currencies at all
+        wrong_old += _old_to_minor_units(a, c) != want
+        wrong_new += (minor[i] if valid[i] else currency.to_minor_units(a, c)) != want
+    print(f"vs Decimal on {len(sample)} rows: old float path {wrong_old} wrong, new {wrong_new} wrong")
+    if wrong_new:
+        sys.exit(1)
+
+
+# -------- money: request-path amount parsing, Money vs float --------
+def _ns_per_op(fn, args: List[Any], repeats: int = 5) -> float:
+    """Median over `repeats` runs of fn(a) for every a in args, in ns per call."""
+    return _compare_ns([fn], args, repeats)[0]
+
+
+def _compare_ns(fns: List[Any], args: List[Any], repeats: int = 7) -> List[float]:
+    """Like _ns_per_op for several fns, runs interleaved so CPU throttling hits all alike."""
+    runs: List[List[float]] = [[] for _ in fns]
+    for _ in range(repeats):
+        for fn, out in zip(fns, runs):
+            t0 = time.perf_counter_ns()
+            for a in args:
+                fn(a)
+            out.append((time.perf_counter_ns() - t0) / len(args))
+    return [statistics.median(r) for r in runs]
+
+
+def bench_money(args: argparse.Namespace) -> None:
+    import json
+    from decimal import Decimal
+
+    import currency
+    import money
+
+    rng = random.Random(args.seed)
+    catalog = [f"{rng.randint(1, 99999)}.{rng.randint(0, 99):02d}" for _ in range(args.prices)]
+    workloads = {
+        # amounts drawn from a price list (what checkout traffic looks like) ...
+        f"{args.prices} prices": [rng.choice(catalog) for _ in range(args.n)],
+        # ... and the worst case for Money.parse's cache: every amount different
+        "all distinct": [
+            f"{rng.randint(1, 99999)}.{rng.randint(0, 99):02d}" for _ in range(args.n)
+        ],
+    }
+
+    def float_path(body):
+        # what server.api_pi_new did: get_json() -> float() -> to_minor_units
+        data = json.loads(body)
+        return currency.to_minor_units(float(data["amount_major"]), data.get("currency", "usd"))
+
+    def money_path(body):
+        data = money.loads(body)
+        return money.Money.parse(data["amount_major"], data.get("currency", "usd")).minor
+
+    a, b = money.Money(1299, "usd"), money.Money(500, "usd")
+    rows = []
+    for name, prices in workloads.items():
+        bodies = [
+            f'{{"amount_major": {p}, "currency": "usd", "order_id": "ord_{i}"}}'.encode()
+            for i, p in enumerate(prices)
+        ]
+        assert [float_path(x) for x in bodies] == [money_path(x) for x in bodies]
+        cases = [
+            ("request body -> minor", float_path, money_path, bodies),
+            ("amount string -> minor",
+             lambda p: currency.to_minor_units(float(p), "usd"),
+             lambda p: money.Money.parse(p, "usd").minor, prices),
+            ("JSON Decimal -> minor",
+             lambda d: currency.to_minor_units(float(d), "usd"),
+             lambda d: money.Money.parse(d, "usd").minor, [Decimal(p) for p in prices]),
+        ]
+        for label, old, new, data in cases:
+            money._parse_exact.cache_clear()
+            old_ns, new_ns = _compare_ns([old, new], data)
+            rows.append({"workload": name, "op": label, "float_ns": round(old_ns),
+                         "money_ns": round(new_ns), "speedup": f"{old_ns / new_ns:.2f}x"})
+    # a partial refund: major-unit float arithmetic, then converted for Stripe
+    old_ns, new_ns = _compare_ns(
+        [lambda _: currency.to_minor_units(12.99 - 5.00, "usd"), lambda _: (a - b).minor], catalog
+    )
+    rows.append({"workload": "-", "op": "capture - refund", "float_ns": round(old_ns),
+                 "money_ns": round(new_ns), "speedup": f"{old_ns / new_ns:.2f}x"})
+    _print_rows(rows)
+    print("all distinct: every Money.parse misses its cache and is SLOWER than the float path"
+          " (requirement not met); it is only faster on price-list traffic")
+    split = _ns_per_op(lambda m: m.split(3), [a] * 10000)
+    print(f"Money.split(3): {split:.0f} ns; sys.getsizeof(Money) = {sys.getsizeof(a)} bytes")
+
+
+# -------- idem: key throughput --------
+# Determinism across processes and unique_key uniqueness: shared/tests/test_idem.py (pytest)
+def _old_idem_key(prefix: str = "", *parts: str) -> str:
+    # The baseline idem_key: '|'-joined parts, and str() of the hash object (its repr,
+    # with a memory address) where a digest was meant, so keys differed per process
+    import hashlib
+    base = "|".join([prefix, *[p or "" for p in parts]])
+    return "idem_" + str(hashlib.sha256(base.encode()))
+
+
+def _old_jittered_key(prefix: str) -> str:
+    salt = f"{time.time_ns()}_{os.getpid()}_{random.randint(0, 999999)}"
+    return _old_idem_key(prefix, salt)
+
+
+def bench_idem(args: argparse.Namespace) -> None:
+    import idem
+
+    rng = random.Random(args.seed)
+    calls = [
+        ("pi.offsession", f"cus_{rng.getrandbits(48):012x}", str(rng.randint(50, 10**6)), "usd",
+         f"ord_{i}")
+        for i in range(args.n)
+    ]
+    fns = [
+        lambda c: _old_idem_key(*c),
+        lambda c: idem.idem_key(*c),
+        lambda c: _old_jittered_key(c[0]),
+        lambda c: idem.unique_key(c[0]),
+    ]
+    names = ["idem_key (old, str(sha256))", "idem_key", "jittered_key (old)", "unique_key"]
+    ns = _compare_ns(fns, calls)
+    _print_rows([
+        {"fn": name, "ns_per_key": round(t), "keys_per_s": f"{1e9 / t:,.0f}",
+         "vs_old": f"{ns[0 if i < 2 else 2] / t:.2f}x"}
+        for i, (name, t) in enumerate(zip(names, ns))
+    ])
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmarks for the stripe module")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("servers", help="Flask vs ASGI throughput/latency on the same route")
+    s.add_argument("--flask", default="http://127.0.0.1:5051")
+    s.add_argument("--asgi", default="http://127.0.0.1:5052")
+    # consistent=1 keeps the Flask read cache out of the comparison
+    s.add_argument("--path", default="/api/pi/get?pi_id=pi_bench&consistent=1")
+    s.add_argument("-c", "--concurrency", type=int, default=100)
+    s.add_argument("-n", "--requests", type=int, default=2000)
+    s.set_defaults(fn=bench_servers)
+
+    s = sub.add_parser("config", help=".env discovery/parse startup time, legacy vs cached loader")
+    s.add_argument("--dirs", type=int, default=20000)
+    s.add_argument("--runs", type=int, default=5)
+    s.set_defaults(fn=bench_config)
+
+    s = sub.add_parser("reload", help="Config reads/sec with and without hot reloads")
+    s.add_argument("--seconds", type=float, default=5.0)
+    s.add_argument("--threads", type=int, default=4)
+    s.add_argument("--interval", type=float, default=0.05, help="watcher poll interval")
+    s.add_argument("--every", type=float, default=0.25, help="seconds between .env rewrites")
+    s.set_defaults(fn=bench_reload)
+
+    s = sub.add_parser("currency", help="bulk major->minor conversion + validity vs scalar loop")
+    s.add_argument("--rows", type=int, default=1_000_000)
+    s.add_argument("--seed", type=int, default=1)
+    s.set_defaults(fn=bench_currency)
+
+    s = sub.add_parser("money", help="Money parse/arithmetic vs the float amount path")
+    s.add_argument("-n", type=int, default=50_000)
+    s.add_argument("--prices", type=int, default=1000, help="distinct prices in the catalog")
+    s.add_argument("--seed", type=int, default=1)
+    s.set_defaults(fn=bench_money)
+
+    s = sub.add_parser("idem", help="idempotency key throughput")
+    s.add_argument("-n", type=int, default=100_000)
+    s.add_argument("--seed", type=int, default=1)
+    s.set_defaults(fn=bench_idem)
+
+    args = p.parse_args()
+    args.fn(args)
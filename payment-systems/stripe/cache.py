@@ -0,0 +1,108 @@
+# cache.py (read-through TTL + LRU cache for Stripe object retrieval)
+import collections, threading, time
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Missing:
+    """Negative entry: the loader said the object does not exist."""
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class TTLCache:
+    """
+    Size-bounded LRU where every entry also expires after `ttl` seconds.
+    get() is read-through: on a miss it calls the loader and stores the result.
+    If is_missing(exc) says the loader's exception means "no such object", that is
+    cached for `negative_ttl` and re-raised on later hits without calling the API.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl: float = 30.0,
+        negative_ttl: float = 5.0,
+        is_missing: Callable[[Exception], bool] = lambda exc: False,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.is_missing = is_missing
+        # key -> (value, stored_at, expires_at)
+        self._data: collections.OrderedDict[Hashable, tuple] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._negative_hits = self._bypassed = 0
+        self._evictions = self._invalidations = self._refreshes = 0
+        self._served_age_total = self._served_age_max = 0.0
+
+    def get(self, key: Hashable, loader: Callable[[], Any], bypass: bool = False) -> Any:
+        """Cached value for key, loading it on miss. bypass=True always reads through."""
+        now = time.monotonic()
+        if not bypass:
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None and entry[2] > now:
+                    self._data.move_to_end(key)
+                    value, stored_at, _ = entry
+                    age = now - stored_at
+                    self._served_age_total += age
+                    self._served_age_max = max(self._served_age_max, age)
+                    if isinstance(value, _Missing):
+                        self._negative_hits += 1
+                        raise value.error
+                    self._hits += 1
+                    return value
+                self._misses += 1
+        else:
+            with self._lock:
+                self._bypassed += 1
+
+        try:
+            value = loader()
+        except Exception as exc:
+            if self.is_missing(exc):
+                self._store(key, _Missing(exc), self.negative_ttl)
+            raise
+        self._store(key, value, self.ttl)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Refresh an entry with a value we already have (e.g. from a webhook or a write)."""
+        self._store(key, value, self.ttl)
+        with self._lock:
+            self._refreshes += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._invalidations += 1
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now, now + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = self._hits + self._negative_hits
+            lookups = served + self._misses
+            return {
+                "size": len(self._data),
+                "hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "bypassed": self._bypassed,
+                "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "refreshes": self._refreshes,
+                # Staleness: how old cached entries were when they were served
+                "served_age_avg_s": round(self._served_age_total / served, 3) if served else 0.0,
+                "served_age_max_s": round(self._served_age_max, 3),
+            }
@@ -1,5 +1,14 @@
 from dataclasses import dataclass
-import os
+from typing import Callable, Mapping
+import os, sys, threading, time
+
+# .env discovery/parsing is shared with auth/: see shared/python/envfile.py
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(_HERE, "..", "..", "shared", "python"))
+from envfile import load_env_file, read_env_file  # noqa: E402
+
+# STRIPE_ENV_FILE overrides; default is the .env next to this module
+ENV_FILE = os.environ.get("STRIPE_ENV_FILE") or os.path.join(_HERE, ".env")
 
 @dataclass(frozen=True, slots=True)
 class Config:
@@ -10,24 +19,204 @@ class Config:
     product_id: str | None
     recharge_product_id: str | None
     webhook_secret: str | None
+    webhook_secret_previous: str | None # still accepted while a webhook secret is rotated
 
     default_currency: str
     min_amount_minor: int # e.g., 100 => $1.00 USD
 
-def load_config() -> Config:
+    api_base: str | None # override Stripe API host (e.g. local stripe-mock); None => SDK default
+
+    # Outbound HTTP transport (see transport.py)
+    http_pool_size: int         # keep-alive sockets per process
+    http_connect_timeout: float # seconds
+    http_read_timeout: float    # seconds
+    http_warmup: int            # connections to open at startup (0 = off)
+    http2: bool                 # use httpx + HTTP/2 instead of requests
+
+    # Client-side pacing and retries (see ratelimit.py / retry.py)
+    read_rps: float | None      # None => 25 for a test key, 100 for a live one
+    write_rps: float | None
+    queue_timeout: float        # seconds a call may wait for a rate-limit slot
+    max_concurrency: int
+    max_attempts: int
+    retry_budget: float         # seconds for all attempts of one call, sleeps included
+
+    # Read-through cache for retrieve/list calls (see cache.py)
+    read_cache_size: int
+    read_cache_ttl: float
+    read_cache_negative_ttl: float
+
+    @property
+    def webhook_secrets(self) -> tuple[str, ...]:
+        """Secrets a webhook signature may be made with: current first."""
+        return tuple(s for s in (self.webhook_secret, self.webhook_secret_previous) if s)
+
+# Read once by the transport / rate limiter / retries / read cache at startup:
+# a change needs a restart
+RESTART_FIELDS = (
+    "http_pool_size", "http_connect_timeout", "http_read_timeout", "http_warmup", "http2",
+    "read_rps", "write_rps", "queue_timeout", "max_concurrency", "max_attempts", "retry_budget",
+    "read_cache_size", "read_cache_ttl", "read_cache_negative_ttl",
+)
 
+def load_config(env: Mapping[str, str] = os.environ) -> Config:
+    """Build a Config from `env` (default: the process environment); no caching."""
     return Config(
-        secret_key=os.environ.get("STRIPE_SECRET_KEY", ""),
-        publishable_key=os.environ.get("STRIPE_PUBLISHABLE_KEY"),
-        app_id=os.environ.get("APP_ID"),
-        product_id=os.environ.get("STRIPE_PRODUCT_ID"),
-        recharge_product_id=os.environ.get("STRIPE_RECHARGE_PRODUCT_ID"),
-        default_currency=os.environ.get("DEFAULT_CURRENCY", "usd"),
-        min_amount_minor=int(os.environ.get("MIN_AMOUNT_MINOR", "100")),
-        webhook_secret=os.environ.get("STRIPE_WEBHOOK_SECRET") or None,
+        secret_key=env.get("STRIPE_SECRET_KEY", ""),
+        publishable_key=env.get("STRIPE_PUBLISHABLE_KEY"),
+        app_id=env.get("APP_ID"),
+        product_id=env.get("STRIPE_PRODUCT_ID"),
+        recharge_product_id=env.get("STRIPE_RECHARGE_PRODUCT_ID"),
+        default_currency=env.get("DEFAULT_CURRENCY", "usd"),
+        min_amount_minor=int(env.get("MIN_AMOUNT_MINOR", "100")),
+        webhook_secret=env.get("STRIPE_WEBHOOK_SECRET") or None,
+        webhook_secret_previous=env.get("STRIPE_WEBHOOK_SECRET_PREVIOUS") or None,
+        api_base=env.get("STRIPE_API_BASE") or None,
+        http_pool_size=int(env.get("STRIPE_HTTP_POOL_SIZE", "32")),
+        http_connect_timeout=float(env.get("STRIPE_HTTP_CONNECT_TIMEOUT", "3")),
+        http_read_timeout=float(env.get("STRIPE_HTTP_READ_TIMEOUT", "30")),
+        http_warmup=int(env.get("STRIPE_HTTP_WARMUP", "4")),
+        http2=env.get("STRIPE_HTTP2", "0") == "1",
+        read_rps=float(env["STRIPE_READ_RPS"]) if env.get("STRIPE_READ_RPS") else None,
+        write_rps=float(env["STRIPE_WRITE_RPS"]) if env.get("STRIPE_WRITE_RPS") else None,
+        queue_timeout=float(env.get("STRIPE_QUEUE_TIMEOUT", "10")),
+        max_concurrency=int(env.get("STRIPE_MAX_CONCURRENCY", "64")),
+        max_attempts=int(env.get("STRIPE_MAX_ATTEMPTS", "4")),
+        retry_budget=float(env.get("STRIPE_RETRY_BUDGET", "20")),
+        read_cache_size=int(env.get("READ_CACHE_SIZE", "10000")),
+        read_cache_ttl=float(env.get("READ_CACHE_TTL", "30")),
+        read_cache_negative_ttl=float(env.get("READ_CACHE_NEGATIVE_TTL", "5")),
     )
 
-import os
+# -------- the current snapshot, and hot reload --------
+# A Config is immutable; "changing" it means building a new one and rebinding
+# _config, a single atomic assignment. Code that reads the snapshot once per
+# request (server.py pins it in before_request) finishes on the Config it started
+# with, while the next request already sees the new one.
+_config: Config | None = None
+_base_env: frozenset = frozenset()  # set by the deploy itself: the .env never overrides these
+_file_keys: frozenset = frozenset()  # supplied by the .env, so a line removed from it is unset
+_reload_lock = threading.Lock()
+_listeners: list[Callable[[Config, Config], None]] = []
+
+def get_config() -> Config:
+    """
+    The current Config: ENV_FILE (if present) is applied and the Config built on
+    the first call only, once per worker. Do not preload the app to share it across
+    a fork (gunicorn --preload): importing backend also starts threads and opens
+    sockets and SQLite connections that a forked worker cannot use.
+    """
+    global _config, _base_env, _file_keys
+    if _config is None:
+        with _reload_lock:
+            if _config is None:
+                _base_env = frozenset(os.environ)
+                if os.path.exists(ENV_FILE):
+                    _file_keys = frozenset(load_env(ENV_FILE))
+                _config = load_config()
+    return _config
+
+def on_reload(fn: Callable[[Config, Config], None]) -> Callable[[Config, Config], None]:
+    """Register fn(old, new), called after each swap (e.g. to re-point stripe.api_key)."""
+    _listeners.append(fn)
+    return fn
+
+def reload(path: str | None = None) -> Config:
+    """
+    Re-read the env file and swap in a new Config. If the new values do not build a
+    Config (e.g. MIN_AMOUNT_MINOR=abc) this raises and the old snapshot stays.
+    """
+    global _config, _file_keys
+    old = get_config()
+    values = read_env_file(path or ENV_FILE)
+    with _reload_lock:
+        env = dict(os.environ)
+        for key in _file_keys - values.keys() - _base_env:
+            env.pop(key, None)
+        env.update((k, v) for k, v in values.items() if k not in _base_env)
+        new = load_config(env)  # may raise: nothing has been touched yet
+        for key in _file_keys - values.keys() - _base_env:
+            os.environ.pop(key, None)
+        os.environ.update((k, v) for k, v in values.items() if k not in _base_env)
+        _file_keys = frozenset(values)
+        _config = new
+    for fn in _listeners:
+        fn(old, new)
+    return new
+
+class ConfigWatcher:
+    """
+    Polls the env file's mtime and size (one stat() per interval, no inotify dependency)
+    and calls reload() when they change. Threads do not survive fork(): call
+    ensure_started() in each worker; it is a no-op once this process's thread runs.
+    """
+
+    def __init__(self, path: str | None = None, interval: float = 2.0):
+        self.path = path or ENV_FILE
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._seen = self._stamp()
+        self._started = get_config()  # what the transport and rate limiter were built with
+        self.reloads = self.errors = 0
+        self.last_error: str | None = None
+        self.restart_required: list[str] = []
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_thread)
+
+    def _forget_thread(self) -> None:
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _stamp(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def check(self) -> bool:
+        """One poll: reload if the file changed. True if a new Config is now live."""
+        stamp = self._stamp()
+        if stamp is None or stamp == self._seen:
+            return False
+        self._seen = stamp
+        try:
+            new = reload(self.path)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        self.reloads += 1
+        self.restart_required = [
+            f for f in RESTART_FIELDS if getattr(self._started, f) != getattr(new, f)
+        ]
+        return True
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def ensure_started(self) -> "ConfigWatcher":
+        if self._thread is None and self.interval > 0:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="config-watcher", daemon=True
+                    )
+                    self._thread.start()
+        return self
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            # changed in the file, but only applied by a restart
+            "restart_required": list(self.restart_required),
+        }
 
 def load_env(filepath=".env"):
     """
@@ -39,19 +228,6 @@ def load_env(filepath=".env"):
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"{filepath} file not found.")
 
-    with open(filepath) as f:
-        for line in f:
-            line = line.strip()
-            # Skip comments and empty lines
-            if not line or line.startswith("#"):
-                continue
-            
-            # Split key and value
-            if "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key, value = key.strip(), value.strip().strip('"').strip("'")
-            
-            # Set environment variable if not already set
-            if key not in os.environ:
-                os.environ[key] = value
\ No newline at end of file
+    # Parsed once per file version (path + mtime); variables already set are kept
+    return load_env_file(filepath, override=False)
+
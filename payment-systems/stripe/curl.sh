@@ -25,4 +25,12 @@ curl -s localhost:5051/api/cust/attach_pm -H 'content-type: application/json' \
 curl -s localhost:5051/api/offsession/charge -H 'content-type: application/json' \
   -d '{"customer_id":"cus_...","amount_major":9.99,"currency":"usd","order_id":"ord_off_1"}' | jq
 
-# If you switch pm_id to pm_card_chargeCustomerFail, you can test off-session failure paths (e.g., expired card) and see payment_intent.status and last_payment_error.
\ No newline at end of file
+# If you switch pm_id to pm_card_chargeCustomerFail, you can test off-session failure paths (e.g., expired card) and see payment_intent.status and last_payment_error.
+# Batch off-session charges: JSONL in, JSONL results out (last line is a throughput/p99 summary)
+curl -s 'localhost:5051/api/offsession/batch?concurrency=16&max_rps=25' -H 'content-type: application/x-ndjson' \
+  --data-binary @charges.jsonl
+
+# Async variant of the same routes (one process, many Stripe calls in flight):
+#   uvicorn asgi_server:app --port 5052
+# Side-by-side load test against both servers:
+#   python bench.py servers -c 200 -n 5000
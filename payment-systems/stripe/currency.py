@@ -1,13 +1,212 @@
 # currency.py
+import math
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+try:
+    import numpy as np  # optional: array-at-a-time conversion for bulk imports
+except ImportError:
+    np = None
+
+# ISO 4217 minor-unit exponents for every active code not listed here: 2
+_ISO_EXPONENT_EXCEPTIONS = {
+    0: "bif clp djf gnf isk jpy kmf krw pyg rwf ugx uyi vnd vuv xaf xof xpf",
+    3: "bhd iqd jod kwd lyd omr tnd",
+    4: "clf uyw",
+}
+_ISO_TWO_DECIMAL = (
+    "aed afn all amd ang aoa ars aud awg azn bam bbd bdt bgn bmd bnd bob bov brl bsd btn bwp "
+    "byn bzd cad cdf che chf chw cny cop cou crc cuc cup cve czk dkk dop dzd egp ern etb eur "
+    "fjd fkp gbp gel ghs gip gmd gtq gyd hkd hnl htg huf idr ils inr irr jmd kes kgs khr kpw "
+    "kyd kzt lak lbp lkr lrd lsl mad mdl mga mkd mmk mnt mop mru mur mvr mwk mxn mxv myr mzn "
+    "nad ngn nio nok npr nzd pab pen pgk php pkr pln qar ron rsd rub sar sbd scr sdg sek sgd "
+    "shp sle sll sos srd ssp stn svc syp szl thb tjs tmt top try ttd twd tzs uah usd usn uyu "
+    "uzs ved ves wst xcd xcg yer zar zmw zwg zwl"
+)
+ISO_4217_EXPONENTS: Dict[str, int] = {c: 2 for c in _ISO_TWO_DECIMAL.split()}
+for _exp, _codes in _ISO_EXPONENT_EXCEPTIONS.items():
+    ISO_4217_EXPONENTS.update((c, _exp) for c in _codes.split())
+
+# Stripe's zero-decimal list; it differs from ISO for MGA (ISO 2) and ISK (ISO 0,
+# but Stripe takes two-decimal amounts ending in 00 for backwards compatibility)
 ZERO_DECIMAL = {
     "bif","clp","djf","gnf","jpy","kmf","krw","mga","pyg","rwf","ugx","vnd","vuv","xaf","xof","xpf"
 }
+# Exponent of the integer `amount` Stripe expects: ISO 4217 with Stripe's overrides
+EXPONENTS: Dict[str, int] = {
+    **ISO_4217_EXPONENTS, **{c: 0 for c in ZERO_DECIMAL}, "isk": 2,
+}
+# Minor amounts must be a multiple of this: three-decimal currencies end in 0, ISK in 00
+MINOR_STEP: Dict[str, int] = {"bhd": 10, "jod": 10, "kwd": 10, "omr": 10, "tnd": 10, "isk": 100}
+
+# Stripe's minimum charge per settlement currency, in minor units (others: 1)
+MIN_CHARGE_MINOR: Dict[str, int] = {
+    "usd": 50, "aed": 200, "aud": 50, "bgn": 100, "brl": 50, "cad": 50, "chf": 50, "czk": 1500,
+    "dkk": 250, "eur": 50, "gbp": 30, "hkd": 400, "huf": 17500, "inr": 50, "jpy": 50,
+    "mxn": 1000, "myr": 200, "nok": 300, "nzd": 50, "pln": 200, "ron": 200, "sek": 300,
+    "sgd": 50, "thb": 1000,
+}
+MAX_AMOUNT_MINOR = 99_999_999  # Stripe's upper bound: 8 digits
+
+_SCALES = {e: 10 ** e for e in set(EXPONENTS.values()) | {2}}
+
+def _float_to_minor(x: float, scale: int) -> int:
+    """
+    Round half up on the decimal the float was written as (its repr), not on its
+    binary value: 1.005 -> 101, where int(round(1.005 * 100)) gives 100.
+    floor() of the scaled value can be off by one either way, so the answer is settled
+    by comparing the input with the midpoint (k + 0.5) / scale: that division rounds
+    once, exactly as parsing the midpoint's decimal string would, so the comparison
+    is exact for any amount below 2**53 minor units.
+    """
+    a = abs(x)
+    k = math.floor(a * scale)
+    if a >= (k + 0.5) / scale:
+        k += 1
+    return -k if x < 0 else k
 
-def to_minor_units(amount_major: float, currency: str) -> int:
-    """Convert e.g. 12.99 USD -> 1299 (minor units).
-       For zero-decimal, 12 -> 12."""
-    c = currency.lower()
-    return int(round(amount_major if c in ZERO_DECIMAL else amount_major * 100))
+def _to_minor(amount: Any, scale: int) -> int:
+    if isinstance(amount, float):
+        if not math.isfinite(amount):
+            raise ValueError(f"amount {amount!r} is not a number")
+        return _float_to_minor(amount, scale)
+    if isinstance(amount, int):
+        return amount * scale
+    try:
+        d = amount if isinstance(amount, Decimal) else Decimal(str(amount).strip())
+        if not d.is_finite():
+            raise InvalidOperation
+        return int((d * scale).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"amount {amount!r} is not a number") from None
+
+def to_minor_units(amount_major: float | int | str | Decimal, currency: str) -> int:
+    """Convert e.g. 12.99 USD -> 1299 (minor units), 1.005 KWD -> 1005, 12 JPY -> 12.
+       Rounds half up on the decimal value; unknown currencies are taken as two-decimal."""
+    return _to_minor(amount_major, _SCALES[EXPONENTS.get(currency.lower(), 2)])
 
 def is_valid_min(amount_minor: int, min_minor: int) -> bool:
-    return amount_minor >= min_minor
\ No newline at end of file
+    return amount_minor >= min_minor
+
+# -------- bulk: millions of rows per call (batch imports, reconciliation) --------
+# Everything that depends only on the currency is looked up once per distinct code,
+# then applied per row.
+def _codes(currencies: str | Sequence[str], n: int) -> List[str]:
+    if isinstance(currencies, str):
+        return [currencies.lower()] * n
+    if len(currencies) != n:
+        raise ValueError(f"{len(currencies)} currencies for {n} amounts")
+    return [c.lower() for c in currencies]
+
+def _rules(c: str, minimums: Mapping[str, int] | int | None) -> Tuple[int, int, int, bool]:
+    """(scale, minimum, step, known) for one currency code."""
+    if minimums is None:
+        minimum = MIN_CHARGE_MINOR.get(c, 1)
+    elif isinstance(minimums, int):
+        minimum = minimums
+    else:
+        minimum = minimums.get(c, 1)
+    return _SCALES[EXPONENTS.get(c, 2)], minimum, MINOR_STEP.get(c, 1), c in EXPONENTS
+
+def convert_many(
+    amounts: Sequence[Any],
+    currencies: str | Sequence[str],
+    minimums: Mapping[str, int] | int | None = None,
+) -> Tuple[Any, Any]:
+    """
+    (minor_units, valid) for a whole column of major amounts, same rounding as
+    to_minor_units. currencies is one code for every row or one per row.
+    valid is False for rows that did not parse, unknown currencies, amounts below the
+    currency's minimum (MIN_CHARGE_MINOR, or `minimums`: one int or a per-currency
+    dict) or above MAX_AMOUNT_MINOR, and amounts that break MINOR_STEP. Invalid rows
+    get minor 0.
+
+    Lists in, lists out. A NumPy array of a numeric dtype is converted without a
+    Python-level loop and gives int64 / bool arrays back.
+    """
+    if np is not None and isinstance(amounts, np.ndarray) and amounts.dtype.kind in "iuf":
+        return _convert_array(amounts, currencies, minimums)
+    codes = _codes(currencies, len(amounts))
+    rules = {c: _rules(c, minimums) for c in set(codes)}
+    minor: List[int] = [0] * len(amounts)
+    valid: List[bool] = [False] * len(amounts)
+    floor, isfinite = math.floor, math.isfinite
+    for i, (amount, c) in enumerate(zip(amounts, codes)):
+        scale, minimum, step, known = rules[c]
+        if type(amount) is float and isfinite(amount) and amount >= 0:
+            # _float_to_minor inlined: the common case, and the call costs more than the work
+            k = floor(amount * scale)
+            if amount >= (k + 0.5) / scale:
+                k += 1
+        else:
+            try:
+                k = _to_minor(amount, scale)
+            except (ValueError, TypeError):
+                continue
+        if known and minimum <= k <= MAX_AMOUNT_MINOR and k % step == 0:
+            minor[i], valid[i] = k, True
+    return minor, valid
+
+def is_valid_min_many(
+    amounts_minor: Sequence[int],
+    currencies: str | Sequence[str],
+    minimums: Mapping[str, int] | int | None = None,
+) -> Any:
+    """Validity mask for amounts already in minor units (same rules as convert_many)."""
+    if np is not None and isinstance(amounts_minor, np.ndarray):
+        _, minimum, step, known = _array_rules(currencies, len(amounts_minor), minimums)
+        return _array_mask(amounts_minor.astype(np.int64, copy=False), minimum, step, known)
+    codes = _codes(currencies, len(amounts_minor))
+    rules = {c: _rules(c, minimums) for c in set(codes)}
+    out = []
+    for m, c in zip(amounts_minor, codes):
+        _, minimum, step, known = rules[c]
+        out.append(known and minimum <= m <= MAX_AMOUNT_MINOR and m % step == 0)
+    return out
+
+def _array_rules(currencies: str | Sequence[str], n: int, minimums: Any) -> Tuple[Any, ...]:
+    """Per-row (scale, minimum, step, known) arrays: rules per distinct code, then a gather."""
+    if isinstance(currencies, str):
+        table, index = [_rules(currencies.lower(), minimums)], np.zeros(n, dtype=np.intp)
+    else:
+        if len(currencies) != n:
+            raise ValueError(f"{len(currencies)} currencies for {n} amounts")
+        codes = np.asarray(currencies)
+        if codes.dtype == np.dtype("<U3"):
+            # ISO codes are three ASCII letters: read the code points as a base-26 number
+            # (| 0x20 lowercases), so no string sorting or per-row .lower() is needed
+            cp = codes.view(np.uint32).reshape(n, 3) | 0x20
+            letters = ((cp >= 97) & (cp <= 122)).all(axis=1)
+            key = np.where(letters, ((cp[:, 0] - 97) * 26 + cp[:, 1] - 97) * 26 + cp[:, 2] - 97, 0)
+            present = np.flatnonzero(np.bincount(key[letters], minlength=1))
+            slot = np.zeros(26 ** 3, dtype=np.intp)
+            slot[present] = np.arange(1, len(present) + 1)
+            index = np.where(letters, slot[key], 0)
+            names = ["".join(chr(97 + k // 26 ** i % 26) for i in (2, 1, 0)) for k in present]
+            table = [_rules("", minimums)] + [_rules(c, minimums) for c in names]
+        else:
+            uniq, index = np.unique(codes.astype(str), return_inverse=True)
+            table = [_rules(str(c).lower(), minimums) for c in uniq]
+    return tuple(
+        np.array([row[i] for row in table], dtype=dtype)[index]
+        for i, dtype in enumerate((np.int64, np.int64, np.int64, bool))
+    )
+
+def _array_mask(minor: Any, minimum: Any, step: Any, known: Any) -> Any:
+    return known & (minor >= minimum) & (minor <= MAX_AMOUNT_MINOR) & (minor % step == 0)
+
+def _convert_array(amounts: Any, currencies: str | Sequence[str], minimums: Any) -> Tuple[Any, Any]:
+    scale, minimum, step, known = _array_rules(currencies, len(amounts), minimums)
+    if amounts.dtype.kind == "f":
+        x = amounts.astype(np.float64, copy=False)
+        fscale = scale.astype(np.float64)
+        ok = np.isfinite(x) & (np.abs(x) * fscale < 2.0 ** 53)
+        a = np.where(ok, np.abs(x), 0.0)
+        k = np.floor(a * fscale)
+        k += a >= (k + 0.5) / fscale  # the midpoint rule of _float_to_minor
+        minor = np.copysign(k, x).astype(np.int64)
+    else:
+        ok = np.ones(len(amounts), dtype=bool)
+        minor = amounts.astype(np.int64) * scale
+    valid = ok & _array_mask(minor, minimum, step, known)
+    return np.where(valid, minor, 0), valid
@@ -0,0 +1,122 @@
+# dedupe.py (at-least-once webhook delivery -> effectively-once handling)
+import collections, os, sqlite3, threading, time
+from typing import Any, Dict
+
+
+class DedupeCache:
+    """
+    Bounded LRU of event ids with a TTL. check_and_mark() is O(1) on the in-memory
+    path; with db_path set, misses fall through to a SQLite table so redeliveries
+    are still caught after a restart or an LRU eviction.
+    """
+
+    def __init__(
+        self, max_size: int = 100_000, ttl: float = 3 * 24 * 3600, db_path: str | None = None
+    ):
+        # Stripe retries for up to 3 days, so that is the default TTL
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen: collections.OrderedDict[str, float] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen_events"
+                " (event_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM seen_events WHERE seen_at < ?", (time.time() - ttl,))
+
+    def check_and_mark(self, event_id: str) -> bool:
+        """True if event_id was seen within the TTL; otherwise marks it and returns False."""
+        now = time.time()
+        with self._lock:
+            seen_at = self._seen.get(event_id)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._seen.move_to_end(event_id)
+                self._hits += 1
+                return True
+            if self._db is not None and not self._mark_persistent(event_id, now):
+                self._remember(event_id, now)
+                self._hits += 1
+                return True
+            self._remember(event_id, now)
+            self._misses += 1
+            return False
+
+    def forget(self, event_id: str) -> None:
+        """Undo a mark, e.g. when the event could not be enqueued after all."""
+        with self._lock:
+            self._seen.pop(event_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM seen_events WHERE event_id = ?", (event_id,))
+
+    def _remember(self, event_id: str, now: float) -> None:
+        self._seen[event_id] = now
+        self._seen.move_to_end(event_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def _mark_persistent(self, event_id: str, now: float) -> bool:
+        # Insert, or refresh an expired row; rowcount 0 means a live row already exists
+        cur = self._db.execute(
+            "INSERT INTO seen_events (event_id, seen_at) VALUES (?, ?)"
+            " ON CONFLICT (event_id) DO UPDATE SET seen_at = excluded.seen_at"
+            " WHERE seen_events.seen_at < ?",
+            (event_id, now, now - self.ttl),
+        )
+        return cur.rowcount == 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._seen),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
+
+
+class ObjectSequencer:
+    """
+    Tracks the newest event `created` timestamp per object id (e.g. a payment_intent),
+    so an event older than one already applied is reported stale instead of
+    overwriting newer state. Bounded LRU like DedupeCache.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._latest: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stale = self._applied = 0
+
+    def is_stale(self, object_id: str, created: int) -> bool:
+        """False (and records `created`) if the event is at least as new as the last one seen."""
+        with self._lock:
+            latest = self._latest.get(object_id)
+            # `created` has 1s resolution: equal timestamps are not treated as stale
+            if latest is not None and created < latest:
+                self._stale += 1
+                return True
+            self._latest[object_id] = created
+            self._latest.move_to_end(object_id)
+            while len(self._latest) > self.max_size:
+                self._latest.popitem(last=False)
+            self._applied += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tracked": len(self._latest), "applied": self._applied, "stale": self._stale}
+
+
+def cache_from_env() -> DedupeCache:
+    """The servers' webhook dedupe: WEBHOOK_DEDUPE_SIZE, WEBHOOK_DEDUPE_DB (unset => in-memory)."""
+    return DedupeCache(
+        max_size=int(os.environ.get("WEBHOOK_DEDUPE_SIZE", "100000")),
+        db_path=os.environ.get("WEBHOOK_DEDUPE_DB") or None,
+    )
@@ -0,0 +1,147 @@
+# idem_store.py (answer duplicate requests locally instead of round-tripping to Stripe)
+import hashlib, json, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+DAY = 24 * 3600  # Stripe keeps idempotency keys for 24h
+
+
+def account_scope(api_key: str) -> str:
+    """Short fingerprint of an API key: scopes stored responses without storing the key."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class IdempotencyStore:
+    """
+    (scope, key) -> completed response, persisted in SQLite; the most recent
+    `max_cached` are also kept in memory. scope is the API account (account_scope()),
+    so after a key rotation to another account the old account's responses never replay.
+
+    execute(key, fn, scope):
+      - completed within the TTL   -> replay the stored response, no network call
+      - in flight in this process  -> wait for that call and share its result (coalescing)
+      - otherwise                  -> run fn once, store its response, wake any waiters
+    Failures are never stored: the next attempt runs again, with the same key, so
+    Stripe's own idempotency still covers a call that half-succeeded. Neither is a
+    failure to store a response (e.g. "database is locked"): it is counted, and the
+    caller and any waiters still get the result.
+    """
+
+    def __init__(
+        self,
+        path: str = "idempotency.db",
+        ttl: float = DAY,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+        max_cached: int = 10_000,
+    ):
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.encode = encode
+        self.decode = decode
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses"
+            " (key TEXT PRIMARY KEY, response TEXT NOT NULL, completed_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        # key -> (encoded response, completed_at), least recently used first
+        self._done: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._replayed = self._coalesced = self._executed = 0
+        self._writes = self._store_errors = 0
+        self._last_store_error: str | None = None
+        self._prune()
+
+    def _remember(self, key: str, hit: tuple[str, float]) -> None:
+        # caller holds _lock
+        self._done[key] = hit
+        self._done.move_to_end(key)
+        if len(self._done) > self.max_cached:
+            self._done.popitem(last=False)
+
+    def execute(self, key: str, fn: Callable[[], Any], scope: str = "") -> Any:
+        key = f"{scope}:{key}" if scope else key
+        with self._lock:
+            hit = self._done.get(key)
+            if hit is None:
+                # Completed earlier than the memory cache reaches, or by another worker
+                hit = self._db.execute(
+                    "SELECT response, completed_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if hit is not None:
+                    self._remember(key, hit)
+            if hit is not None and time.time() - hit[1] < self.ttl:
+                self._replayed += 1
+                return self.decode(hit[0])
+            fut = self._inflight.get(key)
+            if fut is None:
+                fut = self._inflight[key] = Future()
+                leader = True
+            else:
+                self._coalesced += 1
+                leader = False
+        if not leader:
+            return fut.result()  # re-raises the leader's exception, if any
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            raise
+        try:
+            self._store(key, result)
+        finally:
+            # whatever happened to the write, waiters are woken and the key is released
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._executed += 1
+            fut.set_result(result)
+        return result
+
+    def _store(self, key: str, result: Any) -> None:
+        try:
+            encoded = self.encode(result)
+            now = time.time()
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, completed_at)"
+                    " VALUES (?, ?, ?)",
+                    (key, encoded, now),
+                )
+                self._remember(key, (encoded, now))
+                self._writes += 1
+                prune = self._writes % 1000 == 0
+            if prune:
+                self._prune()
+        except Exception as e:
+            with self._lock:
+                self._store_errors += 1
+                self._last_store_error = f"{type(e).__name__}: {e}"
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE completed_at < ?", (cutoff,))
+            for key in [k for k, (_, at) in self._done.items() if at < cutoff]:
+                del self._done[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._replayed + self._coalesced + self._executed
+            return {
+                "cached": len(self._done),
+                "inflight": len(self._inflight),
+                "replayed": self._replayed,
+                "coalesced": self._coalesced,
+                "executed": self._executed,
+                "store_errors": self._store_errors,
+                "last_store_error": self._last_store_error,
+                "saved_calls_ratio": (
+                    round((self._replayed + self._coalesced) / total, 4) if total else 0.0
+                ),
+            }
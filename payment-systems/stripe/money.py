@@ -0,0 +1,249 @@
+# money.py (exact money value: integer minor units + currency, never a float)
+import json
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache, total_ordering
+from operator import attrgetter
+from typing import Any, List, Sequence
+
+from currency import EXPONENTS, MINOR_STEP
+
+_POW10 = [10 ** e for e in range(max(EXPONENTS.values()) + 1)]
+
+
+def _exponent(currency: str) -> tuple[int, str]:
+    exp = EXPONENTS.get(currency)
+    if exp is None:
+        if type(currency) is not str:
+            raise TypeError(f"currency must be a str, not {type(currency).__name__}")
+        currency = currency.lower()
+        exp = EXPONENTS.get(currency)
+        if exp is None:
+            raise ValueError(f"unknown currency {currency!r}")
+    return exp, currency
+
+
+@total_ordering
+class Money:
+    """
+    An amount in integer minor units of one currency (what Stripe's `amount` takes).
+    Immutable: minor and currency are read-only, arithmetic returns new values, and
+    mixing currencies raises ValueError.
+    """
+
+    __slots__ = ("_minor", "_currency")
+
+    def __init__(self, minor: int, currency: str):
+        if type(minor) is not int:
+            raise TypeError(f"minor units must be an int, not {type(minor).__name__}")
+        self._minor = minor
+        self._currency = _exponent(currency)[1]
+
+    minor = property(attrgetter("_minor"))
+    currency = property(attrgetter("_currency"))
+
+    @classmethod
+    def parse(cls, amount_major: str | int | Decimal | float, currency: str) -> "Money":
+        """
+        Money from a major amount as sent by a client: "12.99", 12, Decimal("12.99").
+        Never rounds: a negative amount, or more decimals than the currency has
+        ("12.999" USD; trailing zeros are fine), raises ValueError.
+        Faster than float() + to_minor_units only for repeated amounts (cache hits);
+        a never-seen amount is about half as fast (see PARSE_CACHE_SIZE).
+        """
+        kind = type(amount_major)
+        if kind is str:
+            return _parse_exact(amount_major, currency)
+        if kind is Decimal:
+            return _parse_exact(str(amount_major), currency)  # hash(Decimal) costs ~4x str()
+        if kind is bool:
+            raise TypeError("amount must be a number, not a bool")
+        exp, currency = _exponent(currency)
+        if isinstance(amount_major, int):
+            if amount_major < 0:
+                raise ValueError(f"amount {amount_major!r} is negative")
+            return _make(amount_major * _POW10[exp], currency)
+        if isinstance(amount_major, float):
+            return _make(_strict_minor(repr(amount_major), exp), currency)  # as written
+        raise TypeError(f"amount must be a number, not {kind.__name__}")
+
+    @property
+    def major(self) -> Decimal:
+        """Exact major amount, e.g. Decimal("12.99")."""
+        return Decimal(self._minor).scaleb(-EXPONENTS[self._currency])
+
+    # -------- value semantics --------
+    def __repr__(self) -> str:
+        return f"Money({self._minor}, {self._currency!r})"
+
+    def __str__(self) -> str:
+        exp = EXPONENTS[self._currency]
+        sign, digits = ("-" if self._minor < 0 else ""), str(abs(self._minor)).rjust(exp + 1, "0")
+        if exp:
+            digits = f"{digits[:-exp]}.{digits[-exp:]}"
+        return f"{sign}{digits} {self._currency.upper()}"
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self._minor == other._minor and self._currency == other._currency
+
+    def __hash__(self) -> int:
+        return hash((self._minor, self._currency))
+
+    def __lt__(self, other: "Money") -> bool:
+        return self._minor < self._same(other)._minor
+
+    def __bool__(self) -> bool:
+        return self._minor != 0
+
+    # -------- arithmetic (captures, refunds, splits) --------
+    def _same(self, other: Any) -> "Money":
+        if not isinstance(other, Money):
+            raise TypeError(f"expected Money, got {type(other).__name__}")
+        if other._currency != self._currency:
+            raise ValueError(f"currency mismatch: {self._currency} vs {other._currency}")
+        return other
+
+    def __add__(self, other: "Money") -> "Money":
+        if type(other) is not Money or other._currency != self._currency:
+            self._same(other)
+        return _make(self._minor + other._minor, self._currency)
+
+    def __sub__(self, other: "Money") -> "Money":
+        if type(other) is not Money or other._currency != self._currency:
+            self._same(other)
+        return _make(self._minor - other._minor, self._currency)
+
+    def __neg__(self) -> "Money":
+        return _make(-self._minor, self._currency)
+
+    def __mul__(self, factor: int) -> "Money":
+        if type(factor) is not int:
+            return NotImplemented  # scaling by a fraction needs a rounding rule: use allocate()
+        return _make(self._minor * factor, self._currency)
+
+    __rmul__ = __mul__
+
+    def allocate(self, weights: Sequence[int]) -> List["Money"]:
+        """
+        Split in proportion to integer weights, e.g. a refund across line items.
+        The parts always add up to exactly self: leftover units go to the largest
+        remainders (earlier parts win ties). Works in MINOR_STEP units so every part
+        stays a valid Stripe amount; an amount that is itself off-step leaves its
+        odd units on the first part.
+        """
+        total = sum(weights)
+        if not weights or total <= 0 or any(w < 0 for w in weights):
+            raise ValueError("weights must be non-negative with a positive sum")
+        step = MINOR_STEP.get(self._currency, 1)
+        units, odd = divmod(self._minor, step)
+        shares = [divmod(units * w, total) for w in weights]
+        parts = [q for q, _ in shares]
+        by_remainder = sorted(range(len(weights)), key=lambda i: -shares[i][1])
+        for i in by_remainder[: units - sum(parts)]:
+            parts[i] += 1
+        parts[0] = parts[0] * step + odd
+        return [_make(p if i == 0 else p * step, self._currency) for i, p in enumerate(parts)]
+
+    def split(self, n: int) -> List["Money"]:
+        """n parts as equal as possible, e.g. installments: 10.00 / 3 -> 3.34, 3.33, 3.33."""
+        return self.allocate([1] * n)
+
+    def to_json(self) -> dict:
+        return {"amount_minor": self._minor, "currency": self._currency}
+
+
+def _make(minor: int, currency: str, _new=object.__new__) -> Money:
+    # Money(...) without __init__'s checks, for values already known to be valid
+    m = _new(Money)
+    m._minor = minor
+    m._currency = currency
+    return m
+
+
+def _strict_minor(text: str, exp: int) -> int:
+    # Everything but plain digits: "+5", "1E+2", " 12.99 ", "12.990". Non-numbers,
+    # negatives and amounts that would need rounding raise ValueError
+    if not text.isascii():
+        raise ValueError(f"amount {text!r} is not a number")  # Decimal would take "١٢"
+    try:
+        d = Decimal(text.strip())
+    except InvalidOperation:
+        raise ValueError(f"amount {text!r} is not a number") from None
+    if not d.is_finite():
+        raise ValueError(f"amount {text!r} is not a number")
+    if d < 0:
+        raise ValueError(f"amount {text!r} is negative")
+    minor = d.scaleb(exp)
+    if minor != minor.to_integral_value():
+        raise ValueError(f"amount {text!r} has more than {exp} decimals")
+    return int(minor)
+
+
+# Money is immutable, so equal inputs can share one instance: request amounts come
+# from a price list far more often than not, and a hit skips the parse and the
+# allocation (one C-level lookup, cheaper than float() + to_minor_units). Keys are
+# the amount's text: floats stay out, since they are parsed from their repr.
+#
+# The requirement that Money.parse beat the float path is NOT met for amounts that
+# do not repeat. Every such call is a miss: lru bookkeeping (~40% of the miss) plus
+# the digit split plus allocating a Money, against float() + to_minor_units, which
+# allocates nothing. `python bench.py money`, "all distinct": ~0.45-0.5x the float
+# path for strings and Decimals, ~0.95x for a whole request body. Only price-list
+# traffic (repeated amounts) is faster, ~1.2-2x.
+PARSE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_exact(text: str, currency: str, _new=object.__new__) -> Money:
+    exp = EXPONENTS.get(currency)
+    if exp is None:
+        exp, currency = _exponent(currency)
+    # Plain ASCII digits with at most `exp` decimals: the int straight from the digits,
+    # no Decimal. isdigit() rejects signs, spaces, exponents, "_" and a second "."
+    digits = text.replace(".", "", 1)
+    if digits.isdigit() and digits.isascii():
+        n = len(text)
+        if n > exp and text[n - exp - 1] == ".":
+            pad = 0  # exactly `exp` decimals, the usual shape: no find()
+        else:
+            pad = exp if len(digits) == n else exp + text.find(".") + 1 - n
+        if pad >= 0:
+            m = _new(Money)
+            m._minor = int(digits) * _POW10[pad] if pad else int(digits)
+            m._currency = currency
+            return m
+    return _make(_strict_minor(text, exp), currency)
+
+
+# -------- JSON hooks --------
+# Decode: JSON numbers with a fraction become Decimal (exact) instead of float, and an
+# object that is exactly {"amount_minor": int, "currency": str} comes back as Money.
+# The decoder is built once: json.loads(s, parse_float=...) would build one per call.
+def _object_hook(obj: dict) -> Any:
+    if len(obj) == 2 and type(obj.get("amount_minor")) is int and type(obj.get("currency")) is str:
+        try:
+            return Money(obj["amount_minor"], obj["currency"])
+        except ValueError:
+            pass
+    return obj
+
+
+_DECODER = json.JSONDecoder(parse_float=Decimal, object_hook=_object_hook)
+
+
+def loads(raw: str | bytes) -> Any:
+    return _DECODER.decode(raw.decode() if isinstance(raw, bytes) else raw)
+
+
+def json_default(o: Any) -> Any:
+    """json.dumps(..., default=json_default): Money as its to_json(), Decimal as a string."""
+    if isinstance(o, Money):
+        return o.to_json()
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> str:
+    return json.dumps(obj, default=json_default)
@@ -0,0 +1,225 @@
+# ratelimit.py (client-side pacing for outbound Stripe calls)
+import asyncio, contextlib, threading, time
+from typing import Any, AsyncIterator, Dict, Iterator
+
+
+class RateLimitTimeout(Exception):
+    """No token / concurrency slot became free before the caller's deadline."""
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/s, up to `burst` banked."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token now and return 0.0, or return the seconds until one is due."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, deadline: float) -> None:
+        """Take one token, sleeping as needed; RateLimitTimeout if past `deadline` (monotonic)."""
+        while wait := self.reserve():
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"no token within deadline (rate={self.rate}/s)")
+            time.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight calls. Each success grows the limit by ~1 per window
+    (limit += 1/limit); a 429 halves it; latency well above the best observed
+    baseline shrinks it gently, so we back off before Stripe starts rejecting.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(initial)
+        self._inflight = 0
+        self._baseline_ms: float | None = None  # slowly-rising minimum latency
+        self._cond = threading.Condition()
+        self._throttled = self._decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, deadline: float) -> None:
+        with self._cond:
+            while self._inflight >= self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RateLimitTimeout(f"concurrency limit {self.limit} saturated")
+                self._cond.wait(remaining)
+            self._inflight += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free now (for callers that must not block)."""
+        with self._cond:
+            if self._inflight >= self.limit:
+                return False
+            self._inflight += 1
+            return True
+
+    def release(self, latency_ms: float | None, throttled: bool = False) -> None:
+        """latency_ms=None returns the slot without a sample (the call never ran)."""
+        with self._cond:
+            self._inflight -= 1
+            if latency_ms is not None and throttled:
+                self._throttled += 1
+                self._decreases += 1
+                self._limit = max(self.min_limit, self._limit / 2)
+            elif latency_ms is not None:
+                base = self._baseline_ms
+                # Track the floor, but let it drift up so one lucky fast call doesn't pin it
+                self._baseline_ms = latency_ms if base is None else min(latency_ms, base * 1.01)
+                if base is not None and latency_ms > base * self.latency_tolerance:
+                    self._decreases += 1
+                    self._limit = max(self.min_limit, self._limit * 0.9)
+                else:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "inflight": self._inflight,
+                "baseline_ms": round(self._baseline_ms or 0.0, 2),
+                "throttled": self._throttled,
+                "decreases": self._decreases,
+            }
+
+
+class Governor:
+    """
+    One token bucket + adaptive concurrency limit per (api key, endpoint class),
+    shared by every thread in the process. Usage:
+
+        with governor.slot(api_key, "write"):
+            stripe.PaymentIntent.create(...)
+    """
+
+    def __init__(
+        self, rates: Dict[str, float], queue_timeout: float = 10.0, max_concurrency: int = 64
+    ):
+        self.rates = rates  # endpoint class -> requests/s, e.g. {"read": 25, "write": 25}
+        self.queue_timeout = queue_timeout
+        self.max_concurrency = max_concurrency
+        self._lanes: Dict[tuple, tuple[TokenBucket, AdaptiveConcurrency]] = {}
+        self._lock = threading.Lock()
+        self._calls = self._timeouts = 0
+        self._queued_ms_total = 0.0
+
+    def _lane(self, api_key: str, op_class: str) -> tuple[TokenBucket, AdaptiveConcurrency]:
+        lane = self._lanes.get((api_key, op_class))
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.setdefault(
+                    (api_key, op_class),
+                    (
+                        TokenBucket(self.rates[op_class]),
+                        AdaptiveConcurrency(max_limit=self.max_concurrency),
+                    ),
+                )
+        return lane
+
+    @contextlib.contextmanager
+    def slot(self, api_key: str, op_class: str, timeout: float | None = None) -> Iterator[None]:
+        bucket, conc = self._lane(api_key, op_class)
+        t0 = time.monotonic()
+        deadline = t0 + (self.queue_timeout if timeout is None else timeout)
+        try:
+            conc.acquire(deadline)
+        except RateLimitTimeout:
+            self._count(timeout=True)
+            raise
+        try:
+            bucket.acquire(deadline)
+        except RateLimitTimeout:
+            conc.release(None)
+            self._count(timeout=True)
+            raise
+        started = time.monotonic()
+        self._count(queued_ms=(started - t0) * 1000)
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = getattr(e, "http_status", None) == 429
+            raise
+        finally:
+            conc.release((time.monotonic() - started) * 1000, throttled=throttled)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(
+        self, api_key: str, op_class: str, timeout: float | None = None
+    ) -> AsyncIterator[None]:
+        """slot() for asyncio callers: the same lanes, but waits never block the event loop."""
+        bucket, conc = self._lane(api_key, op_class)
+        t0 = time.monotonic()
+        deadline = t0 + (self.queue_timeout if timeout is None else timeout)
+        while not conc.try_acquire():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count(timeout=True)
+                raise RateLimitTimeout(f"concurrency limit {conc.limit} saturated")
+            await asyncio.sleep(min(0.01, remaining))  # a release cannot wake a coroutine
+        while wait := bucket.reserve():
+            if time.monotonic() + wait > deadline:
+                conc.release(None)
+                self._count(timeout=True)
+                raise RateLimitTimeout(f"no token within deadline (rate={bucket.rate}/s)")
+            await asyncio.sleep(wait)
+        started = time.monotonic()
+        self._count(queued_ms=(started - t0) * 1000)
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = getattr(e, "http_status", None) == 429
+            raise
+        finally:
+            conc.release((time.monotonic() - started) * 1000, throttled=throttled)
+
+    def _count(self, timeout: bool = False, queued_ms: float = 0.0) -> None:
+        with self._lock:
+            if timeout:
+                self._timeouts += 1
+            else:
+                self._calls += 1
+                self._queued_ms_total += queued_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lanes = dict(self._lanes)
+            out: Dict[str, Any] = {
+                "calls": self._calls,
+                "queue_timeouts": self._timeouts,
+                "queued_ms_avg": (
+                    round(self._queued_ms_total / self._calls, 3) if self._calls else 0.0
+                ),
+            }
+        # Lanes are labelled by the key's last 4 chars, never the whole secret
+        for (api_key, op_class), (_, conc) in lanes.items():
+            out[f"{op_class}@...{api_key[-4:]}"] = conc.stats()
+        return out
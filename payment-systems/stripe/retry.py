@@ -0,0 +1,106 @@
+# retry.py (retry transient Stripe failures without minting new idempotency keys)
+import asyncio, random, threading, time
+from typing import Any, Awaitable, Callable, Dict
+
+import stripe
+
+
+def is_retryable(exc: Exception) -> bool:
+    """True for transient failures (network, 409 lock contention, 429, 5xx)."""
+    headers = getattr(exc, "headers", None) or {}
+    hint = headers.get("Stripe-Should-Retry") if hasattr(headers, "get") else None
+    if hint is not None:
+        return hint == "true"  # Stripe's own verdict wins when it gives one
+    if isinstance(exc, stripe.error.APIConnectionError):
+        return True
+    if isinstance(exc, stripe.error.RateLimitError):
+        return True
+    terminal = (
+        stripe.error.CardError,
+        stripe.error.InvalidRequestError,
+        stripe.error.AuthenticationError,
+        stripe.error.PermissionError,
+        stripe.error.IdempotencyError,
+    )
+    if isinstance(exc, terminal):
+        return False
+    status = getattr(exc, "http_status", None)
+    return isinstance(exc, stripe.error.StripeError) and (status == 409 or (status or 0) >= 500)
+
+
+class RetryPolicy:
+    """
+    Capped full-jitter backoff: sleep uniform(0, min(cap, base * 2^attempt)).
+    The whole operation, sleeps included, must finish within `budget` seconds.
+    The callable is re-invoked as-is, so an idempotency key computed before the
+    first attempt is reused by every retry and Stripe can dedupe them.
+    """
+
+    def __init__(
+        self, max_attempts: int = 4, base: float = 0.25, cap: float = 4.0, budget: float = 20.0
+    ):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+        self._lock = threading.Lock()
+        # op -> [calls, retries, gave_up, retry_seconds]
+        self._ops: Dict[str, list] = {}
+
+    def run(self, op: str, fn: Callable[[float], Any]) -> Any:
+        """Call fn(deadline) until it succeeds, fails terminally, or runs out of attempts/budget."""
+        deadline = time.monotonic() + self.budget
+        retries, retrying_since, gave_up = 0, None, False
+        try:
+            while True:
+                try:
+                    return fn(deadline)
+                except Exception as e:
+                    retryable = is_retryable(e)
+                    delay = random.uniform(0, min(self.cap, self.base * 2**retries))
+                    out_of_budget = time.monotonic() + delay >= deadline
+                    if not retryable or retries + 1 >= self.max_attempts or out_of_budget:
+                        gave_up = retryable
+                        raise
+                    retrying_since = retrying_since or time.monotonic()
+                    retries += 1
+                    time.sleep(delay)
+        finally:
+            self._record(op, retries, gave_up, retrying_since)
+
+    async def run_async(self, op: str, fn: Callable[[float], Awaitable[Any]]) -> Any:
+        """run() for coroutines: same policy and stats, sleeping with asyncio.sleep."""
+        deadline = time.monotonic() + self.budget
+        retries, retrying_since, gave_up = 0, None, False
+        try:
+            while True:
+                try:
+                    return await fn(deadline)
+                except Exception as e:
+                    retryable = is_retryable(e)
+                    delay = random.uniform(0, min(self.cap, self.base * 2**retries))
+                    out_of_budget = time.monotonic() + delay >= deadline
+                    if not retryable or retries + 1 >= self.max_attempts or out_of_budget:
+                        gave_up = retryable
+                        raise
+                    retrying_since = retrying_since or time.monotonic()
+                    retries += 1
+                    await asyncio.sleep(delay)
+        finally:
+            self._record(op, retries, gave_up, retrying_since)
+
+    def _record(self, op: str, retries: int, gave_up: bool, retrying_since: float | None) -> None:
+        spent = time.monotonic() - retrying_since if retrying_since else 0.0
+        with self._lock:
+            s = self._ops.setdefault(op, [0, 0, 0, 0.0])
+            s[0] += 1
+            s[1] += retries
+            s[2] += int(gave_up)
+            s[3] += spent
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                op: {"calls": c, "retries": r, "gave_up": g, "retry_seconds": round(t, 3)}
+                for op, (c, r, g, t) in self._ops.items()
+            }
@@ -1,24 +1,57 @@
 # server.py
 import os, json
-from flask import Flask, jsonify, request
-from config import load_config, load_env
-from currency import to_minor_units, is_valid_min
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from currency import is_valid_min
+import money
 import backend
+import batch
+import transport
+import webhooks
+import webhook_handlers  # noqa: F401  (registers the handlers)
+from dedupe import ObjectSequencer, cache_from_env
 
 app = Flask(__name__)
 
+@app.before_request
+def pin_config():
+    # One Config snapshot per request: a reload mid-request does not mix old and new values
+    g.cfg = backend.cfg
+    backend.config_watcher.ensure_started()  # per worker: threads do not survive fork
+
+def parse_amount(data) -> money.Money:
+    # Bodies are decoded by money.loads (JSON numbers -> Decimal): amounts never touch a float
+    return money.Money.parse(data["amount_major"], data.get("currency", g.cfg.default_currency))
+
 @app.get("/health")
 def health():
-    return {"ok": True, "app_id": backend.cfg.app_id}
+    return {"ok": True, "app_id": g.cfg.app_id}
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "audit": backend.audit_writer.stats(),
+        "read_cache": backend.read_cache.stats(),
+        "stripe_governor": backend.governor.stats(),
+        "stripe_retries": backend.retry_policy.stats(),
+        "idempotency": backend.idem_store.stats(),
+        "http_transport": transport.STATS.snapshot(),
+        "webhooks": wh_queue.stats(),
+        "webhook_dedupe": wh_dedupe.stats(),
+        "webhook_sequencer": wh_queue.sequencer.stats(),
+        "config": backend.config_watcher.stats(),
+    }
 
 @app.post("/api/pi/new")
 def api_pi_new():
     # Expect JSON: {"amount_major": 12.99, "currency": "usd", "order_id": "ord_123"}
-    data = request.get_json(force=True)
-    amt_minor = to_minor_units(float(data["amount_major"]), data.get("currency", backend.cfg.default_currency))
-    if not is_valid_min(amt_minor, backend.cfg.min_amount_minor):
+    try:
+        data = money.loads(request.get_data())
+        amount = parse_amount(data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_amount"}), 400
+    if not is_valid_min(amount.minor, g.cfg.min_amount_minor):
         return jsonify({"error": "amount_below_min"}), 400
-    pi = backend.create_payment_intent(amt_minor, data.get("currency", backend.cfg.default_currency), data["order_id"])
+    pi = backend.create_payment_intent(amount.minor, amount.currency, data["order_id"])
     return jsonify({"payment_intent": {"id": pi.id, "status": pi.status}})
 
 @app.post("/api/pi/confirm")
@@ -30,11 +63,14 @@ def api_pi_confirm():
 
 @app.post("/api/pi/new_manual")
 def api_pi_new_manual():
-    data = request.get_json(force=True)
-    amt_minor = to_minor_units(float(data["amount_major"]), data.get("currency", backend.cfg.default_currency))
-    if not is_valid_min(amt_minor, backend.cfg.min_amount_minor):
+    try:
+        data = money.loads(request.get_data())
+        amount = parse_amount(data)
+    except (TypeError, ValueError):
+        return {"error":"invalid_amount"}, 400
+    if not is_valid_min(amount.minor, g.cfg.min_amount_minor):
         return {"error":"amount_below_min"}, 400
-    pi = backend.create_pi_manual_capture(amt_minor, data.get("currency", backend.cfg.default_currency), data["order_id"])
+    pi = backend.create_pi_manual_capture(amount.minor, amount.currency, data["order_id"])
     return {"payment_intent": {"id": pi.id, "status": pi.status}}
 
 @app.post("/api/pi/capture")
@@ -53,7 +89,7 @@ def api_pi_cancel():
 def api_pi_get():
     # Expect pi_id
     params = request.args.to_dict()
-    pi = backend.get_payment_intent(params.get("pi_id"))
+    pi = backend.get_payment_intent(params.get("pi_id"), consistent=params.get("consistent") == "1")
     return jsonify({"payment_intent": pi})
 
 @app.post("/api/refund") # refund can only happen once the charge is captured
@@ -67,7 +103,7 @@ def api_pi_refund():
 @app.post("/api/cust/new")
 def api_cust_new():
     data = request.get_json(force=True) # {"email":"x@y.com"}
-    c = backend.create_customer(email=data.get("email"), desc=f"APP: {backend.cfg.app_id}")
+    c = backend.create_customer(email=data.get("email"), desc=f"APP: {g.cfg.app_id}")
     return {"customer": {"id": c.id, "email": c.email}}
 
 @app.post("/api/cust/attach_pm")
@@ -81,48 +117,83 @@ def api_attach_pm():
 @app.post("/api/offsession/charge")
 def api_offsession_charge():
     # {"customer_id":"cus_xxx","amount_major":9.99,"currency":"usd","order_id":"ord_off_1"}
-    data = request.get_json(force=True)
-    amount_major = float(data["amount_major"])
-    currency = data.get("currency", backend.cfg.default_currency)
+    try:
+        data = money.loads(request.get_data())
+        amount = parse_amount(data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_amount"}), 400
+    if not is_valid_min(amount.minor, g.cfg.min_amount_minor):
+        return jsonify({"error": "amount_below_min"}), 400
     customer_id = data.get("customer_id")
     order_id = data.get("order_id")
-    amt_minor = to_minor_units(amount_major=amount_major, currency=currency)
     customer = backend.fetch_customer(customer_id=customer_id)
     payment_method = customer.invoice_settings.get("default_payment_method")
-    pi = backend.offsession_charge(customer_id=customer_id, amount_minor=amt_minor, currency=currency, order_id=order_id, payment_method=payment_method)
+    pi = backend.offsession_charge(customer_id=customer_id, amount_minor=amount.minor, currency=amount.currency, order_id=order_id, payment_method=payment_method)
     return jsonify({"payment_intent": {"id": pi.id, "status": pi.status}})
 
+@app.post("/api/offsession/batch")
+def api_offsession_batch():
+    # Body: JSONL, one /api/offsession/charge payload per line (optionally "payment_method")
+    # Response: JSONL, one result per item in completion order, then a {"summary": ...} line
+    # Optional per-run cap below the backend's shared limiter, to leave headroom for live traffic
+    try:
+        concurrency, max_rps = batch.run_params(
+            request.args.get("concurrency", "16"), request.args.get("max_rps")
+        )
+    except ValueError:
+        return jsonify({"error": "invalid_param"}), 400
+
+    def generate():
+        report = batch.BatchReport()
+        for res in batch.run_batch(batch.parse_jsonl(request.stream), concurrency, max_rps, report):
+            yield json.dumps(res) + "\n"
+        yield json.dumps({"summary": report.summary()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# -------- Webhooks: verify + enqueue on the request thread, handle on the worker pool --------
+wh_dedupe = cache_from_env()
+wh_queue = webhooks.queue_from_env(sequencer=ObjectSequencer()).start()
+
 @app.post("/webhooks/stripe")
 def webhooks_stripe():
     payload = request.data
     sig_header = request.headers.get("Stripe-Signature")
-    event = None
-
-    if backend.cfg.webhook_secret:
-        # Secure mode: verify signature
-        try:
-            event = backend.stripe.Webhook.construct_event(payload=payload, sig_header=sig_header, secret=backend.cfg.webhook_secret)
-        except Exception:
-            pass
+
+    if g.cfg.webhook_secrets:
+        # Secure mode: verify signature. While a secret is rotated, events signed with the
+        # previous one (STRIPE_WEBHOOK_SECRET_PREVIOUS) are still accepted
+        event = None
+        for secret in g.cfg.webhook_secrets:
+            try:
+                event = backend.stripe.Webhook.construct_event(payload=payload, sig_header=sig_header, secret=secret)
+                break
+            except Exception:
+                continue
+        if event is None:
+            return {"error": "invalid_signature"}, 400
     else:
         # Dev-insecure: parse JSON without verification (OK for local learning only)
         event = request.get_json(force=True)
-    
-    etype = event["type"]
-    data = event["data"]["object"]
-
-    # Minimal handlers - ideally DB/audit logic goes here
-    if etype == "payment_intent.succeeded":
-        print(f"[WH] PI succeeded: {data['id']}")
-    elif etype == "charge.refunded":
-        print(f"[WH] Charge refunded: {data['id']} amount={data['amount_refunded']}")
-    elif etype == "payment_intent.payment_failed":
-        print(f"[WH] PI failed: {data['id']} reason={data.get('last_payment_error')}")
-    else:
-        print(f"[WH] Unhandled event: {etype}")
 
+    # Redelivery of an event we already accepted: ack without doing the work again
+    event_id = event.get("id")
+    if event_id and wh_dedupe.check_and_mark(event_id):
+        return {"received": True, "duplicate": True}
+
+    # Durable once this returns; handlers run later on the worker pool
+    try:
+        wh_queue.enqueue(payload, event_id=event_id, etype=event["type"])
+    except Exception:
+        if event_id:
+            wh_dedupe.forget(event_id)  # let Stripe's retry through
+        raise
     return {"received": True}
 
+@app.get("/webhooks/dead_letters")
+def webhooks_dead_letters():
+    return jsonify({"dead_letters": wh_queue.dead_letters(int(request.args.get("limit", "100")))})
+
 
 
 
@@ -0,0 +1,160 @@
+# transport.py (shared keep-alive HTTP transport for the stripe SDK)
+import ssl, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config import Config
+
+
+class TransportStats:
+    """Requests sent vs connections opened: reuse_rate = 1 - new_connections / requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = self.new_connections = 0
+        self.handshake_ms_total = self.handshake_ms_max = 0.0
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def on_connect(self, ms: float) -> None:
+        with self._lock:
+            self.new_connections += 1
+            self.handshake_ms_total += ms
+            self.handshake_ms_max = max(self.handshake_ms_max, ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            n, c = self.requests, self.new_connections
+            return {
+                "requests": n,
+                "new_connections": c,
+                "reuse_rate": round(1 - c / n, 4) if n else 0.0,
+                "handshake_ms_avg": round(self.handshake_ms_total / c, 2) if c else 0.0,
+                "handshake_ms_max": round(self.handshake_ms_max, 2),
+            }
+
+
+STATS = TransportStats()
+
+
+# urllib3 opens sockets in Connection.connect() (TCP + TLS for https), so timing it
+# gives handshake cost, and counting it gives how often the pool had nothing to reuse.
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        STATS.on_connect((time.perf_counter() - t0) * 1000)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        STATS.on_connect((time.perf_counter() - t0) * 1000)
+
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPPool, "https": _TimedHTTPSPool}
+
+    def send(self, request, **kwargs):
+        STATS.on_request()
+        return super().send(request, **kwargs)
+
+
+def build_session(pool_size: int) -> requests.Session:
+    """One session per process; pool_block=True caps sockets at pool_size per host."""
+    session = requests.Session()
+    adapter = InstrumentedAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)  # local stripe-mock
+    return session
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """
+    stripe.HTTPXClient on a sized httpx pool. The SDK's constructor takes neither
+    limits nor http2 (it builds bare httpx clients), so the clients are rebuilt here
+    with the SDK's own TLS settings plus ours.
+    """
+
+    def __init__(self, timeout: Any, limits: Any, http2: bool = False,
+                 allow_sync_methods: bool = False):
+        super().__init__(timeout=timeout, allow_sync_methods=allow_sync_methods)
+        kwargs: Dict[str, Any] = {"limits": limits, "http2": http2}
+        kwargs["verify"] = (
+            ssl.create_default_context(cafile=stripe.ca_bundle_path)
+            if self._verify_ssl_certs else False
+        )
+        self._client_async = self.httpx.AsyncClient(**kwargs)
+        self._client = self.httpx.Client(**kwargs) if allow_sync_methods else None
+
+
+def build_client(cfg: Config) -> tuple[Any, requests.Session | None]:
+    """
+    SDK HTTP client shared by every backend call (keep-alive, sized pool, per-call
+    timeouts), plus its requests.Session when there is one to warm up / instrument.
+    """
+    if cfg.http2:
+        import httpx  # optional: HTTP/2 multiplexes calls over a few connections (needs h2)
+
+        client = PooledHTTPXClient(
+            timeout=httpx.Timeout(cfg.http_read_timeout, connect=cfg.http_connect_timeout),
+            limits=httpx.Limits(max_connections=cfg.http_pool_size),
+            http2=True,
+            allow_sync_methods=True,
+        )
+        return client, None
+    session = build_session(cfg.http_pool_size)
+    client = stripe.RequestsClient(
+        timeout=(cfg.http_connect_timeout, cfg.http_read_timeout), session=session
+    )
+    return client, session
+
+
+def build_async_client(cfg: Config) -> PooledHTTPXClient:
+    """
+    The asyncio counterpart of build_client, from the same Config fields: one httpx
+    pool whose keep-alive connections every *_async call reuses. Hand it to a
+    stripe.StripeClient rather than installing it as stripe.default_http_client.
+    """
+    import httpx
+
+    return PooledHTTPXClient(
+        timeout=httpx.Timeout(cfg.http_read_timeout, connect=cfg.http_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=cfg.http_pool_size,
+            max_keepalive_connections=cfg.http_pool_size,
+        ),
+        http2=cfg.http2,
+    )
+
+
+def warm_up(session: requests.Session, base_url: str, connections: int) -> None:
+    """Open `connections` sockets concurrently so the first real calls skip the TLS handshake."""
+
+    def ping(_):
+        try:
+            session.head(base_url, timeout=5)
+        except requests.RequestException:
+            pass  # warm-up is best effort
+
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="http-warmup") as pool:
+        list(pool.map(ping, range(connections)))
@@ -0,0 +1,25 @@
+# webhook_handlers.py (event handlers both servers register with webhooks.on)
+import webhooks
+
+
+@webhooks.on("payment_intent.succeeded")
+def on_pi_succeeded(event):
+    data = event["data"]["object"]
+    print(f"[WH] PI succeeded: {data['id']}")
+
+
+@webhooks.on("charge.refunded")
+def on_charge_refunded(event):
+    data = event["data"]["object"]
+    print(f"[WH] Charge refunded: {data['id']} amount={data['amount_refunded']}")
+
+
+@webhooks.on("payment_intent.payment_failed")
+def on_pi_failed(event):
+    data = event["data"]["object"]
+    print(f"[WH] PI failed: {data['id']} reason={data.get('last_payment_error')}")
+
+
+@webhooks.on("*")
+def on_unhandled(event):
+    print(f"[WH] Unhandled event: {event['type']}")
@@ -0,0 +1,305 @@
+# webhooks.py (durable webhook ingestion queue + worker pool)
+import collections, json, logging, os, random, sqlite3, threading, time, traceback
+from typing import Any, Callable, Dict, List, Set
+from dedupe import ObjectSequencer
+
+Handler = Callable[[Dict[str, Any]], None]
+log = logging.getLogger("webhooks")
+
+# event type -> handlers. A key may be an exact type ("charge.refunded"), a family
+# ("charge.*"), or "*", which only runs when nothing more specific matched.
+HANDLERS: Dict[str, List[Handler]] = {}
+# Handlers that write the event's object as current state (cache refreshes): they
+# must not apply an event older than one already applied. Every other handler
+# (notifications, fulfilment) runs for every event, whatever its order.
+ORDERED: Set[Handler] = set()
+
+
+def on(event_type: str, ordered: bool = False) -> Callable[[Handler], Handler]:
+    """
+    Register a handler: @on("payment_intent.succeeded") or @on("payment_intent.*").
+    ordered=True skips it for events older than the newest applied to the same object.
+    """
+    def register(fn: Handler) -> Handler:
+        HANDLERS.setdefault(event_type, []).append(fn)
+        if ordered:
+            ORDERED.add(fn)
+        return fn
+    return register
+
+
+def dispatch(
+    event: Dict[str, Any], is_stale: Callable[[Dict[str, Any]], bool] | None = None
+) -> bool:
+    """
+    Run the handlers for event["type"]. `is_stale` is asked once, and only if an
+    ordered handler matched; True skips the ordered handlers. Returns whether it did.
+    """
+    etype = event["type"]
+    family = etype.split(".", 1)[0] + ".*"
+    handlers = (HANDLERS.get(etype, []) + HANDLERS.get(family, [])) or HANDLERS.get("*", [])
+    stale = is_stale is not None and any(h in ORDERED for h in handlers) and is_stale(event)
+    for handler in handlers:
+        if not (stale and handler in ORDERED):
+            handler(event)
+    return stale
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id     TEXT,
+    type         TEXT,
+    payload      BLOB NOT NULL,
+    enqueued_at  REAL NOT NULL,
+    available_at REAL NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    inflight     INTEGER NOT NULL DEFAULT 0,
+    claimed_at   REAL,
+    claim        TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ready ON events (inflight, available_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id          INTEGER PRIMARY KEY,
+    event_id    TEXT,
+    type        TEXT,
+    payload     BLOB NOT NULL,
+    enqueued_at REAL NOT NULL,
+    failed_at   REAL NOT NULL,
+    attempts    INTEGER NOT NULL,
+    error       TEXT
+);
+"""
+
+
+class WebhookQueue:
+    """
+    SQLite-backed queue: the request thread only inserts the raw payload and returns;
+    `workers` threads claim rows, dispatch them through HANDLERS and retry failures
+    with capped jittered backoff. After max_attempts a row moves to dead_letters.
+    A claim is a lease: a row claimed more than `lease` seconds ago (its process
+    died mid-handle) is claimable again, by any process sharing the file. Keep
+    `lease` well above the slowest handler, or an event can be handled twice.
+    """
+
+    def __init__(
+        self,
+        path: str = "webhooks.db",
+        workers: int = 4,
+        max_attempts: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 60.0,
+        sequencer: ObjectSequencer | None = None,
+        lease: float = 300.0,
+    ):
+        self.workers = workers
+        self.lease = lease
+        self.sequencer = sequencer
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: durable across app crashes
+        self._db.executescript(_SCHEMA)
+        cols = {r[1] for r in self._db.execute("PRAGMA table_info(events)")}
+        if "claim" not in cols:  # file from before leases: its claims count as expired
+            self._db.execute("ALTER TABLE events ADD COLUMN claimed_at REAL")
+            self._db.execute("ALTER TABLE events ADD COLUMN claim TEXT")
+
+        self._lock = threading.Lock()  # one connection, serialised access
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        self._handled = self._retried = self._dead = self._skipped_stale = 0
+        self._reclaimed = self._errors = 0
+        self._last_error: str | None = None
+        self._latency_ms: collections.deque = collections.deque(maxlen=1024)
+
+    # -------- producer side --------
+    def enqueue(
+        self, payload: bytes, event_id: str | None = None, etype: str | None = None
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO events (event_id, type, payload, enqueued_at, available_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (event_id, etype, payload, now, now),
+            )
+        with self._wake:
+            self._wake.notify()
+
+    # -------- worker pool --------
+    def start(self) -> "WebhookQueue":
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _claim(self) -> tuple | None:
+        now = time.time()
+        claim = os.urandom(8).hex()  # per claim, not per process: forked workers differ too
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, event_id, type, payload, enqueued_at, attempts, inflight"
+                    " FROM events WHERE available_at <= ?"
+                    " AND (inflight = 0 OR COALESCE(claimed_at, 0) < ?)"
+                    " ORDER BY available_at, id LIMIT 1",
+                    (now, now - self.lease),
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE events SET inflight = 1, claimed_at = ?, claim = ? WHERE id = ?",
+                        (now, claim, row[0]),
+                    )
+                    self._reclaimed += row[6]
+                self._db.execute("COMMIT")
+            except BaseException:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                raise
+        return (*row[:6], claim) if row else None
+
+    def _next_wakeup(self) -> float:
+        with self._lock:
+            (at,) = self._db.execute(
+                "SELECT MIN(available_at) FROM events WHERE inflight = 0"
+            ).fetchone()
+        return 1.0 if at is None else min(1.0, max(0.0, at - time.time()))
+
+    def _work(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+                if row is None:
+                    with self._wake:
+                        self._wake.wait(self._next_wakeup())
+                    continue
+                self._handle(*row)
+                failures = 0
+            except Exception as e:
+                # The queue itself failed (locked or full disk, ...): the row, if any, is
+                # still leased, so nothing is lost. Back off and keep the worker alive.
+                failures += 1
+                with self._lock:
+                    self._errors += 1
+                    self._last_error = f"{type(e).__name__}: {e}"
+                log.exception("webhook worker error (%d in a row)", failures)
+                self._stop.wait(min(0.05 * 2**failures, self.backoff_cap))
+
+    def _is_stale(self, event: Dict[str, Any]) -> bool:
+        # Out-of-order delivery: is the event older than one already applied to its object?
+        obj_id = (event.get("data", {}).get("object") or {}).get("id")
+        created = event.get("created")
+        if self.sequencer is None or not obj_id or created is None:
+            return False
+        return self.sequencer.is_stale(obj_id, created)
+
+    def _handle(self, rid, event_id, etype, payload, enqueued_at, attempts, claim) -> None:
+        stale = False
+        try:
+            event = json.loads(payload)
+            stale = dispatch(event, self._is_stale)  # stale: only ordered handlers skipped
+        except Exception:
+            self._fail(rid, claim, attempts + 1, traceback.format_exc(limit=5))
+            return
+        with self._lock:
+            # Only while still ours: after an expired lease the new holder finishes the row
+            self._db.execute("DELETE FROM events WHERE id = ? AND claim = ?", (rid, claim))
+            self._skipped_stale += stale
+            self._handled += 1
+            self._latency_ms.append((time.time() - enqueued_at) * 1000)
+
+    def _fail(self, rid: int, claim: str, attempts: int, error: str) -> None:
+        now = time.time()
+        with self._lock:
+            if attempts >= self.max_attempts:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.execute(
+                        "INSERT INTO dead_letters"
+                        " SELECT id, event_id, type, payload, enqueued_at, ?, ?, ? FROM events"
+                        " WHERE id = ? AND claim = ?",
+                        (now, attempts, error, rid, claim),
+                    )
+                    self._db.execute("DELETE FROM events WHERE id = ? AND claim = ?", (rid, claim))
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+                    raise
+                self._dead += 1
+            else:
+                # Full jitter: uniform(0, min(cap, base * 2^attempts))
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempts))
+                self._db.execute(
+                    "UPDATE events SET inflight = 0, attempts = ?, available_at = ?"
+                    " WHERE id = ? AND claim = ?",
+                    (attempts, now + delay, rid, claim),
+                )
+                self._retried += 1
+
+    # -------- introspection --------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            depth, inflight = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(inflight), 0) FROM events"
+            ).fetchone()
+            (dead_total,) = self._db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()
+            lat = sorted(self._latency_ms)
+            handled, retried, dead = self._handled, self._retried, self._dead
+            skipped_stale = self._skipped_stale
+            reclaimed, errors, last_error = self._reclaimed, self._errors, self._last_error
+
+        def pct(p: float) -> float:
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 3) if lat else 0.0
+
+        return {
+            "depth": depth,
+            "inflight": inflight,
+            "handled": handled,
+            "skipped_stale": skipped_stale,
+            "retried": retried,
+            "dead_lettered": dead,
+            "dead_letters_total": dead_total,
+            "reclaimed_leases": reclaimed,
+            "worker_errors": errors,
+            "last_worker_error": last_error,
+            "enqueue_to_handle_ms_p50": pct(0.50),
+            "enqueue_to_handle_ms_p99": pct(0.99),
+            "enqueue_to_handle_ms_max": round(lat[-1], 3) if lat else 0.0,
+        }
+
+    def dead_letters(self, limit: int = 100) -> list[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, event_id, type, failed_at, attempts, error FROM dead_letters"
+                " ORDER BY failed_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        cols = ("id", "event_id", "type", "failed_at", "attempts", "error")
+        return [dict(zip(cols, r)) for r in rows]
+
+
+def queue_from_env(sequencer: ObjectSequencer | None = None) -> WebhookQueue:
+    """The servers' queue (not yet started): WEBHOOK_QUEUE_DB / _WORKERS / _MAX_ATTEMPTS."""
+    return WebhookQueue(
+        path=os.environ.get("WEBHOOK_QUEUE_DB", "webhooks.db"),
+        workers=int(os.environ.get("WEBHOOK_WORKERS", "4")),
+        max_attempts=int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "5")),
+        sequencer=sequencer,
+    )
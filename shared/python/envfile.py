@@ -0,0 +1,115 @@
+import os
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+# ---------------------------------------------------------
+# CACHED .env DISCOVERY AND PARSING (shared by auth/ and payment-systems/stripe/)
+# ---------------------------------------------------------
+# Both trees used to find and parse their .env on every import: auth walked the
+# WHOLE directory tree below the working directory (two listdir() + a stat per
+# entry, per directory), stripe re-read the file on each load. On a large deploy
+# tree that is seconds of worker boot.
+#
+#   find_env_file   breadth-first os.scandir, at most max_depth levels down, not
+#                   entering hidden dirs (.git, .venv), node_modules, __pycache__.
+#                   Closest match wins; a found path is remembered per process,
+#                   a miss is not (the file may be created later).
+#   read_env_file   parsed once per (path, mtime, size); later calls cost one stat()
+#   load_env_file   read_env_file + apply to os.environ
+#
+# A prefork master can load the .env before forking: the children inherit os.environ
+# and these caches and do no file work at all. Only the .env, though: do not import
+# the apps themselves in the master (no gunicorn --preload). stripe's backend and
+# server start threads and open sockets and SQLite connections at import, and none of
+# those are usable in a forked child.
+
+_SKIP_DIRS = {"node_modules", "__pycache__", "site-packages"}
+
+_found: Dict[Tuple[str, int, str], str] = {}
+_parsed: Dict[str, Tuple[int, int, Mapping[str, str]]] = {}  # path -> (mtime_ns, size, values)
+stats = {"searches": 0, "dirs_scanned": 0, "parses": 0, "cache_hits": 0}
+
+
+def find_env_file(start: str = ".", max_depth: int = 3, prefix: str = ".env") -> Optional[str]:
+    """
+    Path of the first file named `prefix`* in `start` or up to max_depth directories
+    below it (nearest level first, names sorted within a directory), else None.
+    """
+    key = (os.path.abspath(start), max_depth, prefix)
+    cached = _found.get(key)
+    if cached is not None and os.path.isfile(cached):
+        return cached
+
+    stats["searches"] += 1
+    result = None
+    level = [key[0]]
+    for depth in range(max_depth + 1):
+        next_level = []
+        for directory in level:
+            stats["dirs_scanned"] += 1
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                # d_type from scandir: no extra stat() per entry
+                if entry.name.startswith(prefix) and entry.is_file():
+                    result = entry.path
+                    break
+                if (
+                    depth < max_depth
+                    and entry.is_dir(follow_symlinks=False)
+                    and not entry.name.startswith(".")
+                    and entry.name not in _SKIP_DIRS
+                ):
+                    next_level.append(entry.path)
+            if result:
+                break
+        if result or not next_level:
+            break
+        level = next_level
+    if result:
+        _found[key] = result
+    else:
+        _found.pop(key, None)
+    return result
+
+
+def _parse(path: str) -> Dict[str, str]:
+    values = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            # Skip empty lines or comments
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            # Split KEY=VALUE (first '=' only), drop surrounding quotes
+            key, value = line.split("=", 1)
+            values[key.strip()] = value.strip().strip('"').strip("'")
+    return values
+
+
+def read_env_file(path: str) -> Mapping[str, str]:
+    """KEY -> value from a .env file (read-only view); re-parsed only when the file changes."""
+    st = os.stat(path)
+    hit = _parsed.get(path)
+    if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        stats["cache_hits"] += 1
+        return hit[2]
+    stats["parses"] += 1
+    values = MappingProxyType(_parse(path))
+    _parsed[path] = (st.st_mtime_ns, st.st_size, values)
+    return values
+
+
+def load_env_file(path: str, override: bool = False) -> Mapping[str, str]:
+    """
+    Apply a .env file to os.environ and return its values. override=False keeps
+    variables already set in the environment (the deploy's own settings win).
+    """
+    values = read_env_file(path)
+    for key, value in values.items():
+        if override or key not in os.environ:
+            os.environ[key] = value
+    return values
@@ -0,0 +1,124 @@
+# test_audit.py (payment-systems/stripe/audit.py: segments, sidecar index, lookup, recovery)
+import json
+import os
+import sys
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import audit  # noqa: E402
+
+
+def _rec(i, **extra):
+    return {"event": "pi.create", "order_id": f"ord_{i % 7}", "pi_id": f"pi_{i}", "n": i, **extra}
+
+
+# ---------------------------------------------------------
+# SEALED SEGMENTS: sorted sidecar index, lookup by binary search
+# ---------------------------------------------------------
+def test_lookup_after_seal_matches_a_scan(tmp_path):
+    base = str(tmp_path / "audit.log")
+    log = audit.SegmentedLog(base, segment_bytes=2048)
+    records = [_rec(i) for i in range(300)]
+    for i in range(0, len(records), 10):
+        log.append_batch(records[i:i + 10])
+    log.close()
+
+    segments = audit.list_segments(base)
+    assert len(segments) > 3
+    for _, path in segments:
+        with open(path + ".idx", "rb") as f:
+            keys = [line.split(b"\t")[0] for line in f]
+        assert keys == sorted(keys)
+
+    for field, value in [("order_id", "ord_3"), ("pi_id", "pi_0"), ("pi_id", "pi_299")]:
+        expected = [r for r in records if r[field] == value]
+        assert list(audit.lookup(base, field, value)) == expected  # oldest segment first
+    assert list(audit.lookup(base, "order_id", "ord_missing")) == []
+    assert list(audit.lookup(base, "order_id", "ord_")) == []  # a prefix is not a match
+
+
+def test_lookup_spans_sealed_and_active_segments(tmp_path):
+    base = str(tmp_path / "audit.log")
+    log = audit.SegmentedLog(base, segment_bytes=512)
+    records = [_rec(i) for i in range(40)]
+    for rec in records:
+        log.append_batch([rec])
+    assert not os.path.exists(log.path + ".idx")  # the last segment is still active
+
+    expected = [r for r in records if r["order_id"] == "ord_2"]
+    assert list(log.lookup("order_id", "ord_2")) == expected
+    # Another reader has no in-memory index for the active segment: it scans that one
+    assert list(audit.lookup(base, "order_id", "ord_2")) == expected
+    log.close()
+
+
+def test_unindexable_values_are_not_indexed(tmp_path):
+    base = str(tmp_path / "audit.log")
+    log = audit.SegmentedLog(base)
+    records = [{"order_id": "a\tb"}, {"order_id": "c\nd"}, {"order_id": 5}, {"order_id": "ok"}]
+    log.append_batch(records)
+    log.close()
+    offset = sum(len(json.dumps(r)) + 1 for r in records[:3])
+    with open(audit.list_segments(base)[0][1] + ".idx", "rb") as f:
+        assert f.read() == b"order_id:ok\t%d\n" % offset
+
+
+def test_lookup_rejects_unindexed_fields(tmp_path):
+    with pytest.raises(ValueError):
+        list(audit.lookup(str(tmp_path / "audit.log"), "email", "x"))
+
+
+# ---------------------------------------------------------
+# RECOVERY: an orphaned segment is resumed, its torn tail dropped
+# ---------------------------------------------------------
+def test_orphan_segment_is_resumed_and_reindexed(tmp_path):
+    base = str(tmp_path / "audit.log")
+    path = audit._segment_path(base, 1)
+    with open(path, "wb") as f:  # a writer that died mid-append, before sealing
+        f.write(b"".join((json.dumps(_rec(i)) + "\n").encode() for i in range(3)))
+        f.write(b'{"order_id": "ord_torn"')
+
+    log = audit.SegmentedLog(base)
+    assert log.path == path
+    log.append_batch([_rec(3)])
+    log.close()
+
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)["n"] for line in lines] == [0, 1, 2, 3]
+    assert [r["n"] for r in audit.lookup(base, "order_id", "ord_3")] == [3]
+    assert list(audit.lookup(base, "order_id", "ord_torn")) == []
+
+
+@pytest.mark.skipif(audit.fcntl is None, reason="needs flock")
+def test_a_second_writer_does_not_take_a_live_segment(tmp_path):
+    base = str(tmp_path / "audit.log")
+    first = audit.SegmentedLog(base)
+    second = audit.SegmentedLog(base)  # flock held by `first`: not an orphan
+    assert first.path != second.path
+    first.append_batch([_rec(1)])
+    second.append_batch([_rec(8)])
+    first.close()
+    second.close()
+    assert [r["n"] for r in audit.lookup(base, "order_id", "ord_1")] == [1, 8]
+
+
+# ---------------------------------------------------------
+# WRITER: queued records are all on disk and indexed after close()
+# ---------------------------------------------------------
+def test_writer_flushes_and_seals_on_close(tmp_path):
+    base = str(tmp_path / "audit.log")
+    writer = audit.AuditWriter(
+        audit.SegmentedLog(base, segment_bytes=4096), batch_size=16, fsync=audit.FSYNC_NONE
+    )
+    for i in range(200):
+        assert writer.write(_rec(i))
+    writer.close()
+    stats = writer.stats()
+    assert stats["written"] == 200 and stats["dropped"] == 0 and not stats["writer_alive"]
+    assert all(os.path.exists(p + ".idx") for _, p in audit.list_segments(base))
+    assert [r["n"] for r in audit.lookup(base, "pi_id", "pi_123")] == [123]
+    assert not writer.write(_rec(0))  # closed: dropped, not queued
@@ -0,0 +1,76 @@
+# test_batch.py (payment-systems/stripe/batch.py: run parameters, pacing, async runner)
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import batch  # noqa: E402
+
+# ---------------------------------------------------------
+# RUN PARAMETERS: what /api/offsession/batch answers 400 invalid_param for
+# ---------------------------------------------------------
+@pytest.mark.parametrize("concurrency, max_rps, expected", [
+    ("16", None, (16, None)),
+    ("1", "2.5", (1, 2.5)),
+    ("4", "inf", (4, float("inf"))),  # no cap
+])
+def test_run_params_accepts(concurrency, max_rps, expected):
+    assert batch.run_params(concurrency, max_rps) == expected
+
+
+@pytest.mark.parametrize("concurrency, max_rps", [
+    ("0", None), ("-3", None), ("x", None), ("1.5", None), ("", None),
+    ("4", "0"), ("4", "-1"), ("4", "nan"), ("4", "abc"), ("4", ""),
+])
+def test_run_params_rejects(concurrency, max_rps):
+    with pytest.raises(ValueError):
+        batch.run_params(concurrency, max_rps)
+
+
+# ---------------------------------------------------------
+# ASYNC RUNNER: bounded concurrency, every item reported once
+# ---------------------------------------------------------
+def test_run_batch_async_bounds_concurrency(monkeypatch):
+    inflight = peak = 0
+
+    async def charge(item):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.001)
+        inflight -= 1
+        if item["order_id"] == "bad":
+            raise batch.ItemRejected("amount_below_min")
+        return {"id": "pi_" + item["order_id"], "status": "succeeded"}
+
+    monkeypatch.setattr(batch, "charge_one_async", charge)
+    items = [{"order_id": str(i)} for i in range(50)] + [{"order_id": "bad"}, ValueError("x")]
+    report = batch.BatchReport()
+
+    async def run():
+        return [r async for r in batch.run_batch_async(items, 4, None, report)]
+
+    results = asyncio.run(run())
+    assert peak == 4
+    assert sorted(r["i"] for r in results) == list(range(52))
+    assert report.summary()["ok"] == 50 and report.summary()["failed"] == 2
+    assert {r["error"] for r in results if not r["ok"]} == {"amount_below_min", "ValueError: x"}
+
+
+def test_pacer_spaces_async_starts():
+    pacer = batch.Pacer(max_rps=200)  # 5 ms apart
+
+    async def run():
+        starts = []
+        for _ in range(5):
+            await pacer.wait_async()
+            starts.append(time.monotonic())
+        return starts
+
+    starts = asyncio.run(run())
+    assert starts[-1] - starts[0] >= 4 * 0.005 * 0.9
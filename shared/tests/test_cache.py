@@ -0,0 +1,108 @@
+# test_cache.py (payment-systems/stripe/cache.py: read-through TTL + LRU, negative entries)
+import os
+import sys
+import types
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import cache  # noqa: E402
+
+
+class NotFound(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # cache reads time.monotonic() only: swap its `time` for one the test moves by hand
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _loader(calls, value="v"):
+    def load():
+        calls.append(value)
+        return value
+    return load
+
+
+# ---------------------------------------------------------
+# READ-THROUGH: one load per key per TTL
+# ---------------------------------------------------------
+def test_hit_within_ttl_reload_after(clock):
+    c, calls = cache.TTLCache(ttl=30), []
+    assert c.get("k", _loader(calls)) == "v"
+    clock[0] += 29.9
+    assert c.get("k", _loader(calls)) == "v"
+    assert len(calls) == 1
+    clock[0] += 0.1
+    c.get("k", _loader(calls))
+    assert len(calls) == 2
+    stats = c.stats()
+    assert (stats["hits"], stats["misses"], stats["served_age_max_s"]) == (1, 2, 29.9)
+
+
+def test_bypass_always_loads_and_refreshes(clock):
+    c, calls = cache.TTLCache(ttl=30), []
+    c.get("k", _loader(calls, "old"))
+    assert c.get("k", _loader(calls, "new"), bypass=True) == "new"
+    assert c.get("k", _loader(calls, "unused")) == "new"
+    assert calls == ["old", "new"] and c.stats()["bypassed"] == 1
+
+
+def test_loader_errors_are_not_cached_unless_missing(clock):
+    c = cache.TTLCache(ttl=30, negative_ttl=5, is_missing=lambda e: isinstance(e, NotFound))
+    calls = []
+
+    def boom(exc):
+        def load():
+            calls.append(exc)
+            raise exc
+        return load
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            c.get("k", boom(RuntimeError("503")))
+    assert len(calls) == 2  # transient: every call goes to the API
+
+    with pytest.raises(NotFound):
+        c.get("gone", boom(NotFound()))
+    with pytest.raises(NotFound):
+        c.get("gone", boom(NotFound()))
+    assert len(calls) == 3 and c.stats()["negative_hits"] == 1
+    clock[0] += 5  # the negative entry expires after negative_ttl, not ttl
+    assert c.get("gone", _loader(calls, "created since")) == "created since"
+
+
+# ---------------------------------------------------------
+# BOUNDS AND WRITES: LRU eviction, put() refreshes, invalidate() drops
+# ---------------------------------------------------------
+def test_lru_evicts_least_recently_used(clock):
+    c, calls = cache.TTLCache(max_size=2, ttl=30), []
+    c.get("a", _loader(calls, "a"))
+    c.get("b", _loader(calls, "b"))
+    c.get("a", _loader(calls, "a"))  # a is now the most recently used
+    c.get("c", _loader(calls, "c"))
+    assert calls == ["a", "b", "c"]
+    c.get("a", _loader(calls, "a"))
+    c.get("b", _loader(calls, "b"))
+    assert calls == ["a", "b", "c", "b"]
+    assert c.stats()["evictions"] == 2
+
+
+def test_put_restarts_the_ttl_and_invalidate_forces_a_load(clock):
+    c, calls = cache.TTLCache(ttl=30), []
+    c.get("k", _loader(calls, "v1"))
+    clock[0] += 20
+    c.put("k", "v2")  # e.g. from a webhook
+    clock[0] += 20
+    assert c.get("k", _loader(calls, "unused")) == "v2"
+    c.invalidate("k")
+    c.invalidate("never-cached")
+    assert c.get("k", _loader(calls, "v3")) == "v3"
+    stats = c.stats()
+    assert (stats["refreshes"], stats["invalidations"]) == (1, 1)
@@ -0,0 +1,130 @@
+# test_cookies.py (auth/cookies.py fast path vs http.cookies.SimpleCookie, fuzzed)
+import os
+import random
+import sys
+from http.cookies import Morsel, SimpleCookie
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "auth"))
+
+from cookies import get_cookie, set_cookie_builder  # noqa: E402
+
+# ---------------------------------------------------------
+# FUZZED EQUIVALENCE (was `python bench.py cookies --fuzz`)
+# ---------------------------------------------------------
+# get_cookie() must return exactly what SimpleCookie does on RFC 6265 cookie
+# strings, and set_cookie_builder() must emit SimpleCookie's bytes for values
+# SimpleCookie leaves unquoted; every other cookie-octet must round-trip.
+FUZZ = int(os.environ.get("COOKIE_FUZZ", "5000"))
+
+_TOKEN_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789!#$%&'*+-.^_`|~"
+# RFC 6265 cookie-octets
+_OCTETS = "".join(chr(c) for c in range(0x21, 0x7F) if chr(c) not in '",;\\')
+_SIMPLE_CHARS = _TOKEN_CHARS + ":"  # what SimpleCookie leaves unquoted
+# Inside DQUOTEs: cookie-octets plus the separators a quoted value may carry
+_QUOTED_CHARS = _OCTETS + "; ,="
+
+
+def _quoted_value(rng: random.Random) -> str:
+    out = []
+    for _ in range(rng.randrange(0, 30)):
+        r = rng.random()
+        if r < 0.05:
+            out.append("session_id=evil")  # what a client-controlled value would smuggle
+        elif r < 0.1:
+            out.append("\\" + rng.choice('"\\;0127'))  # escapes, incl. octal
+        else:
+            out.append(rng.choice(_QUOTED_CHARS))
+    return '"' + "".join(out) + '"'
+
+
+def _fuzz_header(rng: random.Random) -> str:
+    pairs = []
+    for _ in range(rng.randrange(0, 8)):
+        while True:
+            name = "".join(rng.choice(_TOKEN_CHARS) for _ in range(rng.randrange(1, 12)))
+            # SimpleCookie reads "$x" and attribute names as attributes, not cookies
+            if name[0] != "$" and name.lower() not in Morsel._reserved:
+                break
+        pairs.append(name)
+    for _ in range(rng.choice((0, 1, 1, 2))):
+        pairs.insert(rng.randrange(len(pairs) + 1), rng.choice(("session_id", "xsession_id")))
+    out = []
+    for name in pairs:
+        if rng.random() < 0.2:
+            value = _quoted_value(rng)
+        else:
+            value = "".join(rng.choice(_OCTETS) for _ in range(rng.randrange(0, 40)))
+        out.append(f"{name}={value}")
+    return rng.choice(("; ", ";")).join(out)
+
+
+def _simple_get(header):
+    c = SimpleCookie(header)
+    return c["session_id"].value if "session_id" in c else None
+
+
+def _simple_set(value):
+    c = SimpleCookie()
+    c["session_id"] = value
+    m = c["session_id"]
+    m["path"], m["httponly"], m["samesite"], m["max-age"] = "/", True, "Lax", 360
+    return m.OutputString()
+
+
+fast_set = set_cookie_builder("session_id", "/", 360, httponly=True, secure=False)
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_parse_matches_simplecookie(seed):
+    rng = random.Random(seed)
+    for _ in range(FUZZ):
+        header = _fuzz_header(rng)
+        assert get_cookie(header, "session_id") == _simple_get(header), header
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_build_matches_simplecookie(seed):
+    # SimpleCookie quotes anything outside its own smaller alphabet: compare bytes there
+    rng = random.Random(seed)
+    for _ in range(FUZZ):
+        value = "".join(rng.choice(_SIMPLE_CHARS) for _ in range(rng.randrange(0, 40)))
+        assert fast_set(value) == _simple_set(value), value
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_build_round_trips_every_cookie_octet(seed):
+    rng = random.Random(seed)
+    for _ in range(FUZZ):
+        value = "".join(rng.choice(_OCTETS) for _ in range(rng.randrange(1, 40)))
+        assert get_cookie(fast_set(value).partition("; ")[0], "session_id") == value, value
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('session_id=good; a="x;session_id=evil"', "good"),
+    ('a="x;session_id=evil"; session_id=good', "good"),
+    ('session_id=good; a="x;session_id=evil', "good"),  # unterminated: rest is not read
+    ('a="x\\";session_id=evil"; session_id=good', "good"),
+    ('session_id="a;b"', "a;b"),
+    ('session_id="a\\073b"', "a;b"),
+])
+def test_quoted_values_cannot_override_session(header, expected):
+    assert get_cookie(header, "session_id") == expected == _simple_get(header)
+
+
+@pytest.mark.parametrize("header", [
+    "session_id=x; foo",            # nameless cookie
+    "path=/; session_id=x",         # reserved name first
+    "a b=1; session_id=x",          # stray space
+    "session_id = x",               # spaces around "="
+])
+def test_parse_finds_session_in_malformed_headers(header):
+    # Where SimpleCookie drops every cookie, the fast path still finds session_id
+    assert get_cookie(header, "session_id") == "x"
+
+
+def test_build_rejects_non_cookie_octets():
+    for value in ('a"b', "a;b", "a b", "a\\b", "é"):
+        with pytest.raises(ValueError):
+            fast_set(value)
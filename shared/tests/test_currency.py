@@ -0,0 +1,114 @@
+# test_currency.py (payment-systems/stripe/currency.py: exponents, half-up rounding, bulk paths)
+import os
+import random
+import sys
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import currency  # noqa: E402
+from currency import EXPONENTS, convert_many, to_minor_units  # noqa: E402
+
+# ---------------------------------------------------------
+# EXPONENT TABLE: ISO 4217 with Stripe's overrides
+# ---------------------------------------------------------
+# Regressions against the old rule (x1 for Stripe's zero-decimal list, x100 for
+# everything else): three-decimal currencies were off by 10x, and rounding was
+# round-half-even on the binary float (1.005 USD -> 100, 0.125 USD -> 12).
+@pytest.mark.parametrize("amount, code, minor", [
+    (1.005, "bhd", 1005),   # was 100
+    (1.005, "kwd", 1005),   # was 100
+    ("0.5", "kwd", 500),    # was 50
+    (12, "jpy", 12),
+    (12.5, "jpy", 13),      # half up (round() gave 12)
+    (12, "isk", 1200),      # Stripe takes ISK as two-decimal amounts ending in 00
+    (12, "mga", 12),        # ISO says 2 decimals, Stripe says 0
+    (12.99, "usd", 1299),
+    (1.005, "usd", 101),    # was 100: 1.005 * 100 == 100.49999999999999
+    (0.125, "usd", 13),     # was 12
+    (12.99, "XYZ", 1299),   # unknown codes stay two-decimal
+])
+def test_to_minor_units(amount, code, minor):
+    assert to_minor_units(amount, code) == minor
+
+
+def test_stripe_overrides_iso_only_for_isk_and_mga():
+    differ = {c for c, e in currency.ISO_4217_EXPONENTS.items() if EXPONENTS[c] != e}
+    assert differ == {"isk", "mga"}
+    assert EXPONENTS["isk"] == 2 and EXPONENTS["mga"] == 0
+    assert all(EXPONENTS[c] == 0 for c in currency.ZERO_DECIMAL)
+    assert {c for c, e in EXPONENTS.items() if e == 3} == {
+        "bhd", "iqd", "jod", "kwd", "lyd", "omr", "tnd"
+    }
+    assert EXPONENTS["clf"] == 4
+
+
+# ---------------------------------------------------------
+# MIDPOINT RULE: floats round half up on the decimal they were written as
+# ---------------------------------------------------------
+def _half_up(x, exp):
+    return int(Decimal(repr(x)).scaleb(exp).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+@pytest.mark.parametrize("exp", [0, 2, 3, 4])
+def test_float_midpoints_match_decimal(exp):
+    rng = random.Random(exp)
+    scale = 10 ** exp
+    for _ in range(20000):
+        # (k + 0.5) / scale written out: a midpoint at one more decimal than the
+        # currency has, mostly not representable, so the float sits just off it
+        k = rng.randrange(0, 10 ** rng.randrange(1, 13))
+        x = float(f"{k // scale}." + (f"{k % scale:0{exp}d}" if exp else "") + "5")
+        assert currency._float_to_minor(x, scale) == _half_up(x, exp), x
+        y = rng.uniform(0, 10 ** rng.randrange(0, 9))
+        assert currency._float_to_minor(y, scale) == _half_up(y, exp), y
+        assert currency._float_to_minor(-y, scale) == -_half_up(y, exp), -y
+
+
+@pytest.mark.parametrize("amount", ["nan", float("inf"), "abc", ""])
+def test_non_numbers_raise(amount):
+    with pytest.raises(ValueError):
+        to_minor_units(amount, "usd")
+
+
+# ---------------------------------------------------------
+# BULK: convert_many agrees with to_minor_units and flags invalid rows
+# ---------------------------------------------------------
+def test_convert_many_validity():
+    amounts = [12.99, 0.49, 1.001, 1.01, 1e9, float("nan"), "7.5", 12, 12]
+    codes = ["usd", "usd", "kwd", "kwd", "usd", "usd", "eur", "xyz", "jpy"]
+    minor, valid = convert_many(amounts, codes)
+    assert valid == [True, False, False, True, False, False, True, False, False]
+    assert minor == [1299, 0, 0, 1010, 0, 0, 750, 0, 0]  # 1.001 KWD is off-step, 12 JPY < 50
+    assert convert_many([12], "jpy", minimums=1) == ([12], [True])
+
+
+def test_convert_many_matches_scalar_path():
+    rng = random.Random(1)
+    codes = ["usd", "jpy", "kwd", "isk", "clf"]
+    amounts = [round(rng.uniform(0, 1000), rng.randrange(0, 5)) for _ in range(5000)]
+    rows = [rng.choice(codes) for _ in amounts]
+    minor, valid = convert_many(amounts, rows, minimums=0)
+    for a, c, m, ok in zip(amounts, rows, minor, valid):
+        expected = to_minor_units(a, c)
+        if ok:
+            assert m == expected, (a, c)
+        else:  # with no minimum, only an off-step amount is refused
+            assert m == 0 and expected % currency.MINOR_STEP[c], (a, c)
+
+
+def test_numpy_path_matches_list_path():
+    np = pytest.importorskip("numpy")
+    rng = random.Random(2)
+    codes = ["usd", "JPY", "kwd", "isk", "xyz", "mga"]
+    amounts = [round(rng.uniform(0, 5000), rng.randrange(0, 4)) for _ in range(5000)]
+    amounts[:3] = [float("nan"), float("inf"), -1.0]
+    rows = [rng.choice(codes) for _ in amounts]
+    minor, valid = convert_many(amounts, rows)
+    a_minor, a_valid = convert_many(np.array(amounts), rows)
+    assert a_minor.tolist() == minor and a_valid.tolist() == valid
+    m_valid = currency.is_valid_min_many(np.array(minor), rows)
+    assert m_valid.tolist() == currency.is_valid_min_many(minor, rows)
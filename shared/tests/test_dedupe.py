@@ -0,0 +1,125 @@
+# test_dedupe.py (payment-systems/stripe/dedupe.py: event-id dedupe with TTL, per-object ordering)
+import json
+import os
+import sys
+import types
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import dedupe  # noqa: E402
+import webhooks  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # dedupe reads time.time() only: swap its `time` for one the test moves by hand
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(dedupe, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+# ---------------------------------------------------------
+# DEDUPE: a redelivery within the TTL is a hit, after it a fresh event
+# ---------------------------------------------------------
+def test_redelivery_within_ttl_is_a_duplicate(clock):
+    cache = dedupe.DedupeCache(ttl=60)
+    assert cache.check_and_mark("evt_1") is False
+    clock[0] += 59
+    assert cache.check_and_mark("evt_1") is True
+    assert cache.check_and_mark("evt_2") is False
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 2, "hit_rate": 0.3333}
+
+
+def test_mark_expires_after_ttl(clock):
+    cache = dedupe.DedupeCache(ttl=60)
+    cache.check_and_mark("evt_1")
+    clock[0] += 60
+    assert cache.check_and_mark("evt_1") is False  # expired: handled again
+    clock[0] += 30
+    assert cache.check_and_mark("evt_1") is True  # and re-marked from then
+
+
+def test_lru_evicts_the_oldest_mark(clock):
+    cache = dedupe.DedupeCache(max_size=2, ttl=60)
+    for event_id in ("evt_1", "evt_2", "evt_3"):
+        cache.check_and_mark(event_id)
+    assert cache.stats()["size"] == 2
+    assert cache.check_and_mark("evt_1") is False  # evicted, no db to fall back on
+    assert cache.check_and_mark("evt_3") is True
+
+
+def test_forget_lets_the_retry_through(clock, tmp_path):
+    cache = dedupe.DedupeCache(ttl=60, db_path=str(tmp_path / "dedupe.db"))
+    cache.check_and_mark("evt_1")
+    cache.forget("evt_1")
+    assert cache.check_and_mark("evt_1") is False
+
+
+def test_db_catches_redelivery_after_restart_and_eviction(clock, tmp_path):
+    path = str(tmp_path / "dedupe.db")
+    first = dedupe.DedupeCache(max_size=1, ttl=60, db_path=path)
+    first.check_and_mark("evt_1")
+    first.check_and_mark("evt_2")  # evicts evt_1 from memory
+    assert first.check_and_mark("evt_1") is True
+
+    clock[0] += 30
+    restarted = dedupe.DedupeCache(ttl=60, db_path=path)
+    assert restarted.check_and_mark("evt_2") is True
+    clock[0] += 31  # evt_1 and evt_2 were marked 61s ago
+    assert restarted.check_and_mark("evt_1") is False
+    assert restarted.check_and_mark("evt_1") is True
+
+
+def test_expired_db_rows_are_pruned_on_open(clock, tmp_path):
+    path = str(tmp_path / "dedupe.db")
+    dedupe.DedupeCache(ttl=60, db_path=path).check_and_mark("evt_1")
+    clock[0] += 61
+    cache = dedupe.DedupeCache(ttl=60, db_path=path)
+    assert cache._db.execute("SELECT COUNT(*) FROM seen_events").fetchone() == (0,)
+
+
+# ---------------------------------------------------------
+# ORDERING: an event older than one applied to the same object is stale
+# ---------------------------------------------------------
+def test_sequencer_flags_only_older_events_per_object():
+    seq = dedupe.ObjectSequencer()
+    assert seq.is_stale("pi_1", 100) is False
+    assert seq.is_stale("pi_1", 100) is False  # same second: not stale (1s resolution)
+    assert seq.is_stale("pi_1", 99) is True
+    assert seq.is_stale("pi_2", 50) is False  # other objects are independent
+    assert seq.is_stale("pi_1", 101) is False
+    assert seq.is_stale("pi_1", 100) is True
+    assert seq.stats() == {"tracked": 2, "applied": 4, "stale": 2}
+
+
+def test_sequencer_is_bounded():
+    seq = dedupe.ObjectSequencer(max_size=2)
+    for obj in ("pi_1", "pi_2", "pi_3"):
+        seq.is_stale(obj, 100)
+    assert seq.stats()["tracked"] == 2
+    assert seq.is_stale("pi_1", 1) is False  # forgotten: cannot be judged stale
+
+
+def test_queue_skips_only_ordered_handlers_for_stale_events(tmp_path, monkeypatch):
+    monkeypatch.setattr(webhooks, "HANDLERS", {})
+    monkeypatch.setattr(webhooks, "ORDERED", set())
+    refreshed, notified = [], []
+    webhooks.on("payment_intent.*", ordered=True)(lambda e: refreshed.append(e["id"]))
+    webhooks.on("payment_intent.succeeded")(lambda e: notified.append(e["id"]))
+
+    q = webhooks.WebhookQueue(path=str(tmp_path / "webhooks.db"),
+                              sequencer=dedupe.ObjectSequencer())
+    # Delivered out of order: the newer state arrives first
+    for event_id, created in (("evt_new", 200), ("evt_old", 100)):
+        q.enqueue(json.dumps({
+            "id": event_id, "type": "payment_intent.succeeded", "created": created,
+            "data": {"object": {"id": "pi_1"}},
+        }).encode())
+        q._handle(*q._claim())
+
+    assert refreshed == ["evt_new"]
+    assert notified == ["evt_new", "evt_old"]
+    assert q.stats()["skipped_stale"] == 1
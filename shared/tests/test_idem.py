@@ -0,0 +1,107 @@
+# test_idem.py (payment-systems/stripe/idem.py: keys stable across processes, unique_key unique)
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import idem  # noqa: E402
+
+# ---------------------------------------------------------
+# DETERMINISM: same parts -> same key, in any process, on any host
+# ---------------------------------------------------------
+# Known answers pin the encoding and the digest: a change here changes every
+# key in flight, and retries across the deploy would no longer deduplicate.
+KNOWN_ANSWERS = [
+    (("pi.create", "ord_123", "1299", "usd"),
+     "idem_119dfe020bc77bcdd230b269e558e3867cc5a5286cfeea18023ed231908998c0"),
+]
+
+SAMPLE = [
+    ["pi.create", "ord_123", "1299", "usd"],
+    ["pi.offsession", "cus_0f3a9c", "5000", "eur", "ord_7"],
+    ["refund", "ch_1", None],
+    ["x", None], ["x", ""], ["a|b"], ["a", "b"], ["nul\x00part"], ["\x01"], ["snow ☃"],
+    ["y" * 1000],
+]
+
+_CHILD = """
+import json, sys
+import idem
+parts = json.loads(sys.stdin.read())
+print(json.dumps([idem.idem_key(*p) for p in parts]))
+"""
+
+
+@pytest.mark.parametrize("parts, key", KNOWN_ANSWERS)
+def test_known_answers(parts, key):
+    assert idem.idem_key(*parts) == key
+
+
+@pytest.mark.parametrize("seed", ["0", "1", "random"])
+def test_same_keys_in_a_fresh_process(seed):
+    # A new interpreter with another hash seed: nothing may depend on hash() or ids
+    here = [idem.idem_key(*p) for p in SAMPLE]
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD], input=json.dumps(SAMPLE), capture_output=True,
+        text=True, check=True, cwd=STRIPE_DIR,
+        env={**os.environ, "PYTHONHASHSEED": seed},
+    ).stdout
+    assert json.loads(out) == here
+
+
+def test_encoding_is_injective():
+    assert idem.idem_key("x", None) != idem.idem_key("x", "")
+    assert idem.idem_key("a|b") != idem.idem_key("a", "b")
+    assert idem.idem_key("a\x00b") != idem.idem_key("a", "b")
+    assert idem.encode_parts("abc", None, "") == b"\x013,-,0:abc"
+
+
+def test_key_length_is_bounded():
+    assert len(idem.idem_key("y" * 1000)) == len(idem.KEY_PREFIX) + 64
+    assert len(idem.unique_key("x" * 1000)) <= 255
+
+
+# ---------------------------------------------------------
+# UNIQUENESS: unique_key never repeats across threads or a fork
+# ---------------------------------------------------------
+def test_unique_key_no_duplicates_across_threads():
+    keys = [[] for _ in range(4)]
+    threads = [
+        threading.Thread(target=lambda out: out.extend(idem.unique_key("t") for _ in range(20000)),
+                         args=(out,))
+        for out in keys
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = [k for out in keys for k in out]
+    assert len(set(total)) == len(total)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_unique_key_no_duplicates_after_fork():
+    # The child inherits the parent's tag and counter; the fork hook must replace both
+    before = [idem.unique_key("f") for _ in range(1000)]
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        with os.fdopen(w, "w") as f:
+            f.write("\n".join(idem.unique_key("f") for _ in range(5000)))
+        os._exit(0)
+    os.close(w)
+    with os.fdopen(r) as f:
+        child = f.read().split("\n")
+    _, status = os.waitpid(pid, 0)
+    assert status == 0
+    parent = [idem.unique_key("f") for _ in range(5000)]
+    total = before + child + parent
+    assert len(child) == 5000
+    assert len(set(total)) == len(total)
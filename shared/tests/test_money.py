@@ -0,0 +1,157 @@
+# test_money.py (payment-systems/stripe/money.py: exact parsing, allocation, JSON hooks)
+import os
+import random
+import sys
+from decimal import Decimal
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import money  # noqa: E402
+from money import Money  # noqa: E402
+
+# ---------------------------------------------------------
+# PARSE: exact or refused, never rounded
+# ---------------------------------------------------------
+@pytest.mark.parametrize("amount, currency, minor", [
+    ("12.99", "usd", 1299),
+    ("12.9", "usd", 1290),
+    ("12", "usd", 1200),
+    ("12.", "usd", 1200),
+    (".5", "usd", 50),
+    ("12.990", "usd", 1299),  # trailing zeros are not extra precision
+    ("0", "usd", 0),
+    ("1.005", "kwd", 1005),
+    ("12", "jpy", 12),
+    ("12.00", "jpy", 12),
+    ("12", "isk", 1200),
+    ("+5", "usd", 500),
+    (" 12.99 ", "usd", 1299),
+    ("1E+2", "usd", 10000),
+    (12, "usd", 1200),
+    (Decimal("12.99"), "usd", 1299),
+    (Decimal("1.2E+1"), "usd", 1200),
+    (12.99, "usd", 1299),  # a float is taken as written (its repr), not its binary value
+    (0.1, "usd", 10),
+    ("12.99", "USD", 1299),
+])
+def test_parse_exact(amount, currency, minor):
+    m = Money.parse(amount, currency)
+    assert (m.minor, m.currency) == (minor, currency.lower())
+
+
+@pytest.mark.parametrize("amount, currency", [
+    ("12.999", "usd"), ("12.5", "jpy"), ("1.0005", "kwd"), (1.005, "usd"),
+    ("-1", "usd"), (-1, "usd"), ("abc", "usd"), ("", "usd"), (".", "usd"), ("1.2.3", "usd"),
+    ("NaN", "usd"), ("Infinity", "usd"), (float("nan"), "usd"),
+    ("١٢", "usd"),  # Arabic-Indic digits: isdigit() and Decimal() would both accept them
+    ("12", "xyz"),
+])
+def test_parse_refuses(amount, currency):
+    with pytest.raises(ValueError):
+        Money.parse(amount, currency)
+
+
+@pytest.mark.parametrize("amount, currency", [(True, "usd"), (None, "usd"), ([1], "usd"), ("1", 1)])
+def test_parse_type_errors(amount, currency):
+    with pytest.raises(TypeError):
+        Money.parse(amount, currency)
+
+
+def test_fast_path_agrees_with_decimal_path():
+    # The digit-split path must give exactly what the strict Decimal parse gives
+    rng = random.Random(7)
+    for _ in range(20000):
+        text = "".join(rng.choice("0123456789") for _ in range(rng.randrange(0, 9)))
+        if rng.random() < 0.8:
+            cut = rng.randrange(len(text) + 1)
+            text = text[:cut] + "." + text[cut:]
+        currency = rng.choice(("usd", "jpy", "kwd", "clf", "isk"))
+        try:
+            expected = money._strict_minor(text, money.EXPONENTS[currency])
+        except ValueError:
+            expected = None
+        try:
+            got = money._parse_exact.__wrapped__(text, currency).minor
+        except ValueError:
+            got = None
+        assert got == expected, (text, currency)
+
+
+def test_repeated_amounts_share_one_instance():
+    assert Money.parse("19.99", "usd") is Money.parse("19.99", "usd")
+    assert Money.parse("19.99", "usd") is not Money.parse("19.99", "eur")
+
+
+# ---------------------------------------------------------
+# ALLOCATE: parts always add up, and stay valid Stripe amounts
+# ---------------------------------------------------------
+def test_split_gives_remainder_to_the_first_parts():
+    assert [m.minor for m in Money(1000, "usd").split(3)] == [334, 333, 333]
+    assert [m.minor for m in Money(2, "usd").split(3)] == [1, 1, 0]
+
+
+def test_allocate_uses_largest_remainders():
+    # 100 * (1, 2, 3) / 6 = 16.67, 33.33, 50: the .67 gets the leftover unit
+    assert [m.minor for m in Money(100, "usd").allocate([1, 2, 3])] == [17, 33, 50]
+    assert [m.minor for m in Money(100, "usd").allocate([0, 1])] == [0, 100]
+
+
+def test_allocate_keeps_minor_step():
+    parts = Money(1000, "kwd").allocate([1, 1, 1])  # KWD amounts end in 0
+    assert [m.minor for m in parts] == [340, 330, 330]
+    odd = Money(1005, "kwd").allocate([1, 1])  # off-step input: odd units on the first part
+    assert [m.minor for m in odd] == [505, 500]
+
+
+def test_allocate_always_sums_to_the_whole():
+    rng = random.Random(3)
+    for _ in range(2000):
+        currency = rng.choice(("usd", "jpy", "kwd", "isk"))
+        whole = Money(rng.randrange(0, 10 ** 7), currency)
+        weights = [rng.randrange(0, 50) for _ in range(rng.randrange(1, 8))]
+        if not sum(weights):
+            weights[0] = 1
+        parts = whole.allocate(weights)
+        assert sum((p.minor for p in parts), 0) == whole.minor
+        step = money.MINOR_STEP.get(currency, 1)
+        assert all(p.minor % step == 0 for p in parts[1:])
+
+
+@pytest.mark.parametrize("weights", [[], [0, 0], [1, -1]])
+def test_allocate_rejects_bad_weights(weights):
+    with pytest.raises(ValueError):
+        Money(100, "usd").allocate(weights)
+
+
+# ---------------------------------------------------------
+# VALUE SEMANTICS AND JSON
+# ---------------------------------------------------------
+def test_arithmetic_stays_in_one_currency():
+    assert Money(150, "usd") + Money(50, "usd") == Money(200, "usd")
+    assert Money(150, "usd") - Money(200, "usd") == Money(-50, "usd")
+    assert 3 * Money(5, "usd") == Money(15, "usd")
+    with pytest.raises(ValueError):
+        Money(1, "usd") + Money(1, "eur")
+    with pytest.raises(TypeError):
+        Money(1, "usd") * 1.5
+    with pytest.raises(TypeError):
+        Money(1.0, "usd")
+
+
+def test_display_and_major():
+    assert str(Money(1299, "usd")) == "12.99 USD"
+    assert str(Money(-5, "usd")) == "-0.05 USD"
+    assert str(Money(1005, "kwd")) == "1.005 KWD"
+    assert str(Money(12, "jpy")) == "12 JPY"
+    assert Money(1005, "kwd").major == Decimal("1.005")
+
+
+def test_json_round_trip_keeps_amounts_exact():
+    body = money.loads('{"amount_major": 0.1, "price": {"amount_minor": 1299, "currency": "usd"}}')
+    assert body["amount_major"] == Decimal("0.1")
+    assert body["price"] == Money(1299, "usd")
+    out = money.dumps({"price": Money(1299, "usd"), "rate": Decimal("0.10")})
+    assert out == '{"price": {"amount_minor": 1299, "currency": "usd"}, "rate": "0.10"}'
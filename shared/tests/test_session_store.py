@@ -0,0 +1,165 @@
+# test_session_store.py (auth/session_store.py + session_backends.py: expiry, LRU, per-user caps)
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "auth"))
+
+import session_backends  # noqa: E402
+from session_store import SessionStore  # noqa: E402
+
+
+@pytest.fixture
+def clock():
+    # SessionStore takes its clock as an argument: the test moves it by hand
+    return [1000.0]
+
+
+def _store(clock, **kwargs):
+    return SessionStore(clock=lambda: clock[0], **kwargs)
+
+
+# ---------------------------------------------------------
+# EXPIRY: sliding idle timeout, capped by the absolute lifetime
+# ---------------------------------------------------------
+def test_sliding_ttl_is_extended_by_each_read(clock):
+    store = _store(clock, sliding_ttl=60, absolute_ttl=None)
+    store.create("s1", "alice", {"cart": 1})
+    for _ in range(5):
+        clock[0] += 59
+        assert store.get("s1") == {"cart": 1}
+    clock[0] += 60
+    assert store.get("s1") is None
+    assert "s1" not in store and len(store) == 0
+    assert store.stats()["expired"] == 1
+
+
+def test_absolute_ttl_ends_an_active_session(clock):
+    store = _store(clock, sliding_ttl=60, absolute_ttl=150)
+    store.create("s1", "alice")
+    clock[0] += 50
+    assert "s1" in store
+    clock[0] += 50
+    assert "s1" in store
+    clock[0] += 50  # read every 50s, but 150s after creation it is over
+    assert "s1" not in store
+
+
+def test_session_with_no_value_is_still_live(clock):
+    store = _store(clock, sliding_ttl=60, absolute_ttl=None)
+    store.create("s1", "alice")
+    assert "s1" in store and store.get("s1") is None
+    clock[0] += 60
+    assert "s1" not in store and store.stats()["expired"] == 1
+
+
+def test_absolute_only_ignores_reads(clock):
+    store = _store(clock, sliding_ttl=None, absolute_ttl=100)
+    store.create("s1", "alice", "v")
+    clock[0] += 99.9
+    assert store.get("s1") == "v"
+    clock[0] += 0.1
+    assert store.get("s1") is None
+
+
+def test_idle_sessions_expire_without_being_read(clock):
+    # The heap reaps untouched sessions as other operations come through
+    store = _store(clock, sliding_ttl=60, absolute_ttl=None)
+    for n in range(5):
+        store.create(f"idle{n}", f"user{n}")
+    clock[0] += 30
+    store.get("idle0")  # moved to t+90: its first heap entry must be re-pushed, not reaped
+    clock[0] += 30
+    store.create("fresh", "bob")
+    assert len(store) == 2 and "idle0" in store
+    assert store.stats()["expired"] == 4
+
+
+def test_stale_heap_entries_are_compacted(clock):
+    store = _store(clock, sliding_ttl=60, absolute_ttl=None)
+    for n in range(500):
+        store.create(f"s{n}", f"user{n}")
+        store.delete(f"s{n}")
+    assert len(store._heap) <= 2 * len(store) + 64 + 1
+
+
+def test_needs_a_ttl():
+    with pytest.raises(ValueError):
+        SessionStore(sliding_ttl=None, absolute_ttl=None)
+
+
+# ---------------------------------------------------------
+# CAPS: LRU across the store, oldest-first per user
+# ---------------------------------------------------------
+def test_max_size_evicts_least_recently_used(clock):
+    store = _store(clock, max_size=3, max_per_user=None)
+    for sid in ("a", "b", "c"):
+        store.create(sid, "u_" + sid)
+    store.get("a")  # a is now the most recently used
+    store.create("d", "u_d")
+    assert "b" not in store
+    assert all(sid in store for sid in ("a", "c", "d"))
+    stats = store.stats()
+    assert stats["evicted_lru"] == 1 and stats["live_sessions"] == 3
+
+
+def test_max_per_user_drops_that_users_oldest_session(clock):
+    store = _store(clock, max_per_user=2)
+    store.create("bob1", "bob")
+    for sid in ("alice1", "alice2", "alice3"):
+        store.create(sid, "alice")
+    assert "alice1" not in store
+    assert all(sid in store for sid in ("alice2", "alice3", "bob1"))
+    assert store.stats()["evicted_user_cap"] == 1
+
+
+def test_recreate_replaces_without_counting_twice(clock):
+    store = _store(clock, max_per_user=2)
+    store.create("s1", "alice", "old")
+    store.create("s1", "alice", "new")
+    store.create("s2", "alice")
+    assert store.get("s1") == "new" and len(store) == 2
+    assert store.stats()["evicted_user_cap"] == 0
+
+
+def test_delete_user_logs_out_everywhere(clock):
+    store = _store(clock)
+    for sid in ("a1", "a2", "b1"):
+        store.create(sid, sid[0])
+    assert store.delete_user("a") == 2
+    assert store.delete_user("a") == 0
+    assert store.delete("b1") is True and store.delete("b1") is False
+    stats = store.stats()
+    assert (stats["live_sessions"], stats["users"]) == (0, 0)
+
+
+# ---------------------------------------------------------
+# SQLITE BACKEND: same expiry and per-user rules on wall-clock time
+# ---------------------------------------------------------
+@pytest.fixture
+def wall_clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(session_backends, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_sqlite_store_expiry_and_per_user_cap(tmp_path, wall_clock):
+    store = session_backends.SQLiteSessionStore(
+        path=str(tmp_path / "sessions.db"), sliding_ttl=60, absolute_ttl=150, max_per_user=2
+    )
+    for sid in ("a1", "a2", "a3"):
+        store.create(sid, "alice", {"sid": sid})
+        wall_clock[0] += 1
+    assert store.get("a1") is None  # the oldest went over the cap
+    assert store.get("a3") == {"sid": "a3"}
+    assert store.evicted_user_cap == 1
+
+    for _ in range(3):
+        wall_clock[0] += 45
+        assert store.get("a3") is not None
+    wall_clock[0] += 45  # read every 45s, past the 150s lifetime
+    assert store.get("a3") is None
+    assert store.get("a2") is None  # never read since creation: idle for far over 60s
+    assert store.expired == 2
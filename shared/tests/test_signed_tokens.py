@@ -0,0 +1,187 @@
+# test_signed_tokens.py (auth/signed_tokens.py: key rotation, revocation, malformed tokens)
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "auth"))
+
+import signed_tokens  # noqa: E402
+from signed_tokens import SQLiteRevocations, TokenSigner, _b64  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Issue and verify read time.time() / time.time_ns(): both follow one hand-moved clock
+    now = [1_700_000_000.0]
+    fake = types.SimpleNamespace(time=lambda: now[0], time_ns=lambda: round(now[0] * 1e6) * 1000)
+    monkeypatch.setattr(signed_tokens, "time", fake)
+    return now
+
+
+def _rejected(signer):
+    return signer.stats()["rejected"]
+
+
+# ---------------------------------------------------------
+# ISSUE / VERIFY / EXPIRY
+# ---------------------------------------------------------
+def test_round_trip(clock):
+    signer = TokenSigner({"k1": "secret"}, ttl=60)
+    token = signer.issue("alice")
+    assert token.startswith("k1.")
+    claims = signer.verify(token)
+    assert claims.user_id == "alice"
+    assert claims.issued_at_ms == 1_700_000_000_000 and claims.expires_at == 1_700_000_060
+    assert signer.verify(signer.issue("alice")).token_id != claims.token_id
+
+
+def test_user_ids_with_separators_survive(clock):
+    signer = TokenSigner({"k1": "secret"})
+    assert signer.verify(signer.issue("line\nbreak.and.dots")).user_id == "line\nbreak.and.dots"
+
+
+def test_token_expires_at_its_ttl(clock):
+    signer = TokenSigner({"k1": "secret"}, ttl=60, max_ttl=600)
+    short, long_ = signer.issue("alice"), signer.issue("alice", ttl=600)
+    clock[0] += 59.9
+    assert signer.verify(short) is not None
+    clock[0] += 0.1
+    assert signer.verify(short) is None and signer.verify(long_) is not None
+    assert _rejected(signer) == {"expired": 1}
+    with pytest.raises(ValueError):
+        signer.issue("alice", ttl=601)
+
+
+def test_tampered_token_is_rejected(clock):
+    signer = TokenSigner({"k1": "secret"})
+    kid, payload, sig = signer.issue("alice").split(".")
+    forged = _b64(b"admin\n1700000000000\n1800000000\nabc")
+    assert signer.verify(f"{kid}.{forged}.{sig}") is None
+    flipped = sig[:-1] + ("B" if sig.endswith("A") else "A")
+    assert signer.verify(f"{kid}.{payload}.{flipped}") is None
+    assert _rejected(signer) == {"bad_signature": 2}
+
+
+# ---------------------------------------------------------
+# KEY ROTATION: sign with the first key, accept the rest until dropped
+# ---------------------------------------------------------
+def test_rotation_keeps_old_tokens_valid_until_the_key_is_dropped(clock):
+    old = TokenSigner({"k1": "old-secret"})
+    token_k1 = old.issue("alice")
+
+    rotated = TokenSigner({"k2": "new-secret", "k1": "old-secret"})
+    token_k2 = rotated.issue("alice")
+    assert token_k2.startswith("k2.")
+    assert rotated.verify(token_k1).user_id == "alice"
+    assert rotated.verify(token_k2).user_id == "alice"
+    assert old.verify(token_k2) is None  # a worker not yet rolled out does not know k2
+
+    retired = TokenSigner({"k2": "new-secret"})
+    assert retired.verify(token_k1) is None and retired.verify(token_k2) is not None
+    assert _rejected(retired) == {"malformed": 1}
+
+
+def test_same_kid_with_another_secret_is_a_bad_signature(clock):
+    token = TokenSigner({"k1": "secret-a"}).issue("alice")
+    other = TokenSigner({"k1": "secret-b"})
+    assert other.verify(token) is None
+    assert _rejected(other) == {"bad_signature": 1}
+
+
+def test_active_kid_must_be_in_the_keyring():
+    with pytest.raises(ValueError):
+        TokenSigner({"k1": "secret"}, active_kid="k2")
+    assert TokenSigner({"k1": "a", "k2": "b"}, active_kid="k2").issue("u").startswith("k2.")
+
+
+def test_signer_from_env_parses_the_keyring(clock, monkeypatch, tmp_path):
+    monkeypatch.setenv("APP_SECRET_KEYS", "k2:new:with:colons,k1:old")
+    monkeypatch.setenv("REVOCATION_DB", str(tmp_path / "revocations.db"))
+    signer = signed_tokens.signer_from_env(ttl=60)
+    assert signer.active_kid == "k2" and isinstance(signer.revocations, SQLiteRevocations)
+    token = TokenSigner({"k1": "old"}).issue("alice")
+    assert signer.verify(token).user_id == "alice"
+    assert TokenSigner({"k2": "new:with:colons"}).verify(signer.issue("bob")).user_id == "bob"
+
+
+# ---------------------------------------------------------
+# MALFORMED: anything that is not a token is rejected, never raises
+# ---------------------------------------------------------
+@pytest.mark.parametrize("token", [
+    None, b"k1.abc.def", 123, "", "k1", "k1..", "k9.abc.def", "k1.abc", "k1.é.sig",
+])
+def test_malformed_tokens(clock, token):
+    signer = TokenSigner({"k1": "secret"})
+    assert signer.verify(token) is None
+    assert _rejected(signer) == {"malformed": 1}
+
+
+@pytest.mark.parametrize("raw", [
+    b"\xff\xfe",                          # not UTF-8
+    b"alice\n1700000000000\n1800000000",  # a field short
+    b"alice\nnow\n1800000000\ntok",       # non-integer time
+])
+def test_validly_signed_garbage_is_malformed(clock, raw):
+    # e.g. another token format signed with a shared key: the HMAC passes, parsing does not
+    signer = TokenSigner({"k1": "secret"})
+    signed_part = f"k1.{_b64(raw)}"
+    assert signer.verify(f"{signed_part}.{signer._sign('k1', signed_part)}") is None
+    assert _rejected(signer) == {"malformed": 1}
+
+
+# ---------------------------------------------------------
+# REVOCATION: one token, or everything a user was issued so far
+# ---------------------------------------------------------
+def test_revoke_one_token(clock):
+    signer = TokenSigner({"k1": "secret"})
+    phone, laptop = signer.issue("alice"), signer.issue("alice")
+    assert signer.revoke(phone) is True
+    assert signer.verify(phone) is None and signer.verify(laptop) is not None
+    assert signer.revoke(phone) is False  # already dead
+    assert signer.revoke("garbage") is False
+    assert signer.stats()["revoked_tokens"] == 1
+
+
+def test_revoke_user_spares_a_login_right_after(clock):
+    signer = TokenSigner({"k1": "secret"})
+    before = signer.issue("alice")
+    bob = signer.issue("bob")
+    signer.revoke_user("alice")
+    clock[0] += 0.001  # the very next millisecond
+    after = signer.issue("alice")
+    assert signer.verify(before) is None
+    assert signer.verify(after) is not None and signer.verify(bob) is not None
+    assert _rejected(signer) == {"revoked": 1}
+
+
+def test_prune_drops_expired_denials_but_keeps_cutoffs_for_max_ttl(clock):
+    signer = TokenSigner({"k1": "secret"}, ttl=60, max_ttl=3600)
+    long_lived = signer.issue("alice", ttl=3600)
+    signer.revoke(signer.issue("bob"))
+    signer.revoke_user("alice")
+    clock[0] += 61
+    assert signer.verify(signer.issue("carol")) is not None  # a successful verify prunes
+    assert signer.stats()["revoked_tokens"] == 0 and signer.stats()["revoked_users"] == 1
+    assert signer.verify(long_lived) is None  # its cutoff outlives the default ttl
+    clock[0] += 3600
+    signer.verify(signer.issue("carol"))
+    assert signer.stats()["revoked_users"] == 0
+
+
+def test_sqlite_revocations_are_shared_between_workers(clock, tmp_path):
+    path = str(tmp_path / "revocations.db")
+    keys = {"k1": "secret"}
+    worker_a = TokenSigner(keys, ttl=60, revocations=SQLiteRevocations(path))
+    worker_b = TokenSigner(keys, ttl=60, revocations=SQLiteRevocations(path))
+    token, other = worker_a.issue("alice"), worker_a.issue("bob")
+    assert worker_b.verify(token) is not None
+    worker_a.revoke(token)
+    assert worker_b.verify(token) is None
+    worker_a.revoke_user("bob")
+    assert worker_b.verify(other) is None
+    clock[0] += 61
+    worker_b.verify(worker_b.issue("carol"))  # prunes the shared file
+    stats = worker_a.stats()
+    assert (stats["revoked_tokens"], stats["revoked_users"]) == (0, 0)
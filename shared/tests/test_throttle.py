@@ -0,0 +1,175 @@
+# test_throttle.py (auth/throttle.py: sliding windows, username reservations, trusted devices)
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "auth"))
+
+import throttle  # noqa: E402
+from throttle import LoginThrottle, LoginThrottled, SketchWindowCounter, WindowCounter  # noqa: E402
+
+START = 1_699_999_200.0  # on a boundary of both the 60s and the 900s windows
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # check() reads time.time(): swap throttle's `time` for one the test moves by hand
+    now = [START]
+    monkeypatch.setattr(throttle, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def _throttle(**kwargs):
+    kwargs.setdefault("ip_counter", WindowCounter(60))
+    return LoginThrottle(**kwargs)
+
+
+def _locked_out(t, username, ip, device=None):
+    with pytest.raises(LoginThrottled) as exc:
+        t.check(username, ip, device)
+    return exc.value.scope
+
+
+# ---------------------------------------------------------
+# WINDOWS: previous window weighted by its overlap, plus the current one
+# ---------------------------------------------------------
+@pytest.mark.parametrize("counter", [WindowCounter, SketchWindowCounter])
+def test_sliding_window_estimate(counter):
+    c = counter(60)
+    for _ in range(10):
+        c.incr("k", START + 1)
+    assert c.estimate("k", START + 1) == 10
+    assert c.estimate("k", START + 90) == pytest.approx(5)  # half of the last window overlaps
+    assert c.incr("k", START + 90) == pytest.approx(6)
+    assert c.estimate("k", START + 120) == 1  # the 10 have slid out
+    assert c.estimate("k", START + 180) == 0
+    assert c.estimate("other", START + 1) == 0
+
+
+@pytest.mark.parametrize("counter", [WindowCounter, SketchWindowCounter])
+def test_decr_only_takes_back_an_incr_of_the_current_window(counter):
+    c = counter(60)
+    c.incr("k", START + 1)
+    c.incr("k", START + 2)
+    c.decr("k", START + 2)
+    assert c.estimate("k", START + 3) == 1
+    c.incr("k", START + 60)
+    c.decr("k", START + 1)  # its window has rolled: nothing to take back
+    assert c.estimate("k", START + 60) == 2
+
+
+def test_sketch_keeps_its_size_across_an_idle_gap():
+    c = SketchWindowCounter(60, width=64, depth=2)
+    size = c.memory_bytes()
+    c.incr("k", START + 1)
+    assert c.incr("k", START + 600) == 1  # several empty windows later
+    assert c.memory_bytes() == size
+
+
+def test_sketch_never_under_counts():
+    c = SketchWindowCounter(60, width=64, depth=2)  # tiny: collisions guaranteed
+    counts = {f"10.0.{n // 256}.{n % 256}": n % 7 + 1 for n in range(500)}
+    for key, n in counts.items():
+        for _ in range(n):
+            c.incr(key, START + 1)
+    assert all(c.estimate(key, START + 1) >= n for key, n in counts.items())
+
+
+# ---------------------------------------------------------
+# LIMITS: per IP every attempt, per username reserved before the hash
+# ---------------------------------------------------------
+@pytest.mark.parametrize("ip_counter", [WindowCounter(60), SketchWindowCounter(60)])
+def test_ip_limit(clock, ip_counter):
+    t = LoginThrottle(ip_limit=3, user_limit=100, ip_counter=ip_counter)
+    for n in range(3):
+        t.check(f"user{n}", "10.0.0.1")
+    assert _locked_out(t, "user9", "10.0.0.1") == "ip"
+    t.check("user9", "10.0.0.2")
+    clock[0] += 120
+    t.check("user9", "10.0.0.1")
+
+
+def test_in_flight_guesses_count_before_they_fail(clock):
+    # Nothing has failed yet (the hashes are still running), the 4th is still turned away
+    t = _throttle(user_limit=3)
+    reservations = [t.check("alice", f"10.0.0.{n}") for n in range(3)]
+    assert all(r == START for r in reservations)
+    with pytest.raises(LoginThrottled) as exc:
+        t.check("alice", "10.0.0.9")
+    assert exc.value.scope == "username" and exc.value.retry_after == 900
+    assert t.stats()["rejected_user"] == 1
+
+
+def test_refund_and_rejections_leave_the_count_alone(clock):
+    t = _throttle(user_limit=2)
+    for _ in range(5):
+        t.refund("alice", t.check("alice", "10.0.0.1"))  # e.g. the hasher was overloaded
+    t.check("alice", "10.0.0.1")
+    t.check("alice", "10.0.0.1")
+    for _ in range(5):
+        assert _locked_out(t, "alice", "10.0.0.1") == "username"
+    assert t.users.estimate("alice", clock[0]) == 2  # rejected attempts are not failures
+    t.refund("alice", None)  # a trusted device's check reserved nothing
+
+
+def test_success_clears_the_username_count(clock):
+    t = _throttle(user_limit=2)
+    t.check("alice", "10.0.0.1")
+    t.record_failure("alice")
+    t.check("alice", "10.0.0.1")
+    t.record_success("alice")
+    t.check("alice", "10.0.0.1")
+    t.check("alice", "10.0.0.1")
+    assert _locked_out(t, "alice", "10.0.0.1") == "username"
+
+
+# ---------------------------------------------------------
+# TRUSTED DEVICES: a known browser is not locked out by someone else's guesses
+# ---------------------------------------------------------
+def test_trusted_device_skips_the_username_limit(clock):
+    t = _throttle(user_limit=2)
+    t.record_success("alice", device="dev-alice")
+    for _ in range(2):
+        t.check("alice", "203.0.113.7", device="dev-attacker")
+        t.record_failure("alice", device="dev-attacker")
+    assert _locked_out(t, "alice", "203.0.113.7", device="dev-attacker") == "username"
+    assert _locked_out(t, "alice", "198.51.100.1") == "username"  # no device, any IP
+
+    assert t.check("alice", "198.51.100.1", device="dev-alice") is None
+    assert t.stats()["trusted_devices"] == 1
+
+
+def test_trust_is_per_username(clock):
+    t = _throttle(user_limit=1)
+    t.record_success("alice", device="dev")
+    t.check("bob", "10.0.0.1", device="dev")
+    assert _locked_out(t, "bob", "10.0.0.1", device="dev") == "username"
+
+
+def test_failed_login_revokes_the_devices_trust(clock):
+    t = _throttle(user_limit=1)
+    t.record_success("alice", device="dev")
+    t.check("alice", "10.0.0.1", device="dev")
+    t.record_failure("alice", device="dev")
+    t.check("alice", "10.0.0.1", device="dev")  # now counted: the first reservation
+    assert _locked_out(t, "alice", "10.0.0.1", device="dev") == "username"
+
+
+def test_trusted_device_is_still_ip_limited(clock):
+    t = _throttle(ip_limit=2)
+    t.record_success("alice", device="dev")
+    t.check("alice", "10.0.0.1", device="dev")
+    t.check("alice", "10.0.0.1", device="dev")
+    assert _locked_out(t, "alice", "10.0.0.1", device="dev") == "ip"
+
+
+def test_trusted_devices_are_bounded(clock):
+    t = _throttle(user_limit=1, max_trusted=2)
+    for device in ("d1", "d2", "d3"):
+        t.record_success("alice", device=device)
+    assert t.stats()["trusted_devices"] == 2
+    t.check("alice", "10.0.0.1", device="d1")  # forgotten: takes the one reservation
+    assert _locked_out(t, "alice", "10.0.0.1", device="d1") == "username"
+    assert t.check("alice", "10.0.0.1", device="d3") is None
@@ -0,0 +1,145 @@
+# test_webhooks.py (payment-systems/stripe/webhooks.py: queue, leases, retries, dead letters)
+import json
+import os
+import sys
+import time
+
+import pytest
+
+STRIPE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "payment-systems", "stripe")
+sys.path.insert(0, STRIPE_DIR)
+
+import webhooks  # noqa: E402
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    # Each test registers its own handlers, none leak into the next
+    monkeypatch.setattr(webhooks, "HANDLERS", {})
+    monkeypatch.setattr(webhooks, "ORDERED", set())
+    return webhooks.HANDLERS
+
+
+def _event(n, etype="payment_intent.succeeded"):
+    return json.dumps({"id": f"evt_{n}", "type": etype, "data": {"object": {"id": f"pi_{n}"}}})
+
+
+def _queue(tmp_path, **kwargs):
+    # Not started: tests drive _claim / _handle themselves, one step at a time
+    return webhooks.WebhookQueue(path=str(tmp_path / "webhooks.db"), **kwargs)
+
+
+# ---------------------------------------------------------
+# HANDLING: a handled row is gone, a failed one is retried with backoff
+# ---------------------------------------------------------
+def test_handled_event_leaves_the_queue(tmp_path, handlers):
+    seen = []
+    webhooks.on("payment_intent.succeeded")(lambda e: seen.append(e["id"]))
+    q = _queue(tmp_path)
+    q.enqueue(_event(1).encode(), event_id="evt_1", etype="payment_intent.succeeded")
+    q._handle(*q._claim())
+    assert seen == ["evt_1"]
+    assert q._claim() is None
+    stats = q.stats()
+    assert stats["depth"] == 0 and stats["handled"] == 1 and stats["retried"] == 0
+
+
+def test_failed_event_waits_out_its_backoff(tmp_path, handlers):
+    webhooks.on("*")(lambda e: 1 / 0)
+    q = _queue(tmp_path, backoff_base=30.0)
+    q.enqueue(_event(1).encode())
+    q._handle(*q._claim())
+    assert q._claim() is None  # back in the queue, but not available yet
+    stats = q.stats()
+    assert stats["depth"] == 1 and stats["inflight"] == 0 and stats["retried"] == 1
+
+
+def test_event_is_dead_lettered_after_max_attempts(tmp_path, handlers):
+    attempts = []
+
+    def flaky(event):
+        attempts.append(event["id"])
+        raise RuntimeError("downstream unavailable")
+
+    webhooks.on("payment_intent.succeeded")(flaky)
+    q = _queue(tmp_path, max_attempts=3, backoff_base=0.0)
+    q.enqueue(_event(1).encode(), event_id="evt_1", etype="payment_intent.succeeded")
+    while (row := q._claim()) is not None:
+        q._handle(*row)
+
+    assert attempts == ["evt_1"] * 3
+    (dead,) = q.dead_letters()
+    assert dead["event_id"] == "evt_1" and dead["attempts"] == 3
+    assert "RuntimeError: downstream unavailable" in dead["error"]
+    stats = q.stats()
+    assert stats["depth"] == 0 and stats["retried"] == 2 and stats["dead_lettered"] == 1
+    assert stats["dead_letters_total"] == 1
+
+
+def test_unparseable_payload_is_retried_like_a_failing_handler(tmp_path, handlers):
+    q = _queue(tmp_path, max_attempts=1)
+    q.enqueue(b"{not json", event_id="evt_bad")
+    q._handle(*q._claim())
+    assert [d["event_id"] for d in q.dead_letters()] == ["evt_bad"]
+
+
+# ---------------------------------------------------------
+# LEASES: a claim expires, and only the current holder completes the row
+# ---------------------------------------------------------
+def test_claimed_event_is_not_claimed_twice(tmp_path, handlers):
+    path = str(tmp_path / "webhooks.db")
+    a = webhooks.WebhookQueue(path=path)
+    b = webhooks.WebhookQueue(path=path)  # another process sharing the file
+    a.enqueue(_event(1).encode())
+    assert a._claim() is not None
+    assert a._claim() is None and b._claim() is None
+
+
+def test_expired_lease_is_reclaimed_and_the_old_holder_cannot_finish(tmp_path, handlers):
+    seen = []
+    webhooks.on("*")(lambda e: seen.append(e["id"]))
+    path = str(tmp_path / "webhooks.db")
+    dead_worker = webhooks.WebhookQueue(path=path, lease=0.05)
+    survivor = webhooks.WebhookQueue(path=path, lease=0.05)
+    dead_worker.enqueue(_event(1).encode())
+
+    stale_row = dead_worker._claim()
+    time.sleep(0.1)
+    row = survivor._claim()
+    assert row is not None and row[0] == stale_row[0] and row[-1] != stale_row[-1]
+    assert survivor.stats()["reclaimed_leases"] == 1
+
+    dead_worker._handle(*stale_row)  # woke up late: its claim no longer owns the row
+    assert survivor.stats()["depth"] == 1
+    survivor._handle(*row)
+    assert survivor.stats()["depth"] == 0
+    assert seen == ["evt_1", "evt_1"]  # at-least-once: handlers must be idempotent
+
+
+# ---------------------------------------------------------
+# WORKER POOL: everything enqueued is handled once the queue drains
+# ---------------------------------------------------------
+def test_workers_drain_the_queue(tmp_path, handlers):
+    seen = []
+    failed_once = set()
+
+    def handler(event):
+        if event["id"] not in failed_once and event["id"].endswith("7"):
+            failed_once.add(event["id"])
+            raise RuntimeError("transient")
+        seen.append(event["id"])
+
+    webhooks.on("*")(handler)
+    q = _queue(tmp_path, workers=4, backoff_base=0.001).start()
+    try:
+        for n in range(50):
+            q.enqueue(_event(n).encode(), event_id=f"evt_{n}")
+        deadline = time.monotonic() + 10
+        while q.stats()["depth"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        q.stop()
+    assert sorted(seen) == sorted(f"evt_{n}" for n in range(50))
+    stats = q.stats()
+    assert stats["handled"] == 50 and stats["retried"] == 5 and stats["worker_errors"] == 0
+